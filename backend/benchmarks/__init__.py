@@ -0,0 +1,6 @@
+"""
+Service benchmarks against in-memory stand-ins for Supabase and CoinGecko
+
+Run from backend/:
+    python -m benchmarks.run --sizes 100,1000,10000
+"""
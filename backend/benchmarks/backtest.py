@@ -0,0 +1,265 @@
+"""
+Walk-forward backtest of the next-day forecasters on a daily OHLC file
+
+Each fold fits every model on the bars before its cutoff (an expanding
+window) and forecasts each bar of the following `step` bars from the bars
+before it. (model, fold) pairs run on a process pool; a worker loads the
+series and the models once, so the derived arrays in SeriesWindows (returns,
+sliding windows, running ranges) and the unpickled LSTM are reused by all the
+folds it runs. The report puts accuracy (MAE, RMSE, MAPE, direction) next to
+what each model costs to fit and to run per forecast.
+
+The baselines forecast the next close, model.pkl the next open (its training
+target), and the open is within a fraction of a percent of the previous
+close. Every model is therefore scored against both, and the report ranks all
+of them against one target (--target), so they are compared on equal terms.
+
+Usage (from backend/):
+    python -m benchmarks.backtest
+    python -m benchmarks.backtest --models naive,ar5,lstm --step 30 --workers 4
+    python -m benchmarks.backtest --since 2022-12-01   # only bars after model.pkl's training data
+    python -m benchmarks.backtest --target open        # rank on the target model.pkl was trained for
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+from multiprocessing import get_context
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from benchmarks.harness import RESULTS_DIR, git_revision
+from services.forecasting import LSTM_TRAINED_UNTIL, SeriesWindows, forecasters
+from services.ohlc_store import COLUMNS, OHLCStore, to_date
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Columns of the forecast bar every model is scored against
+TARGETS = ('close', 'open')
+
+# Per-process state of a worker: the series and the models built so far
+_worker: Dict = {}
+
+
+def walk_forward_folds(size: int, initial: int, step: int, max_folds: Optional[int] = None) -> List[Tuple[int, int]]:
+    """(train_end, test_end) bar positions of each fold, oldest first"""
+    folds = [(start, min(start + step, size)) for start in range(initial, size, step)]
+    return folds[-max_folds:] if max_folds else folds
+
+
+def _init_worker(csv_path: str, model_path: Optional[str]) -> None:
+    store = OHLCStore()
+    store.load_csv('SERIES', csv_path)
+    _worker['series'] = SeriesWindows(*store.bars('SERIES'))
+    _worker['factories'] = forecasters(model_path)
+    _worker['models'] = {}
+
+
+def run_fold(task: Tuple[str, int, int, int]) -> Dict:
+    """Fit one model on bars[:train_end] and forecast bars train_end..test_end - 1"""
+    name, fold, train_end, test_end = task
+    series = _worker['series']
+    result = {'model': name, 'fold': fold, 'train_end': train_end, 'test_end': test_end}
+    try:
+        model = _worker['models'].get(name)
+        if model is None:
+            model = _worker['models'][name] = _worker['factories'][name]()
+        result['target'] = model.target
+        ends = np.arange(max(train_end, model.min_history), test_end)
+
+        started = time.perf_counter()
+        model.fit(series, train_end)
+        fitted = time.perf_counter()
+        predictions = model.predict(series, ends) if len(ends) else np.empty(0)
+        result.update({
+            'ends': ends,
+            'predictions': np.asarray(predictions, dtype=np.float64),
+            'fit_s': fitted - started,
+            'predict_s': time.perf_counter() - fitted
+        })
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def run_backtest(
+    csv_path: str,
+    models: List[str],
+    initial: int = 1000,
+    step: int = 90,
+    max_folds: Optional[int] = None,
+    workers: int = 1,
+    model_path: Optional[str] = None,
+    since: Optional[str] = None,
+    progress=print
+) -> Dict:
+    """
+    Walk-forward evaluation of the given models
+
+    Returns:
+        {'folds': [(train_end, test_end)], 'models': {name: metrics}} where a
+        model that failed to load or run has an 'error' instead of metrics
+    """
+    _init_worker(csv_path, model_path)
+    series = _worker['series']
+    folds = walk_forward_folds(len(series), initial, step, max_folds)
+    # Slow models first so they do not finish last on an otherwise idle pool
+    tasks = [
+        (name, fold, train_end, test_end)
+        for name in sorted(models, key=lambda name: name != 'lstm')
+        for fold, (train_end, test_end) in enumerate(folds)
+    ]
+    progress(f"{len(series)} bars, {len(folds)} folds x {len(models)} models on {workers} worker(s)")
+
+    results = []
+    if workers > 1:
+        # spawn: TensorFlow is not fork-safe, and workers only need the CSV and model paths
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn'),
+                                 initializer=_init_worker, initargs=(csv_path, model_path)) as pool:
+            futures = [pool.submit(run_fold, task) for task in tasks]
+            for done, future in enumerate(as_completed(futures), 1):
+                results.append(future.result())
+                if done % max(1, len(tasks) // 10) == 0:
+                    progress(f"  {done}/{len(tasks)} folds")
+    else:
+        results = [run_fold(task) for task in tasks]
+
+    cutoff = _day(since) if since else None
+    return {
+        'bars': len(series),
+        'start_date': to_date(series.days[0]).isoformat(),
+        'end_date': to_date(series.days[-1]).isoformat(),
+        'folds': folds,
+        'models': {
+            name: _metrics(series, [r for r in results if r['model'] == name], cutoff)
+            for name in models
+        }
+    }
+
+
+def _metrics(series: SeriesWindows, folds: List[Dict], cutoff: Optional[int]) -> Dict:
+    errors = [fold['error'] for fold in folds if 'error' in fold]
+    if errors:
+        return {'error': errors[0]}
+    ends = np.concatenate([fold['ends'] for fold in folds])
+    predictions = np.concatenate([fold['predictions'] for fold in folds])
+    fit_s = sum(fold['fit_s'] for fold in folds)
+    predict_s = sum(fold['predict_s'] for fold in folds)
+    if cutoff is not None:
+        keep = series.days[ends] > cutoff
+        ends, predictions = ends[keep], predictions[keep]
+    if not len(ends):
+        return {'forecasts': 0}
+
+    trained_until = _day(LSTM_TRAINED_UNTIL)
+    return {
+        'forecasts': int(len(ends)),
+        'target': folds[0]['target'],
+        # The same forecasts against the next close and the next open
+        'scores': {target: _scores(series, ends, predictions, target) for target in TARGETS},
+        # Share of forecasts on bars model.pkl was trained on (meaningful for the LSTM only)
+        'in_sample': float((series.days[ends] <= trained_until).mean()),
+        'fit_ms_per_fold': fit_s * 1000 / len(folds),
+        'predict_us_per_forecast': predict_s * 1e6 / sum(len(fold['ends']) for fold in folds)
+    }
+
+
+def _scores(series: SeriesWindows, ends: np.ndarray, predictions: np.ndarray, target: str) -> Dict:
+    """Accuracy of forecasts of bars `ends` against their `target` column"""
+    actual = series.bars[ends, COLUMNS.index(target)]
+    # Direction is measured from the last close known when forecasting
+    previous = series.closes[ends - 1]
+    error = predictions - actual
+    # ... and scored where both the forecast and the price moved (never for naive)
+    moved = (actual != previous) & (predictions != previous)
+    return {
+        'mae': float(np.abs(error).mean()),
+        'rmse': float(np.sqrt((error ** 2).mean())),
+        'mape': float((np.abs(error) / actual).mean()),
+        'direction': float((np.sign(predictions - previous) == np.sign(actual - previous))[moved].mean())
+        if moved.any() else None
+    }
+
+
+def format_report(report: Dict, target: str = 'close') -> str:
+    """
+    One row per model, most accurate against the next `target` first, with MAE
+    relative to the naive forecast; 'trained' is the target each model forecasts
+    """
+    models = report['models']
+    scores = {name: m['scores'][target] for name, m in models.items() if m.get('forecasts')}
+    naive_mae = scores.get('naive', {}).get('mae')
+    other = next(t for t in TARGETS if t != target)
+    header = (f"{'model':<8}{'trained':>8}{'forecasts':>10}{'MAE':>12}{'vs naive':>10}{'RMSE':>12}{'MAPE':>8}"
+              f"{'direction':>11}{f'MAE {other}':>12}{'fit ms':>10}{'us/forecast':>13}")
+    lines = [f"Ranked by accuracy against the next {target}", header, '-' * len(header)]
+    ranked = sorted((scores[name]['mae'] if name in scores else np.inf, name) for name in models)
+    for _, name in ranked:
+        m = models[name]
+        if name not in scores:
+            lines.append(f"{name:<8}  {m.get('error', 'no forecasts')}")
+            continue
+        score = scores[name]
+        relative = f"{score['mae'] / naive_mae:.3f}" if naive_mae else '-'
+        direction = f"{score['direction'] * 100:.1f}%" if score['direction'] is not None else '-'
+        lines.append(
+            f"{name:<8}{m['target']:>8}{m['forecasts']:>10}{score['mae']:>12.2f}{relative:>10}{score['rmse']:>12.2f}"
+            f"{score['mape'] * 100:>7.2f}%{direction:>11}{m['scores'][other]['mae']:>12.2f}"
+            f"{m['fit_ms_per_fold']:>10.2f}{m['predict_us_per_forecast']:>13.2f}"
+        )
+        if name == 'lstm' and m['in_sample'] > 0:
+            lines.append(f"{'':<8}  {m['in_sample'] * 100:.0f}% of these bars are in model.pkl's training data")
+    return '\n'.join(lines)
+
+
+def _day(value: str) -> int:
+    return (datetime.fromisoformat(value[:10]).date() - datetime(1970, 1, 1).date()).days
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Walk-forward backtest of the price forecasters")
+    parser.add_argument("--csv", default=os.path.join(BACKEND_DIR, 'coin.csv'), help="Daily OHLC file (yfinance layout)")
+    parser.add_argument("--model-path", default=None, help="Pickled LSTM (default: backend/model.pkl)")
+    parser.add_argument("--models", default=','.join(forecasters()), help="Comma-separated model names")
+    parser.add_argument("--initial", type=int, default=1000, help="Bars in the first training window")
+    parser.add_argument("--step", type=int, default=90, help="Bars forecast per fold")
+    parser.add_argument("--folds", type=int, default=None, help="Only the last N folds")
+    parser.add_argument("--since", default=None, help="Only score forecasts of bars after this date")
+    parser.add_argument("--target", choices=TARGETS, default='close',
+                        help="Column of the next bar the report ranks models against")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    models = [name for name in args.models.split(',') if name]
+    unknown = set(models) - set(forecasters())
+    if unknown:
+        parser.error(f"unknown models: {', '.join(sorted(unknown))}")
+
+    report = run_backtest(args.csv, models, initial=args.initial, step=args.step, max_folds=args.folds,
+                          workers=args.workers, model_path=args.model_path, since=args.since)
+    print()
+    print(f"{report['start_date']} .. {report['end_date']}, {len(report['folds'])} folds of {args.step} bars")
+    print(format_report(report, args.target))
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        revision = git_revision()
+        path = os.path.join(RESULTS_DIR, f"backtest-{revision}.json")
+        with open(path, 'w') as f:
+            json.dump({
+                'revision': revision,
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+                'args': vars(args),
+                **report
+            }, f, indent=2)
+        print(f"\nSaved {path}")
+
+
+if __name__ == "__main__":
+    main()
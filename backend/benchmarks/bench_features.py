@@ -0,0 +1,52 @@
+"""
+Indicator feature store: appending a bar and reading a window
+
+The store is built once from coin.csv in a temporary directory. 'append_bar'
+appends one daily bar to the OHLC store and syncs it, which advances the
+running indicator state by one row; 'read' is what a request for 90 days of
+every indicator costs once the columns are mapped.
+"""
+import os
+import shutil
+import tempfile
+
+from benchmarks.harness import Case
+from services.feature_store import FeatureStore
+from services.ohlc_store import OHLCStore
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class _Fixture:
+    def __init__(self):
+        self.directory = tempfile.mkdtemp(prefix='features-')
+        self.ohlc_store = OHLCStore.from_config('BTC=coin.csv', base_dir=BACKEND_DIR)
+        self.feature_store = FeatureStore(self.directory, self.ohlc_store)
+        self.feature_store.sync('BTC')
+
+    def close(self) -> None:
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def _fixture(env) -> _Fixture:
+    if 'features' not in env.extras:
+        env.extras['features'] = _Fixture()
+    return env.extras['features']
+
+
+def append_bar(env):
+    fixture = _fixture(env)
+    days, closes = fixture.ohlc_store.closes('BTC')
+    close = closes[-1] * 1.001
+    fixture.ohlc_store.append('BTC', int(days[-1]) + 1, close, close, close, close)
+    return fixture.feature_store.sync('BTC')
+
+
+def read(env):
+    return _fixture(env).feature_store.get('BTC', days=90)['rows']
+
+
+CASES = [
+    Case('features.append_bar', append_bar),
+    Case('features.read', read),
+]
@@ -0,0 +1,57 @@
+"""
+Micro-batched inference vs one forward pass per request
+
+CLIENTS threads each request a prediction over WINDOWS input windows at
+once. The stand-in model is a dense layer over the flattened 100 x 5 window
+plus a fixed CPU-bound per-call cost (CALL_OVERHEAD, roughly what Keras' predict()
+spends on setup per call on CPU), so the cases show what batching saves and
+what the batcher itself costs; TensorFlow is not needed. rows/s is windows
+predicted per second.
+"""
+import threading
+import time
+
+import numpy as np
+
+from benchmarks.harness import Case
+from services.inference_service import MicroBatcher
+
+CLIENTS = 32
+WINDOWS = 100
+CALL_OVERHEAD = 0.002
+_weights = np.random.default_rng(0).standard_normal((100 * 5, 64))
+_inputs = [np.random.default_rng(client).random((WINDOWS, 100, 5)) for client in range(CLIENTS)]
+
+
+def _model(windows: np.ndarray) -> np.ndarray:
+    # CPU-bound like the real per-call setup (a sleep would overlap across threads)
+    deadline = time.perf_counter() + CALL_OVERHEAD
+    while time.perf_counter() < deadline:
+        pass
+    return np.tanh(windows.reshape(len(windows), -1) @ _weights)[:, 0]
+
+
+def _concurrently(request) -> int:
+    threads = [threading.Thread(target=request, args=(windows,)) for windows in _inputs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return CLIENTS * WINDOWS
+
+
+def direct(env):
+    return _concurrently(_model)
+
+
+def batched(env):
+    if 'inference_batcher' not in env.extras:
+        env.extras['inference_batcher'] = MicroBatcher(_model, name='bench', max_batch=1024, max_delay=0.005)
+    batcher = env.extras['inference_batcher']
+    return _concurrently(lambda windows: batcher.submit(windows).result())
+
+
+CASES = [
+    Case('inference.direct', direct),
+    Case('inference.batched', batched),
+]
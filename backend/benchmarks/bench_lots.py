@@ -0,0 +1,60 @@
+"""
+Tax-lot engine: full builds vs incremental edits
+
+Edits change one transaction's coins and apply it to an already built engine,
+which reprocesses only that symbol's fills from the transaction's timestamp on:
+'edit_recent' edits one of the newest transactions (the common case, e.g. a
+fix to yesterday's trade), 'edit_oldest' the very first one (the worst case).
+Compare either with 'build', which is what a rebuild after every edit costs.
+"""
+from benchmarks.harness import BenchEnv, Case
+from services.lot_engine import METHODS, LotEngine
+
+USER = BenchEnv.USER_ID
+
+
+def _build(method):
+    def run(env):
+        LotEngine(method).load(env.rows)
+        return env.size
+    return run
+
+
+def _engine(env, method) -> LotEngine:
+    key = f"lot_engine:{method}"
+    if key not in env.extras:
+        env.extras[key] = LotEngine(method).load(env.rows)
+    return env.extras[key]
+
+
+def _edit(method, position):
+    def run(env):
+        engine = _engine(env, method)
+        env.calls += 1
+        row = env.rows[position(env.size)]
+        # Alternate between two amounts so every run is a real change
+        return engine.apply({**row, 'coins': float(row['coins']) * (1.01 if env.calls % 2 else 1)})
+    return run
+
+
+def service_pnl_cold(env):
+    # Streams the transactions, builds the engine and prices it
+    env.transaction_service.lot_books.invalidate(USER)
+    env.transaction_service.get_pnl(USER, 'fifo')
+    return env.size
+
+
+def service_pnl_warm(env):
+    env.transaction_service.get_pnl(USER, 'fifo')
+    return env.size
+
+
+CASES = (
+    [Case(f"lots.build.{method}", _build(method)) for method in METHODS]
+    + [Case(f"lots.edit_recent.{method}", _edit(method, lambda size: max(0, size - 50))) for method in METHODS]
+    + [Case(f"lots.edit_oldest.{method}", _edit(method, lambda size: 0)) for method in METHODS]
+    + [
+        Case('lots.service_pnl_cold', service_pnl_cold),
+        Case('lots.service_pnl_warm', service_pnl_warm),
+    ]
+)
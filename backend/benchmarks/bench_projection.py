@@ -0,0 +1,66 @@
+"""
+Monte Carlo projection throughput
+
+'projection.simulate.<method>.workers_<n>' simulates PATHS one-year paths of
+every benchmark coin on n worker processes and returns PATHS / n, so rows/s
+reads as paths per second per core; compare workers_1 with workers_<cpus>
+for the parallel scaling. 'projection.service' is a full request for the
+benchmark user (holdings, history, simulation and bands) without the cache.
+"""
+import os
+
+import numpy as np
+
+from benchmarks.bench_risk import risk_service
+from benchmarks.harness import BenchEnv, Case
+from services.projection_service import ProjectionService
+
+USER = BenchEnv.USER_ID
+PATHS = 10000
+HORIZON = 365
+CHECKPOINTS = np.arange(1, HORIZON + 1, 7)
+CPUS = os.cpu_count() or 1
+
+
+def _projection_service(env, workers: int) -> ProjectionService:
+    key = f"projection_service:{workers}"
+    if key not in env.extras:
+        env.extras[key] = ProjectionService(risk_service(env), workers=workers, max_paths=PATHS)
+    return env.extras[key]
+
+
+def _inputs(env):
+    """Historical log returns and current values of the benchmark user's holdings"""
+    if 'projection_inputs' not in env.extras:
+        holdings = risk_service(env).holdings_history(USER)
+        env.extras['projection_inputs'] = (
+            np.log1p(holdings['returns'].T),
+            np.array([holdings['values'][symbol] for symbol in holdings['symbols']])
+        )
+    return env.extras['projection_inputs']
+
+
+def _simulate(method: str, workers: int):
+    def run(env):
+        log_returns, values = _inputs(env)
+        env.calls += 1
+        _projection_service(env, workers).simulate(
+            log_returns, values, PATHS, HORIZON, CHECKPOINTS, method=method, seed=env.calls
+        )
+        return PATHS // workers
+    return run
+
+
+def service(env):
+    result = _projection_service(env, CPUS).get_projection(USER, paths=PATHS, horizon=HORIZON)
+    return len(result.get('bands', []))
+
+
+CASES = (
+    [
+        Case(f"projection.simulate.{method}.workers_{workers}", _simulate(method, workers))
+        for method in ('bootstrap', 'gbm')
+        for workers in sorted({1, CPUS})
+    ]
+    + [Case('projection.service', service)]
+)
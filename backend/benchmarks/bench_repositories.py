@@ -0,0 +1,98 @@
+"""
+Storage backend comparison: PostgREST vs direct SQL
+
+The same TransactionService operations run against each repository:
+'postgrest' is the Supabase repository over FakeSupabase with JSON
+round-tripping per request (the wire encoding PostgREST adds),
+'postgrest_rows' is the same without the get_user_holdings() function (holdings
+summed from fetched rows, as before it existed), 'sqlite' is the
+SQL backend on an in-memory database, and 'postgres' runs when
+BENCH_POSTGRES_DSN points at a database with supabase_schema.sql applied (rows
+go to a scratch bench_transactions table that is emptied first).
+"""
+import os
+
+from benchmarks.harness import BenchEnv, Case
+from devtools.fake_supabase import FakeSupabase
+from services.repositories import (
+    PostgresTransactionRepository, SQLiteTransactionRepository, SupabaseTransactionRepository
+)
+from services.transaction_service import TransactionService
+
+USER = BenchEnv.USER_ID
+SEED_CHUNK = 5000
+
+BACKENDS = ['postgrest', 'postgrest_rows', 'sqlite'] + (['postgres'] if os.getenv('BENCH_POSTGRES_DSN') else [])
+
+
+def _repository(env, backend):
+    if backend.startswith('postgrest'):
+        db = FakeSupabase(serialize=True)
+        db.seed('transactions', env.rows)
+        if backend == 'postgrest_rows':
+            db.rpcs.pop('get_user_holdings')
+        return SupabaseTransactionRepository(db)
+    if backend == 'sqlite':
+        repository = SQLiteTransactionRepository(':memory:')
+    else:
+        repository = PostgresTransactionRepository(os.getenv('BENCH_POSTGRES_DSN'), table='bench_transactions')
+        repository._query("CREATE TABLE IF NOT EXISTS bench_transactions (LIKE transactions INCLUDING ALL)")
+        repository._query("DELETE FROM bench_transactions")
+    for start in range(0, len(env.rows), SEED_CHUNK):
+        repository.insert_many(env.rows[start:start + SEED_CHUNK])
+    return repository
+
+
+def _service(env, backend) -> TransactionService:
+    key = f"repository:{backend}"
+    if key not in env.extras:
+        env.extras[key] = _repository(env, backend)
+    return TransactionService(None, repository=env.extras[key], price_url=env.transaction_service.price_url)
+
+
+def _page(backend):
+    def run(env):
+        body, _ = _service(env, backend).get_transactions_page(USER, limit=100)
+        return len(body['transactions'])
+    return run
+
+
+def _scan(backend):
+    def run(env):
+        return sum(1 for _ in _service(env, backend).iter_transactions(USER))
+    return run
+
+
+def _holdings(backend):
+    # GROUP BY in the database vs. streaming every row
+    def run(env):
+        _service(env, backend).get_holdings(USER)
+        return env.size
+    return run
+
+
+def _symbol_holdings(backend):
+    # The sell validation query
+    def run(env):
+        _service(env, backend)._get_holdings('BTC', USER)
+        return env.size
+    return run
+
+
+def _external_ids(backend):
+    def run(env):
+        return len(_service(env, backend).get_external_ids(USER, 'coinbase'))
+    return run
+
+
+CASES = [
+    Case(f"repository.{backend}.{name}", factory(backend))
+    for backend in BACKENDS
+    for name, factory in (
+        ('page', _page),
+        ('scan', _scan),
+        ('holdings', _holdings),
+        ('symbol_holdings', _symbol_holdings),
+        ('external_ids', _external_ids),
+    )
+]
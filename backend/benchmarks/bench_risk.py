@@ -0,0 +1,51 @@
+"""
+Risk analytics over synthetic daily closes for every benchmark coin
+
+'risk.compute' is a full computation for the benchmark user (no result
+cache); 'risk.append_bar' appends one daily bar to every symbol and measures
+bringing the per-symbol statistics up to date, which touches only the new bars.
+"""
+import numpy as np
+
+from benchmarks.harness import BenchEnv, Case
+from benchmarks.portfolio import CRYPTOS
+from services.ohlc_store import OHLCStore
+from services.risk_service import RiskService
+
+USER = BenchEnv.USER_ID
+HISTORY_DAYS = 3000
+FIRST_DAY = 16000  # days since 1970 (2013-10-22)
+
+
+def risk_service(env) -> RiskService:
+    if 'risk_service' not in env.extras:
+        rng = np.random.default_rng(env.seed)
+        store = OHLCStore()
+        for symbol, _, (price, _) in CRYPTOS:
+            closes = price * np.exp(np.cumsum(rng.normal(0, 0.04, HISTORY_DAYS)) - 0.04 * np.arange(HISTORY_DAYS) / HISTORY_DAYS)
+            bars = np.column_stack([closes, closes * 1.01, closes * 0.99, closes, np.zeros(HISTORY_DAYS)])
+            store.extend(symbol, list(range(FIRST_DAY, FIRST_DAY + HISTORY_DAYS)), bars)
+        env.extras['risk_service'] = RiskService(env.transaction_service, store)
+    return env.extras['risk_service']
+
+
+def compute(env):
+    result = risk_service(env).get_risk(USER)
+    return len(result.get('coins', {}))
+
+
+def append_bar(env):
+    service = risk_service(env)
+    store = service.ohlc_store
+    for symbol in store.symbols():
+        days, closes = store.closes(symbol)
+        close = closes[-1] * 1.001
+        store.append(symbol, int(days[-1]) + 1, close, close, close, close)
+        service.symbol_stats(symbol)
+    return len(store.symbols())
+
+
+CASES = [
+    Case('risk.compute', compute),
+    Case('risk.append_bar', append_bar),
+]
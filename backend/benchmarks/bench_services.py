@@ -0,0 +1,157 @@
+"""
+Benchmarks for the public TransactionService and AnalyticsService methods
+
+Analytics run without the result cache so every call does the full
+computation. Write cases run last since they change the seeded data.
+"""
+from datetime import datetime, timedelta
+
+from benchmarks.harness import BenchEnv, Case
+from benchmarks.portfolio import new_transactions
+from services.time_index import TimeIndex
+
+USER = BenchEnv.USER_ID
+BULK_SIZE = 1000
+
+
+def get_transactions(env):
+    transactions, _ = env.transaction_service.get_transactions(USER)
+    return len(transactions)
+
+
+def get_transactions_all(env):
+    transactions, _ = env.transaction_service.get_transactions(USER, limit=None)
+    return len(transactions)
+
+
+def get_transactions_page(env):
+    # First page plus a keyset continuation
+    service = env.transaction_service
+    first, _ = service.get_transactions_page(USER, limit=100)
+    second, _ = service.get_transactions_page(USER, limit=100, cursor=first['next_cursor'])
+    return len(first['transactions']) + len(second['transactions'])
+
+
+def iter_transactions(env):
+    return sum(1 for _ in env.transaction_service.iter_transactions(USER))
+
+
+def get_external_ids(env):
+    return len(env.transaction_service.get_external_ids(USER, 'coinbase'))
+
+
+def get_coin_wise_details(env):
+    env.transaction_service.get_coin_wise_details(USER)
+    return env.size
+
+
+def summarize_portfolio(env):
+    # In-memory rows: aggregation and pricing only, no queries
+    env.transaction_service.summarize_portfolio(env.rows)
+    return env.size
+
+
+def performance_all(env):
+    env.analytics_service.get_performance_by_period(USER, 'all')
+    return env.size
+
+
+def performance_30d(env):
+    env.analytics_service.get_performance_by_period(USER, '30d')
+    return env.size
+
+
+def performance_custom(env):
+    end = datetime.now() - timedelta(days=90)
+    env.analytics_service.get_performance_by_period(USER, start=end - timedelta(days=180), end=end)
+    return env.size
+
+
+def rolling_30d(env):
+    env.analytics_service.get_rolling_activity(USER, days=30, window=7)
+    return env.size
+
+
+def time_index_ranges(env):
+    # 1000 arbitrary ranges against an already built index (as served from the result cache)
+    if 'time_index' not in env.extras:
+        env.extras['time_index'] = TimeIndex(env.rows)
+    index = env.extras['time_index']
+    end = datetime.now()
+    for day in range(1000):
+        index.activity(end - timedelta(days=day + 30), end - timedelta(days=day))
+    return 1000
+
+
+def returns(env):
+    env.analytics_service.get_returns(USER)
+    return env.size
+
+
+def performers(env):
+    env.analytics_service.get_best_worst_performers(USER)
+    return env.size
+
+
+def history_30d(env):
+    env.analytics_service.get_portfolio_history(USER, days=30)
+    return env.size
+
+
+def dashboard(env):
+    env.analytics_service.get_dashboard(USER, days=30)
+    return env.size
+
+
+def add_transaction(env):
+    payload = new_transactions(1, seed=env.calls, user_id=USER)[0]
+    env.calls += 1
+    env.transaction_service.add_transaction({**payload, 'type': 'buy'})
+
+
+def add_transaction_sell(env):
+    # Sells validate holdings against the stored transactions first
+    payload = new_transactions(1, seed=env.calls, user_id=USER)[0]
+    env.calls += 1
+    env.transaction_service.add_transaction({**payload, 'type': 'sell', 'coins': 0.000001})
+
+
+def add_transactions_bulk(env):
+    # A fresh user per call so repeated runs don't grow the benchmark user
+    env.calls += 1
+    payloads = new_transactions(BULK_SIZE, seed=env.calls, user_id=f"bulk-{env.calls}")
+    result = env.transaction_service.add_transactions_bulk(payloads)
+    return result['imported']
+
+
+def update_transaction(env):
+    env.transaction_service.update_transaction(env.next_id(), {'name': 'Renamed'}, user_id=USER)
+
+
+def delete_transaction(env):
+    env.transaction_service.delete_transaction(env.next_id(), user_id=USER)
+
+
+CASES = [
+    Case('transactions.get_transactions', get_transactions),
+    Case('transactions.get_transactions_all', get_transactions_all),
+    Case('transactions.get_transactions_page', get_transactions_page),
+    Case('transactions.iter_transactions', iter_transactions),
+    Case('transactions.get_external_ids', get_external_ids),
+    Case('transactions.get_coin_wise_details', get_coin_wise_details),
+    Case('transactions.summarize_portfolio', summarize_portfolio),
+    Case('analytics.performance_all', performance_all),
+    Case('analytics.performance_30d', performance_30d),
+    Case('analytics.performers', performers),
+    Case('analytics.performance_custom', performance_custom),
+    Case('analytics.returns', returns),
+    Case('analytics.history_30d', history_30d),
+    Case('analytics.rolling_30d', rolling_30d),
+    Case('analytics.dashboard', dashboard),
+    Case('analytics.time_index_ranges', time_index_ranges),
+    Case('transactions.add_transaction', add_transaction),
+    Case('transactions.add_transaction_sell', add_transaction_sell),
+    Case('transactions.add_transactions_bulk', add_transactions_bulk),
+    Case('transactions.update_transaction', update_transaction),
+    Case('transactions.delete_transaction', delete_transaction),
+]
@@ -0,0 +1,55 @@
+"""
+Intraday tick store: recording a price fetch and reading a day of ticks
+
+The store holds a full ring (CAPACITY ticks, one every 30 s, so the oldest
+slots are being overwritten) for each of SYMBOLS in a temporary directory.
+'record' appends one tick per symbol, as after every CoinGecko fetch;
+'read_day' is what a 24 hour intraday chart reads before downsampling.
+"""
+import shutil
+import tempfile
+
+from benchmarks.harness import Case
+from services.tick_store import TickStore
+
+SYMBOLS = ('BTC', 'ETH', 'SOL', 'ADA', 'XRP')
+CAPACITY = 32768
+INTERVAL = 30
+
+
+class _Fixture:
+    def __init__(self):
+        self.directory = tempfile.mkdtemp(prefix='ticks-')
+        self.tick_store = TickStore(self.directory, capacity=CAPACITY, min_interval=INTERVAL)
+        self.now = 1.7e9
+        for _ in range(CAPACITY + CAPACITY // 3):
+            self.record()
+
+    def record(self) -> int:
+        self.now += INTERVAL
+        return self.tick_store.record({symbol: 100.0 + self.now % 97 for symbol in SYMBOLS}, timestamp=self.now)
+
+    def close(self) -> None:
+        self.tick_store.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def _fixture(env) -> _Fixture:
+    if 'ticks' not in env.extras:
+        env.extras['ticks'] = _Fixture()
+    return env.extras['ticks']
+
+
+def record(env):
+    return _fixture(env).record()
+
+
+def read_day(env):
+    fixture = _fixture(env)
+    return sum(len(fixture.tick_store.ticks(symbol, fixture.now - 86400, fixture.now)[0]) for symbol in SYMBOLS)
+
+
+CASES = [
+    Case('ticks.record', record),
+    Case('ticks.read_day', read_day),
+]
@@ -0,0 +1,187 @@
+"""
+Benchmark harness: environments, timing and result history
+
+A Case times one operation against a BenchEnv (a seeded FakeSupabase, a fake
+CoinGecko server and the real services on top). Results are saved per commit
+under benchmarks/results/ so runs can be compared across commits.
+"""
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+from devtools.fake_prices import FakeCoinGeckoServer
+from devtools.fake_supabase import FakeSupabase
+from services.rate_limiter import configure_rate_limiter
+from services.transaction_service import TransactionService
+from services.analytics_service import AnalyticsService
+from benchmarks.portfolio import generate_portfolio
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+class Case:
+    """
+    One benchmarked operation
+
+    fn(env) runs the operation once and may return the number of rows it
+    processed, which is reported as rows/s. Sizes above max_size are skipped
+    for operations too slow to run there.
+    """
+
+    def __init__(self, name: str, fn: Callable[['BenchEnv'], Optional[int]], max_size: Optional[int] = None):
+        self.name = name
+        self.fn = fn
+        self.max_size = max_size
+
+
+class BenchEnv:
+    """A user with `size` transactions behind the real services"""
+
+    USER_ID = 'bench'
+
+    def __init__(self, size: int, price_server: FakeCoinGeckoServer, seed: int = 0):
+        self.size = size
+        self.seed = seed
+        self.db = FakeSupabase()
+        self.rows = generate_portfolio(size, user_id=self.USER_ID, seed=seed)
+        self.db.seed('transactions', self.rows)
+        self.transaction_service = TransactionService(self.db, price_url=price_server.price_url)
+        self.analytics_service = AnalyticsService(self.transaction_service)
+        self.calls = 0
+        # Lazily built per-size fixtures shared between cases (e.g. other backends)
+        self.extras: Dict = {}
+
+    def close(self) -> None:
+        for extra in self.extras.values():
+            close = getattr(extra, 'close', None)
+            if close:
+                close()
+
+    def next_id(self) -> str:
+        """Cycle through existing transaction ids for update/delete cases"""
+        self.calls += 1
+        return self.rows[(self.calls * 7919) % len(self.rows)]['id']
+
+
+def measure(fn: Callable[[], Optional[int]], repeat: int = 5, warmup: int = 1) -> Dict:
+    """Run fn warmup + repeat times; latency in ms and throughput per second"""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    rows = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = fn()
+        timings.append(time.perf_counter() - started)
+
+    timings.sort()
+    median = statistics.median(timings)
+    result = {
+        'median_ms': median * 1000,
+        'p95_ms': timings[min(len(timings) - 1, int(round(0.95 * (len(timings) - 1))))] * 1000,
+        'min_ms': timings[0] * 1000,
+        'ops_per_s': 1 / median if median else None,
+    }
+    if rows:
+        result['rows_per_s'] = rows / median if median else None
+    return result
+
+
+def run_cases(cases: List[Case], sizes: List[int], repeat: int = 5, warmup: int = 1,
+              price_latency: float = 0.0, progress: Callable[[str], None] = print) -> Dict:
+    """Run every case at every size; returns {case: {size: measurement}}"""
+    # Generous quota so benchmarks measure the services, not the limiter
+    configure_rate_limiter('coingecko', 1000, 1000)
+    results: Dict[str, Dict[str, Dict]] = {case.name: {} for case in cases}
+    with FakeCoinGeckoServer(latency=price_latency) as price_server:
+        for size in sizes:
+            started = time.perf_counter()
+            env = BenchEnv(size, price_server)
+            progress(f"size {size}: seeded in {time.perf_counter() - started:.1f}s")
+            for case in cases:
+                if case.max_size is not None and size > case.max_size:
+                    continue
+                measurement = measure(lambda: case.fn(env), repeat=repeat, warmup=warmup)
+                results[case.name][str(size)] = measurement
+                progress(f"  {case.name:<40} {measurement['median_ms']:>10.2f} ms")
+            env.close()
+    return results
+
+
+def git_revision() -> str:
+    """Short commit hash, suffixed with -dirty when the tree has local changes"""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True
+        ).stdout.strip()
+        return f"{commit}-dirty" if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def save_results(results: Dict, revision: str, meta: Dict) -> str:
+    """Write results/<revision>.json and append a summary line to results/history.jsonl"""
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    document = {
+        'revision': revision,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        **meta,
+        'results': results,
+    }
+    path = os.path.join(RESULTS_DIR, f"{revision}.json")
+    with open(path, 'w') as f:
+        json.dump(document, f, indent=2)
+    with open(os.path.join(RESULTS_DIR, 'history.jsonl'), 'a') as f:
+        medians = {
+            case: {size: round(m['median_ms'], 3) for size, m in sizes.items()}
+            for case, sizes in results.items()
+        }
+        f.write(json.dumps({'revision': revision, 'timestamp': document['timestamp'], 'median_ms': medians}) + '\n')
+    return path
+
+
+def load_results(revision: str) -> Optional[Dict]:
+    """Load saved results for a revision (a commit hash prefix is enough)"""
+    if not os.path.isdir(RESULTS_DIR):
+        return None
+    # Accept a short or full hash; prefer a clean run over a -dirty one
+    matches = sorted(
+        (name for name in os.listdir(RESULTS_DIR)
+         if name.endswith('.json') and (name[:-5].startswith(revision) or revision.startswith(name[:-5]))),
+        key=lambda name: ('dirty' in name, name)
+    )
+    if not matches:
+        return None
+    with open(os.path.join(RESULTS_DIR, matches[0])) as f:
+        return json.load(f)['results']
+
+
+def format_table(results: Dict, baseline: Optional[Dict] = None) -> str:
+    """Median latency per case and size, with the change against a baseline"""
+    sizes = sorted({int(size) for sizes in results.values() for size in sizes})
+    header = f"{'case':<40}" + ''.join(f"{size:>22}" for size in sizes)
+    lines = [header, '-' * len(header)]
+    for case, by_size in results.items():
+        cells = []
+        for size in sizes:
+            measurement = by_size.get(str(size))
+            if measurement is None:
+                cells.append(f"{'-':>22}")
+                continue
+            cell = f"{measurement['median_ms']:.2f}ms"
+            before = (baseline or {}).get(case, {}).get(str(size))
+            if before and before['median_ms']:
+                change = (measurement['median_ms'] / before['median_ms'] - 1) * 100
+                cell += f" ({change:+.0f}%)"
+            cells.append(f"{cell:>22}")
+        lines.append(f"{case:<40}" + ''.join(cells))
+    return '\n'.join(lines)
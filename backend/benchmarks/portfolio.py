@@ -0,0 +1,79 @@
+"""
+Synthetic portfolios for benchmarks
+
+Rows have the shape CoinbaseService._get_mock_transactions() produces (the
+same coins and price ranges, normalized by normalize_transaction()) plus the
+columns the database fills in, so they can be seeded straight into
+FakeSupabase. Sells never exceed the running balance, as the service enforces.
+"""
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+# Same coins and price ranges as CoinbaseService._get_mock_transactions()
+CRYPTOS = [
+    ("BTC", "Bitcoin", (30000, 70000)),
+    ("ETH", "Ethereum", (2000, 4000)),
+    ("SOL", "Solana", (50, 200)),
+    ("ADA", "Cardano", (0.3, 1.5)),
+    ("MATIC", "Polygon", (0.5, 2.0)),
+    ("DOGE", "Dogecoin", (0.05, 0.15)),
+    ("LINK", "Chainlink", (10, 30)),
+    ("AVAX", "Avalanche", (20, 60)),
+]
+
+
+def generate_portfolio(
+    count: int,
+    user_id: str = "bench",
+    seed: int = 0,
+    days: int = 730,
+    end: Optional[datetime] = None,
+    sell_ratio: float = 0.3
+) -> List[Dict]:
+    """Generate `count` transaction rows for one user, oldest first"""
+    rng = random.Random(seed)
+    end = end or datetime.now(timezone.utc)
+    start = end - timedelta(days=days)
+    seconds = days * 86400
+    offsets = sorted(rng.uniform(0, seconds) for _ in range(count))
+    balances = {symbol: 0.0 for symbol, _, _ in CRYPTOS}
+    id_namespace = uuid.UUID(int=seed)
+
+    rows = []
+    for i, offset in enumerate(offsets):
+        symbol, name, (price_min, price_max) = rng.choice(CRYPTOS)
+        price = round(rng.uniform(price_min, price_max), 2)
+        coins = round(rng.uniform(0.001, 1.0), 6)
+        side = "sell" if rng.random() < sell_ratio and balances[symbol] >= coins else "buy"
+        balances[symbol] += coins if side == "buy" else -coins
+        timestamp = (start + timedelta(seconds=offset)).isoformat(timespec="microseconds")
+
+        rows.append({
+            "id": str(uuid.uuid5(id_namespace, f"{user_id}-{i}")),
+            "name": name,
+            "symbol": symbol,
+            "type": side,
+            "coins": coins,
+            "purchased_price": price,
+            "value_usd": round(price * coins, 2),
+            "date": timestamp,
+            "status": "active",
+            "created_by": "system",
+            "user_id": user_id,
+            "source": "coinbase",
+            "external_id": f"mock_trade_{i}_{rng.randint(1000, 9999)}",
+            "created_at": timestamp,
+            "updated_at": timestamp,
+        })
+    return rows
+
+
+def new_transactions(count: int, seed: int = 0, user_id: str = "bench") -> List[Dict]:
+    """API-style payloads (as POSTed to /api/transactions) for write benchmarks"""
+    return [
+        {key: row[key] for key in ("name", "symbol", "type", "coins", "purchased_price", "value_usd", "date", "source")}
+        | {"userId": user_id, "external_id": f"{row['external_id']}-{seed}"}
+        for row in generate_portfolio(count, user_id=user_id, seed=seed, days=30)
+    ]
@@ -0,0 +1,70 @@
+"""
+Run the benchmark suite and record results for the current commit
+
+Usage (from backend/):
+    python -m benchmarks.run --sizes 100,1000,10000 --repeat 5
+    python -m benchmarks.run --cases analytics --compare 1a2b3c4
+    python -m benchmarks.run --sizes 1000000 --repeat 3 --no-save
+"""
+import argparse
+import importlib
+import logging
+
+from benchmarks.harness import format_table, git_revision, load_results, run_cases, save_results
+
+# Modules exposing a CASES list
+CASE_MODULES = [
+    'benchmarks.bench_services',
+    'benchmarks.bench_repositories',
+    'benchmarks.bench_lots',
+    'benchmarks.bench_risk',
+    'benchmarks.bench_projection',
+    'benchmarks.bench_inference',
+    'benchmarks.bench_features',
+    'benchmarks.bench_ticks',
+]
+
+
+def load_cases(pattern: str = ''):
+    cases = []
+    for module_name in CASE_MODULES:
+        cases.extend(importlib.import_module(module_name).CASES)
+    return [case for case in cases if pattern in case.name]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the backend services")
+    parser.add_argument("--sizes", default="100,1000,10000", help="Comma-separated transaction counts")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--cases", default="", help="Only run cases whose name contains this")
+    parser.add_argument("--price-latency-ms", type=float, default=0, help="Added latency of the fake price API")
+    parser.add_argument("--compare", help="Commit to compare against (from benchmarks/results)")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    # Service logging is noisy per call and would dominate the timings
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger('services').setLevel(logging.ERROR)
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    cases = load_cases(args.cases)
+    results = run_cases(cases, sizes, repeat=args.repeat, warmup=args.warmup,
+                        price_latency=args.price_latency_ms / 1000)
+
+    revision = git_revision()
+    baseline = None
+    if args.compare:
+        baseline = load_results(args.compare)
+        if baseline is None:
+            print(f"No saved results for {args.compare}")
+
+    print()
+    print(format_table(results, baseline))
+    if not args.no_save:
+        path = save_results(results, revision, {'sizes': sizes, 'repeat': args.repeat})
+        print(f"\nSaved {path}")
+
+
+if __name__ == "__main__":
+    main()
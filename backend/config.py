@@ -15,8 +15,16 @@ class Config:
     DB_NAME = os.getenv('DB_NAME', 'postgres')
     DB_USER = os.getenv('DB_USER', 'docker')
     DB_PASSWORD = os.getenv('DB_PASSWORD', 'docker1234')
+    DB_PORT = int(os.getenv('DB_PORT', 5432))
     DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', 1))
-    DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', 600))
+    # Upper bound on pooled connections per process; keep well under the
+    # server's max_connections (callers queue for DB_POOL_TIMEOUT seconds)
+    DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', 10))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))
+    # Transaction storage: 'supabase' (PostgREST), 'postgres' (direct, pooled,
+    # uses the DB_* settings) or 'sqlite' (local file at SQLITE_PATH)
+    DB_BACKEND = os.getenv('DB_BACKEND', 'supabase').lower()
+    SQLITE_PATH = os.getenv('SQLITE_PATH', 'transactions.db')
     
     # Supabase Configuration
     SUPABASE_URL = os.getenv('SUPABASE_URL', '')
@@ -24,14 +32,87 @@ class Config:
     SUPABASE_SERVICE_ROLE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY', '')
     
     # API Configuration
-    COINGECKO_API_URL = "https://api.coingecko.com/api/v3/simple/price?vs_currencies=usd"
+    COINGECKO_API_URL = os.getenv('COINGECKO_API_URL', "https://api.coingecko.com/api/v3/simple/price?vs_currencies=usd")
     YFINANCE_SYMBOL = "BTC-USD"
     
+    # Upstream rate limits (shared token buckets, see services/rate_limiter.py).
+    # CoinGecko's public API allows ~10-30 calls/minute; Coinbase Advanced Trade
+    # allows 30 requests/second per key, kept lower here to leave headroom.
+    COINGECKO_RATE_PER_MINUTE = float(os.getenv('COINGECKO_RATE_PER_MINUTE', 10))
+    COINGECKO_BURST = int(os.getenv('COINGECKO_BURST', 3))
+    COINBASE_RATE_PER_SECOND = float(os.getenv('COINBASE_RATE_PER_SECOND', 10))
+    COINBASE_BURST = int(os.getenv('COINBASE_BURST', 10))
+    
     # Broker API Keys (set these in environment variables)
     ROBINHOOD_CLIENT_ID = os.getenv('ROBINHOOD_CLIENT_ID', '')
     ROBINHOOD_CLIENT_SECRET = os.getenv('ROBINHOOD_CLIENT_SECRET', '')
     COINBASE_API_KEY = os.getenv('COINBASE_API_KEY', '')
     COINBASE_API_SECRET = os.getenv('COINBASE_API_SECRET', '')
+    # Override to point broker imports at a local fake server (devtools/fake_coinbase.py)
+    COINBASE_API_URL = os.getenv('COINBASE_API_URL', 'https://api.coinbase.com/api/v3/brokerage')
+    
+    # Background import jobs
+    IMPORT_WORKERS = int(os.getenv('IMPORT_WORKERS', 4))
+    IMPORT_MAX_JOBS_PER_USER = int(os.getenv('IMPORT_MAX_JOBS_PER_USER', 1))
+    JOB_RETENTION_SECONDS = int(os.getenv('JOB_RETENTION_SECONDS', 3600))
+    # Multi-source imports fetch accounts concurrently on this many threads
+    IMPORT_SOURCE_WORKERS = int(os.getenv('IMPORT_SOURCE_WORKERS', 4))
+    IMPORT_MAX_SOURCES = int(os.getenv('IMPORT_MAX_SOURCES', 10))
+    
+    # Computed analytics results cached per user (LRU, invalidated on writes)
+    RESULT_CACHE_MAX_ENTRIES = int(os.getenv('RESULT_CACHE_MAX_ENTRIES', 2048))
+    # Price-dependent responses get a new ETag every PRICE_CACHE_SECONDS
+    PRICE_CACHE_SECONDS = int(os.getenv('PRICE_CACHE_SECONDS', 60))
+    # JSON responses at least this large are gzip/brotli compressed
+    COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+    # Daily OHLC history for risk analytics: SYMBOL=csv path (relative to backend/),
+    # in the Date,Open,High,Low,Close,Adj Close,Volume layout prediction_model.py writes
+    OHLC_FILES = os.getenv('OHLC_FILES', 'BTC=coin.csv')
+    # Annual risk-free rate for Sharpe/Sortino (0.04 = 4%)
+    RISK_FREE_RATE = float(os.getenv('RISK_FREE_RATE', 0.0))
+    # Indicator columns (memory-mapped, shared by worker processes), relative to backend/
+    FEATURE_DIR = os.getenv('FEATURE_DIR', 'features')
+    # Intraday price ticks: ring buffer files relative to backend/, ticks kept
+    # per symbol (16 bytes each; the default covers 7 days at one tick per
+    # 30 s), the least spacing between ticks, and how old a tick may be to
+    # value the start of a performance period at market prices
+    TICK_DIR = os.getenv('TICK_DIR', 'ticks')
+    TICK_CAPACITY = int(os.getenv('TICK_CAPACITY', 32768))
+    TICK_MIN_INTERVAL = float(os.getenv('TICK_MIN_INTERVAL', 30))
+    TICK_MAX_AGE = float(os.getenv('TICK_MAX_AGE', 3600))
+    # Monte Carlo projections: worker processes (1 = simulate in the request
+    # thread), draws held per chunk of paths, and the most paths and days
+    # ahead per request
+    PROJECTION_WORKERS = int(os.getenv('PROJECTION_WORKERS', min(4, os.cpu_count() or 1)))
+    PROJECTION_CHUNK_MB = int(os.getenv('PROJECTION_CHUNK_MB', 32))
+    PROJECTION_MAX_PATHS = int(os.getenv('PROJECTION_MAX_PATHS', 20000))
+    PROJECTION_MAX_DAYS = int(os.getenv('PROJECTION_MAX_DAYS', 3650))
+    # /api/prediction: concurrent requests are batched into one forward pass of
+    # up to INFERENCE_MAX_BATCH windows, waiting at most INFERENCE_MAX_DELAY_MS
+    # for company; recent bars are fetched from yfinance at most this often
+    INFERENCE_MAX_BATCH = int(os.getenv('INFERENCE_MAX_BATCH', 1024))
+    INFERENCE_MAX_DELAY_MS = float(os.getenv('INFERENCE_MAX_DELAY_MS', 10))
+    INFERENCE_TIMEOUT = float(os.getenv('INFERENCE_TIMEOUT', 30))
+    PREDICTION_REFRESH_SECONDS = int(os.getenv('PREDICTION_REFRESH_SECONDS', 3600))
+    # Live portfolio stream: shared price tick interval and idle keep-alive
+    PRICE_FEED_INTERVAL = int(os.getenv('PRICE_FEED_INTERVAL', PRICE_CACHE_SECONDS))
+    SSE_HEARTBEAT_SECONDS = int(os.getenv('SSE_HEARTBEAT_SECONDS', 15))
+    
+    # Instrumentation: opt-in sampling profiler (folded stacks for flamegraphs)
+    PROFILER_ENABLED = os.getenv('PROFILER_ENABLED', 'False').lower() == 'true'
+    PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0.0))  # fraction of requests sampled
+    PROFILE_SLOW_MS = int(os.getenv('PROFILE_SLOW_MS', 500))  # sampled requests slower than this are dumped
+    PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', 5))
+    PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+    
+    # Logging: LOG_FORMAT=json for structured output. Sampled loggers keep a
+    # fraction of their DEBUG/INFO records ("services.sync_service=0.01"), and
+    # each call site is capped at LOG_RATE_LIMIT_PER_MINUTE records (0 = off)
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+    LOG_ASYNC = os.getenv('LOG_ASYNC', 'True').lower() == 'true'
+    LOG_SAMPLE_RATES = os.getenv('LOG_SAMPLE_RATES', '')
+    LOG_RATE_LIMIT_PER_MINUTE = int(os.getenv('LOG_RATE_LIMIT_PER_MINUTE', 60))
     
     # CORS Configuration
     # Allow common localhost ports for development
@@ -0,0 +1 @@
+"""Local stand-ins for upstream services, used for manual testing and benchmarks"""
@@ -0,0 +1,263 @@
+"""
+Local fake of the Coinbase Advanced Trade fills API
+
+Serves /orders/historical/fills with cursor pagination (newest fill first) and
+the limit, product_type and start/end_sequence_timestamp filters. Like the real
+API it rejects tokens whose JWT "uri" claim is not exactly "METHOD host/path".
+Records request/byte counts and can inject errors such as 429 rate limits.
+Point CoinbaseService at it with base_url=server.base_url (or COINBASE_API_URL).
+
+Usage:
+    python -m devtools.fake_coinbase --port 8787 --fills 1000
+"""
+import argparse
+import base64
+import json
+import random
+import threading
+import urllib.parse
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+API_PREFIX = "/api/v3/brokerage"
+
+PRODUCTS = [
+    ("BTC-USD", (30000, 70000)),
+    ("ETH-USD", (2000, 4000)),
+    ("SOL-USD", (50, 200)),
+    ("ADA-USD", (0.3, 1.5)),
+    ("LINK-USD", (10, 30)),
+    ("BTC-EUR", (28000, 65000)),
+    ("BIT-29NOV24-CDE", (30000, 70000)),
+]
+
+PRODUCT_TYPES = {"BIT-29NOV24-CDE": "FUTURE"}
+
+
+def generate_fills(
+    count: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    seed: int = 0,
+    id_prefix: str = "fake"
+) -> List[Dict]:
+    """Generate `count` fills in Coinbase format, sorted newest first"""
+    rng = random.Random(seed)
+    end = end or datetime.now(timezone.utc)
+    start = start or end - timedelta(days=365)
+    span = (end - start).total_seconds()
+    
+    fills = []
+    for i in range(count):
+        product_id, (price_min, price_max) = rng.choice(PRODUCTS)
+        trade_time = start + timedelta(seconds=rng.uniform(0, span))
+        price = round(rng.uniform(price_min, price_max), 2)
+        size = round(rng.uniform(0.001, 1.0), 6)
+        fills.append({
+            "entry_id": f"{id_prefix}_entry_{i}",
+            "trade_id": f"{id_prefix}_trade_{i}",
+            "order_id": f"{id_prefix}_order_{i}",
+            "trade_time": trade_time.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+            "trade_type": "FILL",
+            "price": str(price),
+            "size": str(size),
+            "commission": str(round(price * size * 0.001, 2)),
+            "product_id": product_id,
+            "sequence_timestamp": trade_time.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+            "liquidity_indicator": "TAKER",
+            "size_in_quote": str(round(price * size, 2)),
+            "side": rng.choice(["BUY", "SELL"]),
+        })
+    
+    fills.sort(key=lambda f: f["trade_time"], reverse=True)
+    return fills
+
+
+def generate_credentials() -> Tuple[str, str]:
+    """Create a throwaway (api_key, PEM private key) pair in CDP format"""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    pem = private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.TraditionalOpenSSL,
+        encryption_algorithm=serialization.NoEncryption()
+    ).decode()
+    return "organizations/fake-org/apiKeys/fake-key", pem
+
+
+class FakeCoinbaseServer:
+    """In-process HTTP server mimicking the Coinbase fills endpoint"""
+    
+    def __init__(self, fills: Optional[List[Dict]] = None, page_size: int = 100,
+                 host: str = "127.0.0.1", port: int = 0, strict_auth: bool = True):
+        self.page_size = page_size
+        self.strict_auth = strict_auth
+        self._fills = list(fills or [])
+        self._faults: List[Tuple[int, Optional[int]]] = []
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "pages": 0, "fills_served": 0, "bytes_sent": 0, "errors": 0}
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread = None
+    
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}{API_PREFIX}"
+    
+    def add_fills(self, fills: List[Dict]) -> None:
+        """Add fills (e.g. new trades arriving between syncs)"""
+        with self._lock:
+            self._fills.extend(fills)
+            self._fills.sort(key=lambda f: f["trade_time"], reverse=True)
+    
+    def fail_next(self, status: int = 429, retry_after: Optional[int] = 1, times: int = 1) -> None:
+        """Make the next `times` requests fail with `status`"""
+        with self._lock:
+            self._faults.extend([(status, retry_after)] * times)
+    
+    def reset_stats(self) -> None:
+        with self._lock:
+            for key in self.stats:
+                self.stats[key] = 0
+    
+    def start(self) -> "FakeCoinbaseServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, *exc):
+        self.stop()
+    
+    def _select_fills(self, query: Dict[str, List[str]]) -> List[Dict]:
+        """Fills matching the request filters, newest first"""
+        product_type = query.get("product_type", [None])[0]
+        start = _parse_time(query.get("start_sequence_timestamp", [None])[0])
+        end = _parse_time(query.get("end_sequence_timestamp", [None])[0])
+        if not (product_type or start or end):
+            return self._fills
+        
+        selected = []
+        for fill in self._fills:
+            if product_type and PRODUCT_TYPES.get(fill["product_id"], "SPOT") != product_type:
+                continue
+            sequence_time = _parse_time(fill["sequence_timestamp"])
+            if start and sequence_time < start:
+                continue
+            if end and sequence_time > end:
+                continue
+            selected.append(fill)
+        return selected
+    
+    def _handle_fills(self, query: Dict[str, List[str]]) -> Tuple[int, Dict]:
+        with self._lock:
+            fills = self._select_fills(query)
+            offset = int(query.get("cursor", ["0"])[0] or 0)
+            limit = int(query.get("limit", [self.page_size])[0])
+            page = fills[offset:offset + limit]
+            next_offset = offset + len(page)
+            self.stats["pages"] += 1
+            self.stats["fills_served"] += len(page)
+        
+        cursor = str(next_offset) if next_offset < len(fills) else ""
+        return 200, {"fills": page, "cursor": cursor}
+    
+    def _make_handler(self):
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parsed = urllib.parse.urlparse(self.path)
+                query = urllib.parse.parse_qs(parsed.query)
+                
+                with server._lock:
+                    server.stats["requests"] += 1
+                    fault = server._faults.pop(0) if server._faults else None
+                
+                if fault:
+                    status, retry_after = fault
+                    headers = {"Retry-After": str(retry_after)} if retry_after is not None else {}
+                    return self._send(status, {"error": "fault_injected", "message": f"Injected {status}"}, headers)
+                
+                auth = self.headers.get("Authorization", "")
+                if not auth.startswith("Bearer "):
+                    return self._send(401, {"error": "unauthorized", "message": "Missing bearer token"})
+                if server.strict_auth:
+                    expected = f"GET {self.headers.get('Host')}{parsed.path}"
+                    if _jwt_uri_claim(auth[len("Bearer "):]) != expected:
+                        return self._send(401, {"error": "unauthorized", "message": "Unauthorized"})
+                
+                if parsed.path == f"{API_PREFIX}/orders/historical/fills":
+                    return self._send(*server._handle_fills(query))
+                if parsed.path == f"{API_PREFIX}/accounts":
+                    return self._send(200, {"accounts": [], "has_next": False, "cursor": ""})
+                return self._send(404, {"error": "not_found", "message": parsed.path})
+            
+            def _send(self, status: int, payload: Dict, headers: Optional[Dict] = None):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                # Count before writing so stats are settled once the client has the response
+                with server._lock:
+                    server.stats["bytes_sent"] += len(body)
+                    if status != 200:
+                        server.stats["errors"] += 1
+                self.wfile.write(body)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        return Handler
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _jwt_uri_claim(token: str) -> Optional[str]:
+    """Read the "uri" claim of a JWT without verifying its signature"""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload)).get("uri")
+    except (IndexError, ValueError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local fake Coinbase fills API")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--fills", type=int, default=1000)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    
+    server = FakeCoinbaseServer(generate_fills(args.fills, seed=args.seed), page_size=args.page_size, port=args.port)
+    api_key, api_secret = generate_credentials()
+    print(f"COINBASE_API_URL={server.base_url}")
+    print(f"api_key: {api_key}")
+    print(api_secret)
+    server.start()
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
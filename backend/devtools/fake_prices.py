@@ -0,0 +1,156 @@
+"""
+Local fake of the CoinGecko simple price API
+
+Serves /api/v3/simple/price?ids=...&vs_currencies=usd with deterministic
+random-walk prices (one step per request), optional added latency and injected
+errors such as 429 rate limits. Point TransactionService at it with
+price_url=server.price_url (or COINGECKO_API_URL).
+
+Usage:
+    python -m devtools.fake_prices --port 8788 --latency-ms 50
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+# Starting prices by CoinGecko id, within the ranges used for mock transactions
+BASE_PRICES = {
+    "bitcoin": 50000.0,
+    "ethereum": 3000.0,
+    "solana": 120.0,
+    "cardano": 0.8,
+    "matic-network": 1.0,
+    "dogecoin": 0.15,
+    "chainlink": 18.0,
+    "avalanche-2": 35.0,
+    "ripple": 0.6,
+    "litecoin": 80.0,
+    "bitcoin-cash": 250.0,
+    "eos": 0.8,
+    "stellar": 0.12,
+}
+
+
+class FakeCoinGeckoServer:
+    """In-process HTTP server mimicking CoinGecko's /simple/price endpoint"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 volatility: float = 0.002, seed: int = 0):
+        self.latency = latency
+        self.volatility = volatility
+        self.prices = dict(BASE_PRICES)
+        self._rng = random.Random(seed)
+        self._faults: List[Tuple[int, Optional[int]]] = []
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "ids_served": 0, "errors": 0}
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread = None
+
+    @property
+    def price_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/api/v3/simple/price?vs_currencies=usd"
+
+    def fail_next(self, status: int = 429, retry_after: Optional[int] = 1, times: int = 1) -> None:
+        """Make the next `times` requests fail with `status`"""
+        with self._lock:
+            self._faults.extend([(status, retry_after)] * times)
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            for key in self.stats:
+                self.stats[key] = 0
+
+    def start(self) -> "FakeCoinGeckoServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _quote(self, ids: List[str]) -> Dict[str, Dict[str, float]]:
+        """Step every requested price and return them; unknown ids are omitted like CoinGecko"""
+        with self._lock:
+            quotes = {}
+            for coin_id in ids:
+                if coin_id not in self.prices:
+                    continue
+                self.prices[coin_id] *= 1 + self._rng.gauss(0, self.volatility)
+                quotes[coin_id] = {"usd": round(self.prices[coin_id], 8)}
+            self.stats["ids_served"] += len(quotes)
+            return quotes
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parsed = urllib.parse.urlparse(self.path)
+                query = urllib.parse.parse_qs(parsed.query)
+
+                with server._lock:
+                    server.stats["requests"] += 1
+                    fault = server._faults.pop(0) if server._faults else None
+                if server.latency:
+                    time.sleep(server.latency)
+
+                if fault:
+                    status, retry_after = fault
+                    headers = {"Retry-After": str(retry_after)} if retry_after is not None else {}
+                    return self._send(status, {"status": {"error_code": status, "error_message": "fault injected"}}, headers)
+
+                if parsed.path != "/api/v3/simple/price":
+                    return self._send(404, {"error": "not found"})
+                ids = [i for i in query.get("ids", [""])[0].split(",") if i]
+                return self._send(200, server._quote(ids))
+
+            def _send(self, status: int, payload: Dict, headers: Optional[Dict] = None):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                if status != 200:
+                    with server._lock:
+                        server.stats["errors"] += 1
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local fake CoinGecko price API")
+    parser.add_argument("--port", type=int, default=8788)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = FakeCoinGeckoServer(port=args.port, latency=args.latency_ms / 1000, seed=args.seed)
+    print(f"COINGECKO_API_URL={server.price_url}")
+    server.start()
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
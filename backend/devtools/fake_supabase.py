@@ -0,0 +1,511 @@
+"""
+In-memory fake of the supabase-py client for benchmarks and local testing
+
+Implements the PostgREST query-builder chain the services use:
+table().select().in_().eq().neq().gt()/gte()/lt()/lte().or_().order().limit()
+.execute(), plus insert(), update(), upsert(), delete() and rpc() for the
+functions in supabase_schema.sql (SCHEMA_RPCS). Rows live in memory per table; timestamps are stored in one canonical ISO format so they
+compare like the database compares them.
+
+Indexes keep large benchmarks realistic: rows are looked up by id (the
+primary key) and bucketed by user_id (like idx_transactions_user_*), and
+ordered results are cached per table version so keyset pages of the form used
+by get_transactions_page() ("c1.lt.x,and(c1.eq.x,c2.lt.y)" ordered by c1, c2)
+are a bisect rather than a full scan, mirroring an index range scan.
+
+With serialize=True every response is round-tripped through JSON, and
+latency adds a fixed delay per request, to approximate PostgREST's wire cost.
+Selects return at most max_rows rows (PostgREST's db-max-rows, 1000 by
+default) whatever limit() asks for, so code that expects more rows than the
+cap from one request is caught here as it would be in production.
+
+Usage:
+    db = FakeSupabase()
+    db.seed('transactions', rows)
+    service = TransactionService(db)
+"""
+import bisect
+import json
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+TIMESTAMP_COLUMNS = {'date', 'created_at', 'updated_at', 'last_trade_time', 'pending_trade_time', 'last_synced_at'}
+
+# Column defaults applied on insert, per table (callables are evaluated per row)
+TABLE_DEFAULTS = {
+    'transactions': {
+        'id': lambda: str(uuid.uuid4()),
+        'status': 'active',
+        'created_by': 'system',
+        'user_id': 'default',
+        'source': 'manual',
+        'external_id': None,
+        'date': lambda: _now(),
+        'created_at': lambda: _now(),
+        'updated_at': lambda: _now(),
+    },
+}
+
+SORTED_CACHE_SIZE = 16
+
+
+class FakeResponse:
+    """Mimics postgrest's APIResponse"""
+
+    def __init__(self, data: List[Dict], count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+class FakeTable:
+    def __init__(self, name: str):
+        self.name = name
+        self.rows: List[Dict] = []
+        self.by_user: Dict[Any, List[Dict]] = defaultdict(list)
+        self.by_id: Dict[Any, Dict] = {}
+        self.version = 0
+        self.sorted_cache: Dict[Tuple, Tuple[List, List]] = {}
+
+    def add(self, row: Dict) -> None:
+        self.rows.append(row)
+        self.by_user[row.get('user_id')].append(row)
+        if row.get('id') is not None:
+            self.by_id[row['id']] = row
+
+    def changed(self, reindex: bool = False) -> None:
+        self.version += 1
+        self.sorted_cache.clear()
+        if reindex:
+            self.by_user = defaultdict(list)
+            self.by_id = {}
+            for row in self.rows:
+                self.by_user[row.get('user_id')].append(row)
+                if row.get('id') is not None:
+                    self.by_id[row['id']] = row
+
+
+class FakeSupabase:
+    """Drop-in stand-in for supabase.Client with in-memory tables"""
+
+    def __init__(self, serialize: bool = False, latency: float = 0.0, max_rows: Optional[int] = 1000):
+        self.serialize = serialize
+        self.latency = latency
+        self.max_rows = max_rows
+        self.tables: Dict[str, FakeTable] = {}
+        self.rpcs: Dict[str, Callable] = dict(SCHEMA_RPCS)
+        self.stats = defaultdict(int)
+        self._lock = threading.RLock()
+
+    def table(self, name: str) -> 'FakeQuery':
+        return FakeQuery(self, name)
+
+    def rpc(self, name: str, params: Optional[Dict] = None) -> 'FakeRpc':
+        return FakeRpc(self, name, params or {})
+
+    def register_rpc(self, name: str, fn: Callable[['FakeSupabase', Dict], List[Dict]]) -> None:
+        """Register a Python implementation of a database function for rpc()"""
+        self.rpcs[name] = fn
+
+    def seed(self, table: str, rows: List[Dict]) -> None:
+        """Bulk load rows (defaults applied, no stats recorded)"""
+        with self._lock:
+            target = self._table(table)
+            for row in rows:
+                target.add(_with_defaults(table, row))
+            target.changed()
+
+    def reset_stats(self) -> None:
+        self.stats = defaultdict(int)
+
+    def _table(self, name: str) -> FakeTable:
+        if name not in self.tables:
+            self.tables[name] = FakeTable(name)
+        return self.tables[name]
+
+
+class FakeRpc:
+    def __init__(self, db: FakeSupabase, name: str, params: Dict):
+        self.db = db
+        self.name = name
+        self.params = params
+
+    def execute(self) -> FakeResponse:
+        with self.db._lock:
+            self.db.stats['rpc'] += 1
+            if self.name not in self.db.rpcs:
+                raise Exception(f"Could not find the function public.{self.name}")
+            return FakeResponse(self.db.rpcs[self.name](self.db, self.params))
+
+
+class FakeQuery:
+    """Query builder; each filter method returns self like postgrest's builders"""
+
+    def __init__(self, db: FakeSupabase, table: str):
+        self.db = db
+        self.table_name = table
+        self.operation = 'select'
+        self.columns: Optional[List[str]] = None
+        self.filters: List[Tuple[str, str, Any]] = []
+        self.or_filters: List[Any] = []
+        self.orders: List[Tuple[str, bool]] = []
+        self.row_limit: Optional[int] = None
+        self.payload = None
+        self.on_conflict: Optional[str] = None
+
+    # Operations
+
+    def select(self, columns: str = '*', **kwargs) -> 'FakeQuery':
+        self.operation = 'select'
+        self.columns = None if columns.strip() == '*' else [c.strip() for c in columns.split(',')]
+        return self
+
+    def insert(self, rows, **kwargs) -> 'FakeQuery':
+        self.operation = 'insert'
+        self.payload = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def upsert(self, rows, on_conflict: str = 'id', **kwargs) -> 'FakeQuery':
+        self.operation = 'upsert'
+        self.payload = rows if isinstance(rows, list) else [rows]
+        self.on_conflict = on_conflict
+        return self
+
+    def update(self, data: Dict, **kwargs) -> 'FakeQuery':
+        self.operation = 'update'
+        self.payload = data
+        return self
+
+    def delete(self, **kwargs) -> 'FakeQuery':
+        self.operation = 'delete'
+        return self
+
+    # Filters
+
+    def eq(self, column: str, value) -> 'FakeQuery':
+        return self._filter(column, 'eq', value)
+
+    def neq(self, column: str, value) -> 'FakeQuery':
+        return self._filter(column, 'neq', value)
+
+    def gt(self, column: str, value) -> 'FakeQuery':
+        return self._filter(column, 'gt', value)
+
+    def gte(self, column: str, value) -> 'FakeQuery':
+        return self._filter(column, 'gte', value)
+
+    def lt(self, column: str, value) -> 'FakeQuery':
+        return self._filter(column, 'lt', value)
+
+    def lte(self, column: str, value) -> 'FakeQuery':
+        return self._filter(column, 'lte', value)
+
+    def in_(self, column: str, values) -> 'FakeQuery':
+        return self._filter(column, 'in', tuple(_canonical(column, v) for v in values))
+
+    def or_(self, expression: str) -> 'FakeQuery':
+        self.or_filters.append(('or', _parse_logic(expression)))
+        return self
+
+    def order(self, column: str, desc: bool = False, **kwargs) -> 'FakeQuery':
+        self.orders.append((column, desc))
+        return self
+
+    def limit(self, count: int) -> 'FakeQuery':
+        self.row_limit = count
+        return self
+
+    def _filter(self, column: str, op: str, value) -> 'FakeQuery':
+        self.filters.append((column, op, value if op == 'in' else _canonical(column, value)))
+        return self
+
+    # Execution
+
+    def execute(self) -> FakeResponse:
+        if self.db.serialize and self.payload is not None:
+            self.payload = json.loads(json.dumps(self.payload, default=str))
+        with self.db._lock:
+            self.db.stats[self.operation] += 1
+            table = self.db._table(self.table_name)
+            if self.operation == 'select':
+                data = self._select(table)
+            elif self.operation == 'insert':
+                data = self._insert(table)
+            elif self.operation == 'upsert':
+                data = self._upsert(table)
+            elif self.operation == 'update':
+                data = self._update(table)
+            else:
+                data = self._delete(table)
+        if self.db.serialize:
+            data = json.loads(json.dumps(data))
+        if self.db.latency:
+            time.sleep(self.db.latency)
+        return FakeResponse(data)
+
+    def _candidates(self, table: FakeTable) -> List[Dict]:
+        for column, op, value in self.filters:
+            if column == 'id' and op == 'eq':
+                row = table.by_id.get(value)
+                return [row] if row is not None else []
+        for column, op, value in self.filters:
+            if column == 'user_id' and op == 'eq':
+                return table.by_user.get(value, [])
+        return table.rows
+
+    def _matches(self, row: Dict) -> bool:
+        return all(_compare(row.get(column), op, value) for column, op, value in self.filters) and \
+            all(_evaluate(node, row) for node in self.or_filters)
+
+    def _select(self, table: FakeTable) -> List[Dict]:
+        rows = self._keyset_range(table)
+        if rows is None:
+            rows = [row for row in self._candidates(table) if self._matches(row)]
+            for column, desc in reversed(self.orders):
+                rows.sort(key=lambda row: _sort_key(row.get(column)), reverse=desc)
+            if self.row_limit is not None:
+                rows = rows[:self.row_limit]
+        if self.db.max_rows is not None:
+            rows = rows[:self.db.max_rows]
+        self.db.stats['rows_returned'] += len(rows)
+        return [self._project(row) for row in rows]
+
+    def _keyset_range(self, table: FakeTable) -> Optional[List[Dict]]:
+        """Serve ordered (and keyset-continued) selects from the sorted cache"""
+        if not self.orders or len({desc for _, desc in self.orders}) != 1:
+            return None
+        order_columns = tuple(column for column, _ in self.orders)
+        descending = self.orders[0][1]
+
+        after = None
+        if self.or_filters:
+            after = _keyset_bound(self.or_filters, order_columns)
+            if after is None:
+                return None
+
+        cache_key = (repr(self.filters), order_columns)
+        cached = table.sorted_cache.get(cache_key)
+        if cached is None:
+            rows = [row for row in self._candidates(table) if self._matches_plain(row)]
+            rows.sort(key=lambda row: tuple(_sort_key(row.get(column)) for column in order_columns))
+            keys = [tuple(_sort_key(row.get(column)) for column in order_columns) for row in rows]
+            if len(table.sorted_cache) >= SORTED_CACHE_SIZE:
+                table.sorted_cache.pop(next(iter(table.sorted_cache)))
+            cached = table.sorted_cache[cache_key] = (rows, keys)
+        rows, keys = cached
+
+        limit = self.row_limit if self.row_limit is not None else len(rows)
+        if descending:
+            end = bisect.bisect_left(keys, tuple(_sort_key(v) for v in after)) if after else len(rows)
+            return rows[max(0, end - limit):end][::-1]
+        start = bisect.bisect_right(keys, tuple(_sort_key(v) for v in after)) if after else 0
+        return rows[start:start + limit]
+
+    def _matches_plain(self, row: Dict) -> bool:
+        return all(_compare(row.get(column), op, value) for column, op, value in self.filters)
+
+    def _project(self, row: Dict) -> Dict:
+        if self.columns is None:
+            return dict(row)
+        return {column: row.get(column) for column in self.columns}
+
+    def _insert(self, table: FakeTable) -> List[Dict]:
+        inserted = []
+        for row in self.payload:
+            stored = _with_defaults(self.table_name, row)
+            table.add(stored)
+            inserted.append(dict(stored))
+        table.changed()
+        return inserted
+
+    def _upsert(self, table: FakeTable) -> List[Dict]:
+        conflict_columns = [c.strip() for c in (self.on_conflict or 'id').split(',')]
+        result = []
+        for row in self.payload:
+            values = {column: _canonical(column, value) for column, value in row.items()}
+            existing = next(
+                (stored for stored in table.rows if all(stored.get(c) == values.get(c) for c in conflict_columns)),
+                None
+            )
+            if existing is not None:
+                existing.update(values)
+                result.append(dict(existing))
+            else:
+                stored = _with_defaults(self.table_name, row)
+                table.add(stored)
+                result.append(dict(stored))
+        table.changed(reindex=True)
+        return result
+
+    def _update(self, table: FakeTable) -> List[Dict]:
+        values = {column: _canonical(column, value) for column, value in self.payload.items()}
+        updated = []
+        for row in self._candidates(table):
+            if self._matches(row):
+                row.update(values)
+                updated.append(dict(row))
+        table.changed(reindex='user_id' in values or 'id' in values)
+        return updated
+
+    def _delete(self, table: FakeTable) -> List[Dict]:
+        deleted = [row for row in self._candidates(table) if self._matches(row)]
+        if deleted:
+            doomed = {id(row) for row in deleted}
+            table.rows = [row for row in table.rows if id(row) not in doomed]
+            table.changed(reindex=True)
+        return [dict(row) for row in deleted]
+
+
+def _get_user_holdings(db: FakeSupabase, params: Dict) -> List[Dict]:
+    """Python twin of get_user_holdings() in supabase_schema.sql"""
+    table = db._table('transactions')
+    user_id, symbol, exclude_id = params.get('p_user_id'), params.get('p_symbol'), params.get('p_exclude_id')
+    rows = table.by_user.get(user_id, []) if user_id is not None else table.rows
+    sums: Dict[str, List[float]] = {}
+    for row in rows:
+        if row.get('status') not in ('active', 'pending'):
+            continue
+        if (symbol is not None and row.get('symbol') != symbol) or (exclude_id is not None and row.get('id') == exclude_id):
+            continue
+        sign = {'buy': 1, 'sell': -1}.get(str(row.get('type', '')).lower(), 0)
+        totals = sums.setdefault(row['symbol'], [0.0, 0.0])
+        totals[0] += sign * float(row.get('coins') or 0)
+        totals[1] += sign * float(row.get('value_usd') or 0)
+    return [{'symbol': s, 'coins': coins, 'total_value': value} for s, (coins, value) in sums.items()]
+
+
+# Database functions defined in supabase_schema.sql, available through rpc()
+SCHEMA_RPCS = {
+    'get_user_holdings': _get_user_holdings,
+}
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec='microseconds')
+
+
+def _with_defaults(table: str, row: Dict) -> Dict:
+    stored = {column: _canonical(column, value) for column, value in row.items()}
+    for column, default in TABLE_DEFAULTS.get(table, {}).items():
+        if stored.get(column) is None and (column not in stored or column in ('id', 'date', 'created_at', 'updated_at')):
+            stored[column] = default() if callable(default) else default
+    return stored
+
+
+def _canonical(column: str, value):
+    """Store/compare timestamps in one ISO format, as the database would return them"""
+    if column not in TIMESTAMP_COLUMNS or value is None:
+        return value
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        try:
+            parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        except ValueError:
+            return value
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).isoformat(timespec='microseconds')
+
+
+def _sort_key(value):
+    # NULLs sort last ascending, like PostgreSQL
+    return (value is None, value if value is not None else 0)
+
+
+def _compare(actual, op: str, expected) -> bool:
+    if op == 'eq':
+        return actual == expected
+    if op == 'neq':
+        return actual != expected
+    if op == 'in':
+        return actual in expected
+    if op == 'is':
+        return actual is None if expected in (None, 'null') else actual == expected
+    if actual is None:
+        return False
+    if op == 'lt':
+        return actual < expected
+    if op == 'lte':
+        return actual <= expected
+    if op == 'gt':
+        return actual > expected
+    if op == 'gte':
+        return actual >= expected
+    raise ValueError(f"Unsupported filter operator: {op}")
+
+
+def _parse_logic(expression: str) -> List:
+    """Parse a PostgREST logic tree ("a.lt.1,and(b.eq.2,c.gt.3)") into nodes"""
+    nodes = []
+    for part in _split_top_level(expression):
+        for group in ('and', 'or'):
+            if part.startswith(f'{group}(') and part.endswith(')'):
+                nodes.append((group, _parse_logic(part[len(group) + 1:-1])))
+                break
+        else:
+            column, op, value = part.split('.', 2)
+            if len(value) >= 2 and value[0] == value[-1] == '"':
+                value = value[1:-1]
+            elif op in ('lt', 'lte', 'gt', 'gte', 'eq', 'neq') and column not in TIMESTAMP_COLUMNS:
+                value = _coerce_number(value)
+            nodes.append((column, op, _canonical(column, value)))
+    return nodes
+
+
+def _split_top_level(expression: str) -> List[str]:
+    parts, depth, quoted, current = [], 0, False, []
+    for char in expression:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == '(':
+            depth += 1
+        elif not quoted and char == ')':
+            depth -= 1
+        elif not quoted and depth == 0 and char == ',':
+            parts.append(''.join(current))
+            current = []
+            continue
+        current.append(char)
+    if current:
+        parts.append(''.join(current))
+    return parts
+
+
+def _coerce_number(value: str):
+    try:
+        return float(value) if '.' in value else int(value)
+    except ValueError:
+        return value
+
+
+def _evaluate(node, row: Dict) -> bool:
+    kind, payload = node[0], node[1]
+    if kind == 'or':
+        return any(_evaluate(child, row) for child in payload)
+    if kind == 'and':
+        return all(_evaluate(child, row) for child in payload)
+    column, op, value = node
+    return _compare(row.get(column), op, value)
+
+
+def _keyset_bound(or_filters: List, order_columns: Tuple[str, ...]) -> Optional[Tuple]:
+    """Recognize "c1.lt.x,or and(c1.eq.x,c2.lt.y)" (or gt) keyset filters on the order columns"""
+    if len(or_filters) != 1 or len(order_columns) != 2:
+        return None
+    _, children = or_filters[0]
+    c1, c2 = order_columns
+    try:
+        (first_col, first_op, x), (group, inner) = children
+        (eq_col, eq_op, x2), (second_col, second_op, y) = inner
+    except (TypeError, ValueError):
+        return None
+    if (
+        group == 'and' and first_col == c1 and eq_col == c1 and second_col == c2
+        and eq_op == 'eq' and x == x2 and first_op == second_op and first_op in ('lt', 'gt')
+    ):
+        return (x, y)
+    return None
@@ -0,0 +1,131 @@
+"""
+HTTP helpers for the API: conditional GET with ETags and response compression
+"""
+from typing import Callable
+from datetime import date
+import functools
+import gzip
+import hashlib
+import time
+import uuid
+import logging
+
+from flask import Response, make_response, request
+from flask.json.provider import DefaultJSONProvider
+
+from services.metrics import span
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Data versions are per process and restart at 0, so ETags include a boot id
+# to keep a restarted server from matching tags issued before the restart
+BOOT_ID = uuid.uuid4().hex[:8]
+
+# Suffix appended to the ETag of each compressed representation
+ENCODING_SUFFIXES = {'br': '-br', 'gzip': '-gz'}
+
+
+class ConditionalGet:
+    """
+    Strong ETags for per-user GET endpoints
+
+    The tag is derived from the user's data version (bumped on every
+    transaction write), the request path and query, the current date and,
+    for price-dependent endpoints, the price epoch (time // price TTL). A
+    matching If-None-Match returns 304 before the view runs, so nothing is
+    queried or recomputed.
+    """
+
+    def __init__(self, data_version: Callable[[str], int], price_ttl: float = 60):
+        self.data_version = data_version
+        self.price_ttl = price_ttl
+
+    def etag_for(self, user_id: str, prices: bool = False) -> str:
+        parts = [
+            BOOT_ID,
+            str(self.data_version(user_id)),
+            date.today().isoformat(),
+            request.full_path
+        ]
+        if prices:
+            parts.append(str(int(time.time() // self.price_ttl)))
+        return hashlib.sha256('|'.join(parts).encode()).hexdigest()[:32]
+
+    def etagged(self, prices: bool = False):
+        """Decorate a view taking ?userId= with ETag / If-None-Match handling"""
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                user_id = request.args.get('userId', 'default')
+                etag = self.etag_for(user_id, prices)
+                variants = [etag] + [etag + suffix for suffix in ENCODING_SUFFIXES.values()]
+                matched = next((variant for variant in variants if request.if_none_match.contains(variant)), None)
+                if matched:
+                    not_modified = Response(status=304)
+                    not_modified.set_etag(matched)
+                    not_modified.headers['Cache-Control'] = 'private, no-cache'
+                    return not_modified
+
+                response = make_response(view(*args, **kwargs))
+                if response.status_code == 200:
+                    response.set_etag(etag)
+                    response.headers['Cache-Control'] = 'private, no-cache'
+                return response
+            return wrapper
+        return decorator
+
+
+def compress_response(response: Response, min_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 5) -> Response:
+    """
+    Compress a JSON response with brotli or gzip, as the client accepts
+
+    Registered as an after_request hook. Small bodies, streamed responses and
+    anything already encoded are left alone. Brotli is used only when the
+    optional brotli package is installed.
+    """
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or response.is_streamed
+        or response.mimetype != 'application/json'
+        or 'Content-Encoding' in response.headers
+    ):
+        return response
+
+    body = response.get_data()
+    if len(body) < min_size:
+        return response
+
+    accepted = request.accept_encodings
+    if BROTLI_AVAILABLE and accepted['br']:
+        encoding = 'br'
+        compressed = brotli.compress(body, quality=brotli_quality)
+    elif accepted['gzip']:
+        encoding = 'gzip'
+        compressed = gzip.compress(body, compresslevel=gzip_level)
+    else:
+        return response
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+
+    # Each encoding is a different representation, so it needs its own strong tag
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag + ENCODING_SUFFIXES[encoding])
+    return response
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that records serialization time as a 'json' span"""
+
+    def dumps(self, obj, **kwargs) -> str:
+        with span('json'):
+            return super().dumps(obj, **kwargs)
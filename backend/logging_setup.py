@@ -0,0 +1,170 @@
+"""
+Logging configuration: optional JSON output, sampling and rate limiting of
+noisy loggers, and a queue handler so request threads never block on I/O
+"""
+from typing import Dict, Optional
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import threading
+import time
+
+# Attributes every LogRecord has; anything else was passed with extra={...}
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, including any extra={...} fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'thread': record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep a fraction of DEBUG/INFO records from selected loggers
+
+    rates maps a logger name prefix to the fraction kept, e.g.
+    {'services.sync_service': 0.01}. Warnings and errors always pass.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        # Longest prefix wins
+        self.rates = sorted(rates.items(), key=lambda item: -len(item[0]))
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        for prefix, rate in self.rates:
+            if record.name == prefix or record.name.startswith(prefix + '.'):
+                return random.random() < rate
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let through at most `per_minute` records per call site per minute
+
+    Records are keyed by logger and unformatted message, so "Failed to import
+    %s" counts as one site however many transactions fail. The first record
+    after a suppressed run carries the number dropped as `suppressed`.
+    """
+
+    def __init__(self, per_minute: int):
+        super().__init__()
+        self.per_minute = per_minute
+        self._windows: Dict[tuple, list] = {}  # key -> [window start, count, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.name, record.msg if isinstance(record.msg, str) else type(record.msg).__name__)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= 60:
+                suppressed = window[2] if window else 0
+                window = self._windows[key] = [now, 0, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+            if window[1] >= self.per_minute:
+                window[2] += 1
+                return False
+            window[1] += 1
+            return True
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves formatting to the listener thread
+
+    The stock prepare() formats the message (and traceback) on the calling
+    thread; here the record is queued as-is, so %-style arguments are only
+    rendered off the request path.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def parse_sample_rates(value: str) -> Dict[str, float]:
+    """Parse "logger=rate,logger=rate" (LOG_SAMPLE_RATES)"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        name, _, rate = item.partition('=')
+        try:
+            rates[name.strip()] = float(rate)
+        except ValueError:
+            continue
+    return rates
+
+
+def configure_logging(
+    level: str = 'INFO',
+    json_format: bool = False,
+    async_handler: bool = True,
+    sample_rates: Optional[Dict[str, float]] = None,
+    rate_limit_per_minute: int = 0
+) -> None:
+    """
+    Install the root handler
+
+    Filters run on the calling thread before anything is queued, so dropped
+    records cost only the level check and the filter itself. With
+    async_handler the stream write happens on a QueueListener thread.
+    """
+    global _listener
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(
+        JsonFormatter() if json_format
+        else logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s')
+    )
+
+    if async_handler:
+        handler = _DeferredQueueHandler(queue.SimpleQueue())
+        if _listener is not None:
+            _listener.stop()
+        _listener = logging.handlers.QueueListener(handler.queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+    else:
+        handler = stream_handler
+
+    if sample_rates:
+        handler.addFilter(SamplingFilter(sample_rates))
+    if rate_limit_per_minute:
+        handler.addFilter(RateLimitFilter(rate_limit_per_minute))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+
+
+def stop_logging() -> None:
+    """Flush queued records; registered to run at exit"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
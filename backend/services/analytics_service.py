@@ -3,21 +3,129 @@ Analytics service for portfolio performance calculations
 """
 from typing import Dict, List, Optional
 from datetime import datetime, timedelta
-from collections import defaultdict
 import logging
 
+from services.metrics import span
+from services.time_index import TimeIndex
+from services.returns import compute_returns
+from services.downsampling import downsample
+
 logger = logging.getLogger(__name__)
 
+DASHBOARD_FIELDS = ('performance', 'history', 'performers')
+
+# Fixed periods of get_performance_by_period(), solved together by get_returns()
+PERFORMANCE_PERIODS = ('1d', '7d', '30d', '90d', '1y', 'all')
+
+# Transaction columns the analytics read
+ANALYTICS_FIELDS = ['symbol', 'type', 'value_usd', 'coins', 'date', 'status']
+
+
+class AnalyticsContext:
+    """
+    Request-scoped snapshot of one user's transactions and priced portfolio
+    
+    All are loaded lazily and at most once, so analytics computed for the same
+    request share one transactions scan, one time index and one price lookup. Transactions are
+    paged in with only the columns analytics read; when only the portfolio is
+    needed the holdings are aggregated without holding the rows in memory.
+    """
+    
+    def __init__(self, transaction_service, user_id: str):
+        self.transaction_service = transaction_service
+        self.user_id = user_id
+        self._transactions = None
+        self._portfolio = None
+        self._time_index = None
+    
+    @property
+    def transactions(self) -> List[Dict]:
+        if self._transactions is None:
+            self._transactions, _ = self.transaction_service.get_transactions(
+                user_id=self.user_id,
+                limit=None,
+                fields=ANALYTICS_FIELDS
+            )
+        return self._transactions
+    
+    @property
+    def portfolio(self) -> Dict:
+        if self._portfolio is None:
+            service = self.transaction_service
+            if self._transactions is not None:
+                self._portfolio = service.summarize_portfolio(self._transactions)
+            else:
+                self._portfolio = service.value_holdings(service.get_holdings(self.user_id))
+        return self._portfolio
+    
+    @property
+    def time_index(self) -> TimeIndex:
+        if self._time_index is None:
+            with span('analytics', 'time_index'):
+                self._time_index = TimeIndex(self.transactions)
+        return self._time_index
+
+
 class AnalyticsService:
     """Service for portfolio analytics and performance metrics"""
     
-    def __init__(self, transaction_service):
+    def __init__(self, transaction_service, result_cache=None, tick_store=None, tick_max_age: float = 3600,
+                 price_ttl: float = 60):
         self.transaction_service = transaction_service
+        # Optional ResultCache; price-dependent results expire with the price cache
+        self.result_cache = result_cache
+        self.price_ttl = price_ttl
+        # Optional TickStore of recorded prices; values period starts at market
+        # prices when every holding has a tick at most tick_max_age seconds old
+        self.tick_store = tick_store
+        self.tick_max_age = tick_max_age
+    
+    def context(self, user_id: str) -> AnalyticsContext:
+        """Create a snapshot to share between several analytics for one request"""
+        return AnalyticsContext(self.transaction_service, user_id)
+    
+    def get_dashboard(
+        self,
+        user_id: str,
+        fields: Optional[List[str]] = None,
+        period: str = 'all',
+        days: int = 30,
+        limit: int = 5,
+        points: Optional[int] = None
+    ) -> Dict:
+        """
+        Compute several analytics from one shared snapshot
+        
+        Args:
+            user_id: User ID
+            fields: Subset of DASHBOARD_FIELDS to compute (default: all)
+            period: Performance period ('1d', '7d', '30d', '90d', '1y', 'all')
+            days: Number of days of history
+            limit: Number of top/bottom performers
+            points: Downsample the history to at most this many points
+        
+        Returns:
+            Dictionary keyed by the requested fields
+        """
+        context = self.context(user_id)
+        fields = fields or DASHBOARD_FIELDS
+        
+        dashboard = {}
+        if 'performance' in fields:
+            dashboard['performance'] = self.get_performance_by_period(user_id, period, context)
+        if 'history' in fields:
+            dashboard['history'] = self.get_portfolio_history(user_id, days, context, points=points)
+        if 'performers' in fields:
+            dashboard['performers'] = self.get_best_worst_performers(user_id, limit, context)
+        return dashboard
     
     def get_performance_by_period(
         self, 
         user_id: str, 
-        period: str = 'all'
+        period: str = 'all',
+        context: Optional[AnalyticsContext] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
     ) -> Dict:
         """
         Calculate portfolio performance for a specific time period
@@ -25,45 +133,64 @@ class AnalyticsService:
         Args:
             user_id: User ID
             period: Time period ('1d', '7d', '30d', '90d', '1y', 'all')
+            context: Optional snapshot shared with other analytics
+            start: Custom range start (overrides period; None: from the first transaction)
+            end: Custom range end (default: now)
         
         Returns:
             Dictionary with performance metrics
         """
+        if start or end:
+            period = 'custom'
+        params = {
+            'period': period,
+            'start': start.isoformat() if start else None,
+            'end': end.isoformat() if end else None
+        }
+        return self._cached(
+            user_id, 'performance', params,
+            lambda: self._compute_performance(user_id, period, context, start, end),
+            ttl=self.price_ttl
+        )
+    
+    def _compute_performance(
+        self,
+        user_id: str,
+        period: str,
+        context: Optional[AnalyticsContext],
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> Dict:
         try:
+            context = context or self.context(user_id)
+            
             # Calculate date range
-            end_date = datetime.now()
-            start_date = self._get_period_start_date(period, end_date)
+            end_date = end or datetime.now()
+            start_date = start if start or end else self._get_period_start_date(period, end_date)
             
-            # Get all transactions
-            all_transactions, _ = self.transaction_service.get_transactions(
-                user_id=user_id, 
-                limit=10000
-            )
+            index = self.time_index(user_id, context)
             
-            # Filter transactions by date range
-            if period != 'all':
-                filtered_transactions = [
-                    tx for tx in all_transactions
-                    if self._is_transaction_in_range(tx, start_date, end_date)
-                ]
+            # Time- and money-weighted returns: the fixed periods share one batched solve
+            if period in PERFORMANCE_PERIODS:
+                returns = self.get_returns(user_id, context)['periods'].get(period, {})
             else:
-                filtered_transactions = all_transactions
+                returns = self._compute_returns(user_id, context, {period: (start_date, end)})[period]
             
-            # Calculate portfolio at start of period
-            start_portfolio = self._calculate_portfolio_at_date(
-                all_transactions, 
-                start_date, 
-                user_id
-            )
+            # Portfolio at start of period and activity within it, by binary search
+            start_portfolio = index.portfolio_at(start_date)
+            activity = index.activity(start_date, end_date)
             
-            # Calculate current portfolio
-            current_portfolio = self.transaction_service.get_coin_wise_details(
-                user_id=user_id
-            )
+            # Portfolio at the end of the period: today's priced portfolio for
+            # open-ended ranges, otherwise the holdings at the custom end
+            if end is not None and end < datetime.now():
+                current_portfolio = index.portfolio_at(end_date)
+                current_value, end_valuation = self._value_at(current_portfolio, end_date)
+            else:
+                current_portfolio = context.portfolio
+                current_value, end_valuation = current_portfolio.get('total_value', 0), 'market'
             
             # Calculate performance metrics
-            start_value = start_portfolio.get('total_value', 0)
-            current_value = current_portfolio.get('total_value', 0)
+            start_value, start_valuation = self._value_at(start_portfolio, start_date)
             start_cost = start_portfolio.get('total_cost', 0)
             current_cost = current_portfolio.get('total_cost', 0)
             
@@ -79,32 +206,28 @@ class AnalyticsService:
                 (total_gain / current_cost * 100) if current_cost > 0 else 0
             )
             
-            # Calculate transactions in period
-            transactions_in_period = len(filtered_transactions)
-            buys_in_period = sum(1 for tx in filtered_transactions if tx.get('type') == 'buy')
-            sells_in_period = sum(1 for tx in filtered_transactions if tx.get('type') == 'sell')
-            
-            # Calculate volume in period
-            volume_in_period = sum(
-                float(tx.get('value_usd', 0)) for tx in filtered_transactions
-            )
-            
             return {
                 'period': period,
                 'start_date': start_date.isoformat() if start_date else None,
                 'end_date': end_date.isoformat(),
                 'start_value': start_value,
+                'start_valuation': start_valuation,
                 'current_value': current_value,
+                'end_valuation': end_valuation,
                 'start_cost': start_cost,
                 'current_cost': current_cost,
                 'period_gain': period_gain,
                 'period_gain_percent': period_gain_percent,
                 'total_gain': total_gain,
                 'total_gain_percent': total_gain_percent,
-                'transactions_count': transactions_in_period,
-                'buys_count': buys_in_period,
-                'sells_count': sells_in_period,
-                'volume': volume_in_period
+                'transactions_count': activity['transactions'],
+                'buys_count': activity['buys'],
+                'sells_count': activity['sells'],
+                'volume': activity['volume'],
+                'net_flow': activity['net_cost'],
+                'twr': returns.get('twr'),
+                'mwr': returns.get('mwr'),
+                'xirr': returns.get('xirr')
             }
             
         except Exception as e:
@@ -114,10 +237,58 @@ class AnalyticsService:
                 'error': str(e)
             }
     
+    def _value_at(self, portfolio: Dict, when: Optional[datetime]) -> tuple:
+        """(value, 'market' or 'cost') of a past portfolio, at recorded prices when there are any"""
+        held = {symbol: h['coins'] for symbol, h in portfolio.get('holdings', {}).items() if h['coins'] > 0}
+        if self.tick_store is not None and when is not None and held:
+            prices = self.tick_store.prices_at(held, when, max_age=self.tick_max_age)
+            if len(prices) == len(held):
+                return sum(coins * prices[symbol] for symbol, coins in held.items()), 'market'
+        return portfolio.get('total_value', 0), 'cost'
+    
+    def get_returns(self, user_id: str, context: Optional[AnalyticsContext] = None) -> Dict:
+        """
+        Time- and money-weighted returns for every fixed period and symbol
+        
+        Args:
+            user_id: User ID
+            context: Optional snapshot shared with other analytics
+        
+        Returns:
+            Dictionary with per-period portfolio and per-symbol TWR, MWR and XIRR
+        """
+        return self._cached(
+            user_id, 'returns', {},
+            lambda: self._returns_response(user_id, context),
+            ttl=self.price_ttl
+        )
+    
+    def _returns_response(self, user_id: str, context: Optional[AnalyticsContext]) -> Dict:
+        try:
+            now = datetime.now()
+            periods = {period: (self._get_period_start_date(period, now), None) for period in PERFORMANCE_PERIODS}
+            return {
+                'as_of': now.isoformat(),
+                'periods': self._compute_returns(user_id, context, periods)
+            }
+        except Exception as e:
+            logger.error(f"Error calculating returns: {e}")
+            return {
+                'periods': {},
+                'error': str(e)
+            }
+    
+    def _compute_returns(self, user_id: str, context: Optional[AnalyticsContext], periods: Dict) -> Dict:
+        """TWR/MWR/XIRR for {name: (start, end)} periods in one batched solve"""
+        index = self.time_index(user_id, context or self.context(user_id))
+        prices = self.transaction_service.get_symbol_prices(index.symbols)
+        return compute_returns(index, periods, prices)
+    
     def get_best_worst_performers(
         self, 
         user_id: str, 
-        limit: int = 5
+        limit: int = 5,
+        context: Optional[AnalyticsContext] = None
     ) -> Dict:
         """
         Get best and worst performing assets
@@ -125,14 +296,20 @@ class AnalyticsService:
         Args:
             user_id: User ID
             limit: Number of top/bottom performers to return
+            context: Optional snapshot shared with other analytics
         
         Returns:
             Dictionary with best and worst performers
         """
+        return self._cached(
+            user_id, 'performers', {'limit': limit},
+            lambda: self._compute_performers(user_id, limit, context),
+            ttl=self.price_ttl
+        )
+    
+    def _compute_performers(self, user_id: str, limit: int, context: Optional[AnalyticsContext]) -> Dict:
         try:
-            portfolio = self.transaction_service.get_coin_wise_details(
-                user_id=user_id
-            )
+            portfolio = (context or self.context(user_id)).portfolio
             
             coins = portfolio.get('coins', {})
             
@@ -172,10 +349,41 @@ class AnalyticsService:
                 'error': str(e)
             }
     
+    def get_pnl(self, user_id: str, method: str = 'fifo') -> Dict:
+        """
+        Realized and unrealized P&L per coin from matched tax lots
+        
+        Args:
+            user_id: User ID
+            method: Lot matching method ('fifo', 'lifo', 'hifo')
+        
+        Returns:
+            Dictionary with per-coin and total P&L
+        """
+        return self._cached(
+            user_id, 'pnl', {'method': method},
+            lambda: self._compute_pnl(user_id, method),
+            ttl=self.price_ttl
+        )
+    
+    def _compute_pnl(self, user_id: str, method: str) -> Dict:
+        try:
+            return self.transaction_service.get_pnl(user_id, method)
+        except Exception as e:
+            logger.error(f"Error calculating P&L: {e}")
+            return {
+                'method': method,
+                'coins': {},
+                'error': str(e)
+            }
+    
     def get_portfolio_history(
         self,
         user_id: str,
-        days: int = 30
+        days: int = 30,
+        context: Optional[AnalyticsContext] = None,
+        points: Optional[int] = None,
+        method: str = 'lttb'
     ) -> List[Dict]:
         """
         Get portfolio value history over time
@@ -183,47 +391,120 @@ class AnalyticsService:
         Args:
             user_id: User ID
             days: Number of days of history to return
+            context: Optional snapshot shared with other analytics
+            points: Downsample to at most this many points (first and last kept)
+            method: Downsampling method, 'lttb' or 'minmax'
         
         Returns:
             List of daily portfolio snapshots
         """
+        # History is cost-based, so only writes and the date change invalidate it.
+        # The full series is cached; downsampling any budget from it is cheap
+        history = self._cached(
+            user_id, 'history', {'days': days, 'as_of': datetime.now().date().isoformat()},
+            lambda: self._compute_history(user_id, days, context)
+        )
+        if points is None or len(history) <= points:
+            return history
+        keep = downsample([point['value'] for point in history], points, method=method)
+        return [history[i] for i in keep]
+    
+    def _compute_history(self, user_id: str, days: int, context: Optional[AnalyticsContext]) -> List[Dict]:
         try:
-            # Get all transactions
-            all_transactions, _ = self.transaction_service.get_transactions(
-                user_id=user_id,
-                limit=10000
-            )
+            index = self.time_index(user_id, context or self.context(user_id))
             
-            # Generate date range
+            # Generate date range, oldest first
             end_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-            dates = []
-            for i in range(days):
-                date = end_date - timedelta(days=i)
-                dates.append(date)
-            dates.reverse()  # Oldest first
+            dates = [end_date - timedelta(days=i) for i in range(days - 1, -1, -1)]
             
-            # Calculate portfolio for each date
-            history = []
-            for date in dates:
-                portfolio = self._calculate_portfolio_at_date(
-                    all_transactions,
-                    date,
-                    user_id
-                )
-                
-                history.append({
-                    'date': date.isoformat(),
-                    'value': portfolio.get('total_value', 0),
-                    'cost': portfolio.get('total_cost', 0),
-                    'gain': portfolio.get('total_value', 0) - portfolio.get('total_cost', 0)
-                })
+            # Cost basis at every date in one search; value is cost until price history exists
+            costs = index.cost_series(dates)
             
-            return history
+            return [
+                {
+                    'date': date.isoformat(),
+                    'value': float(cost),
+                    'cost': float(cost),
+                    'gain': 0.0
+                }
+                for date, cost in zip(dates, costs)
+            ]
             
         except Exception as e:
             logger.error(f"Error getting portfolio history: {e}")
             return []
     
+    def get_rolling_activity(
+        self,
+        user_id: str,
+        days: int = 30,
+        window: int = 7,
+        context: Optional[AnalyticsContext] = None
+    ) -> List[Dict]:
+        """
+        Trailing-window trading activity for each of the last `days` days
+        
+        Args:
+            user_id: User ID
+            days: Number of daily points to return
+            window: Window length in days ending at each point
+            context: Optional snapshot shared with other analytics
+        
+        Returns:
+            List of daily points with transaction counts, volume and net flow
+        """
+        return self._cached(
+            user_id, 'rolling', {'days': days, 'window': window, 'as_of': datetime.now().date().isoformat()},
+            lambda: self._compute_rolling(user_id, days, window, context)
+        )
+    
+    def _compute_rolling(self, user_id: str, days: int, window: int, context: Optional[AnalyticsContext]) -> List[Dict]:
+        try:
+            index = self.time_index(user_id, context or self.context(user_id))
+            
+            # Each point covers the `window` days up to the end of that day
+            today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+            ends = [today - timedelta(days=i) + timedelta(days=1, microseconds=-1) for i in range(days - 1, -1, -1)]
+            window_seconds = timedelta(days=window).total_seconds()
+            activity = index.rolling_activity(ends, window_seconds)
+            
+            return [
+                {
+                    'date': (end - timedelta(days=1, microseconds=-1)).isoformat(),
+                    'transactions': int(activity['transactions'][i]),
+                    'buys': int(activity['buys'][i]),
+                    'sells': int(activity['sells'][i]),
+                    'volume': float(activity['volume'][i]),
+                    'net_flow': float(activity['net_cost'][i])
+                }
+                for i, end in enumerate(ends)
+            ]
+            
+        except Exception as e:
+            logger.error(f"Error getting rolling activity: {e}")
+            return []
+    
+    def time_index(self, user_id: str, context: AnalyticsContext) -> TimeIndex:
+        """
+        The user's time index, shared across requests through the result cache
+        
+        It only depends on the transactions, so writes (which bump the user's
+        data version) are the only thing that invalidates it.
+        """
+        if self.result_cache is None:
+            return context.time_index
+        return self.result_cache.get_or_compute(user_id, 'time_index', {}, lambda: context.time_index)
+    
+    def _cached(self, user_id: str, endpoint: str, params: Dict, compute, ttl: Optional[float] = None):
+        """Serve a result from the result cache when one is configured"""
+        def timed_compute():
+            with span('analytics', endpoint):
+                return compute()
+        
+        if self.result_cache is None:
+            return timed_compute()
+        return self.result_cache.get_or_compute(user_id, endpoint, params, timed_compute, ttl=ttl)
+    
     def _get_period_start_date(self, period: str, end_date: datetime) -> Optional[datetime]:
         """Get start date for a given period"""
         if period == 'all':
@@ -240,112 +521,3 @@ class AnalyticsService:
             return end_date - timedelta(days=365)
         else:
             return None
-    
-    def _is_transaction_in_range(
-        self, 
-        transaction: Dict, 
-        start_date: datetime, 
-        end_date: datetime
-    ) -> bool:
-        """Check if transaction is within date range"""
-        try:
-            tx_date_str = transaction.get('date')
-            if not tx_date_str:
-                return False
-            
-            # Parse date
-            if isinstance(tx_date_str, str):
-                tx_date = datetime.fromisoformat(tx_date_str.replace('Z', '+00:00'))
-            else:
-                return False
-            
-            # Remove timezone for comparison
-            if tx_date.tzinfo:
-                tx_date = tx_date.replace(tzinfo=None)
-            if start_date.tzinfo:
-                start_date = start_date.replace(tzinfo=None)
-            if end_date.tzinfo:
-                end_date = end_date.replace(tzinfo=None)
-            
-            return start_date <= tx_date <= end_date
-        except Exception as e:
-            logger.warning(f"Error parsing transaction date: {e}")
-            return False
-    
-    def _calculate_portfolio_at_date(
-        self,
-        transactions: List[Dict],
-        date: datetime,
-        user_id: str
-    ) -> Dict:
-        """Calculate portfolio state at a specific date"""
-        try:
-            # Filter transactions up to this date
-            portfolio_transactions = [
-                tx for tx in transactions
-                if self._is_transaction_before_date(tx, date)
-            ]
-            
-            # Calculate holdings
-            holdings = defaultdict(lambda: {"coins": 0, "total_value": 0})
-            
-            for tx in portfolio_transactions:
-                if tx.get('status') not in ['active', 'pending']:
-                    continue
-                
-                symbol = tx.get('symbol', '').upper()
-                tx_type = tx.get('type', '').lower()
-                value = float(tx.get('value_usd', 0))
-                coins = float(tx.get('coins', 0))
-                
-                if tx_type == 'buy':
-                    holdings[symbol]["coins"] += coins
-                    holdings[symbol]["total_value"] += value
-                elif tx_type == 'sell':
-                    holdings[symbol]["coins"] -= coins
-                    holdings[symbol]["total_value"] -= value
-            
-            # Calculate totals
-            total_cost = sum(h["total_value"] for h in holdings.values())
-            
-            # For historical value, we'd need historical prices
-            # For now, use cost as value (will be improved with price history)
-            total_value = total_cost
-            
-            return {
-                'total_cost': total_cost,
-                'total_value': total_value,
-                'holdings': dict(holdings)
-            }
-            
-        except Exception as e:
-            logger.error(f"Error calculating portfolio at date: {e}")
-            return {
-                'total_cost': 0,
-                'total_value': 0,
-                'holdings': {}
-            }
-    
-    def _is_transaction_before_date(self, transaction: Dict, date: datetime) -> bool:
-        """Check if transaction occurred before given date"""
-        try:
-            tx_date_str = transaction.get('date')
-            if not tx_date_str:
-                return False
-            
-            if isinstance(tx_date_str, str):
-                tx_date = datetime.fromisoformat(tx_date_str.replace('Z', '+00:00'))
-            else:
-                return False
-            
-            # Remove timezone for comparison
-            if tx_date.tzinfo:
-                tx_date = tx_date.replace(tzinfo=None)
-            if date.tzinfo:
-                date = date.replace(tzinfo=None)
-            
-            return tx_date <= date
-        except Exception as e:
-            logger.warning(f"Error parsing transaction date: {e}")
-            return False
-
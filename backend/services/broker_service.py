@@ -7,9 +7,11 @@ import hashlib
 import base64
 import time
 import secrets
+import urllib.parse
 from typing import List, Dict, Optional
-from datetime import datetime
+from datetime import datetime, timezone
 import logging
+from services.rate_limiter import get_rate_limiter
 
 try:
     import jwt
@@ -32,6 +34,11 @@ class BrokerService:
         self.api_key = api_key
         self.api_secret = api_secret
     
+    @property
+    def account_id(self) -> str:
+        """Stable, non-secret identifier of the connected account"""
+        return _account_fingerprint(self.api_key)
+    
     def authenticate(self) -> bool:
         """Authenticate with broker API"""
         raise NotImplementedError
@@ -58,6 +65,10 @@ class RobinhoodService(BrokerService):
         self.access_token = None
         self.refresh_token = None
     
+    @property
+    def account_id(self) -> str:
+        return _account_fingerprint(self.username)
+    
     def authenticate(self) -> bool:
         """
         Authenticate with Robinhood API
@@ -130,7 +141,7 @@ class RobinhoodService(BrokerService):
                 "external_id": raw_transaction.get("id")
             }
         except Exception as e:
-            logger.error(f"Error normalizing Robinhood transaction: {e}")
+            logger.error("Error normalizing Robinhood transaction: %s", e)
             return None
 
 
@@ -138,16 +149,24 @@ class CoinbaseService(BrokerService):
     """Coinbase Advanced Trade API (v3) integration"""
     
     BASE_URL = "https://api.coinbase.com/api/v3/brokerage"
+    FILLS_PAGE_LIMIT = 250
     
-    def __init__(self, api_key: str = None, api_secret: str = None):
+    def __init__(self, api_key: str = None, api_secret: str = None, base_url: str = None):
         super().__init__(api_key, api_secret)
+        # base_url can point at a local fake server (see devtools/fake_coinbase.py)
+        self.base_url = (base_url or self.BASE_URL).rstrip("/")
+        self.rate_limiter = get_rate_limiter("coinbase")
         if not api_key or not api_secret:
             logger.warning("Coinbase API credentials not provided")
     
-    def _create_jwt_token(self, method: str, path: str, query_string: str = None) -> str:
+    def _create_jwt_token(self, method: str, path: str) -> str:
         """
         Create JWT token for Coinbase CDP API authentication
         Uses ECDSA (ES256) algorithm as required for Advanced Trade API
+        
+        The URI claim covers method, host and path only. Query parameters are
+        not part of the signed URI; including them makes Coinbase reject the
+        token with 401, which is what previously forced client-side filtering.
         """
         if not JWT_AVAILABLE:
             raise Exception("PyJWT and cryptography libraries required for Coinbase CDP API")
@@ -163,24 +182,20 @@ class CoinbaseService(BrokerService):
             raise Exception("Invalid private key format. Must be PEM format.")
         
         # Build URI claim: "METHOD host/full_path"
-        # BASE_URL is "https://api.coinbase.com/api/v3/brokerage"
+        # base_url is "https://api.coinbase.com/api/v3/brokerage"
         # So we need to extract the path part: "/api/v3/brokerage" + path
-        request_host = "api.coinbase.com"
-        # Extract path from BASE_URL (remove protocol and host)
-        base_path = self.BASE_URL.replace("https://", "").replace("http://", "")
-        if base_path.startswith(request_host):
-            base_path = base_path[len(request_host):]
+        parsed_base = urllib.parse.urlparse(self.base_url)
+        request_host = parsed_base.netloc
+        base_path = parsed_base.path
         # Ensure path starts with /
         if not path.startswith("/"):
             path = "/" + path
-        full_path = base_path + path
-        # Include query string in URI claim if present (as per Coinbase docs)
-        if query_string:
-            full_path = f"{full_path}?{query_string}"
+        # Strip any query string: the URI claim is "METHOD host/path" only
+        full_path = base_path + path.split("?", 1)[0]
         uri = f"{method.upper()} {request_host}{full_path}"
         
         # Debug logging
-        logger.debug(f"JWT URI claim: {uri}")
+        logger.debug("JWT URI claim: %s", uri)
         
         # JWT payload according to Coinbase CDP documentation
         now = int(time.time())
@@ -217,54 +232,184 @@ class CoinbaseService(BrokerService):
             raise Exception("Coinbase API credentials not provided")
         
         # Build full URL
-        url = f"{self.BASE_URL}{path}"
+        url = f"{self.base_url}{path}"
         
-        # Build query string for URI claim (include query params if present)
-        # Coinbase requires query params to be included in JWT URI claim
-        query_string = None
-        if params and method.upper() == "GET":
-            import urllib.parse
-            filtered_params = {k: v for k, v in params.items() if v is not None}
-            sorted_params = sorted(filtered_params.items())
-            query_string = urllib.parse.urlencode(sorted_params, doseq=True)
+        # Drop unset params; they are sent as the query string, not signed
+        if params:
+            params = {k: v for k, v in params.items() if v is not None}
         
-        # Create JWT token with query string
-        jwt_token = self._create_jwt_token(method, path, query_string)
+        if method not in ("GET", "POST"):
+            raise ValueError(f"Unsupported HTTP method: {method}")
         
-        # Prepare headers with Bearer token
-        headers = {
-            "Authorization": f"Bearer {jwt_token}",
-            "Content-Type": "application/json"
-        }
+        def send() -> requests.Response:
+            # Sign per attempt: a retry after Retry-After may outlive the 2 minute token
+            jwt_token = self._create_jwt_token(method, path)
+            headers = {
+                "Authorization": f"Bearer {jwt_token}",
+                "Content-Type": "application/json"
+            }
+            if method == "GET":
+                return requests.get(url, headers=headers, params=params, timeout=30)
+            return requests.post(url, headers=headers, json=body, params=params, timeout=30)
         
         # Log request details (without sensitive data)
-        logger.info(f"Making {method} request to {path}")
+        logger.debug("Making %s request to %s", method, path)
         
-        # Make request
+        # Make request, queued on the shared Coinbase limiter (retries 429s)
         try:
-            if method == "GET":
-                response = requests.get(url, headers=headers, params=params, timeout=30)
-            elif method == "POST":
-                response = requests.post(url, headers=headers, json=body, params=params, timeout=30)
-            else:
-                raise ValueError(f"Unsupported HTTP method: {method}")
+            response = self.rate_limiter.request(send)
             
             # Log response status
-            logger.info(f"Coinbase API response: {response.status_code}")
+            logger.debug("Coinbase API response: %s", response.status_code)
             
             # Log error details if request failed
             if response.status_code != 200:
                 try:
                     error_data = response.json()
-                    logger.error(f"Coinbase API error response: {error_data}")
+                    logger.error("Coinbase API error response: %s", error_data)
                 except:
-                    logger.error(f"Coinbase API error response (text): {response.text[:500]}")
+                    logger.error("Coinbase API error response (text): %.500s", response.text)
             
             return response
         except requests.exceptions.RequestException as e:
-            logger.error(f"Request exception: {e}")
+            logger.error("Request exception: %s", e)
             raise Exception(f"Network error connecting to Coinbase API: {str(e)}")
     
+    def _fetch_fills_page(self, params: Dict = None) -> Dict:
+        """Fetch a single page of fills, raising on API errors"""
+        response = self._make_request("GET", "/orders/historical/fills", params=params if params else None)
+        
+        if response.status_code == 401:
+            error_msg = "Coinbase API authentication failed. Please check your API key and secret."
+            try:
+                error_data = response.json()
+                error_msg += f" Details: {error_data.get('message', 'Invalid credentials')}"
+            except:
+                pass
+            logger.error(error_msg)
+            raise Exception(error_msg)
+        elif response.status_code == 403:
+            error_msg = "Coinbase API access forbidden. Check API key permissions."
+            logger.error(error_msg)
+            raise Exception(error_msg)
+        elif response.status_code == 429:
+            error_msg = "Coinbase API rate limit exceeded. Please try again later."
+            logger.error(error_msg)
+            raise Exception(error_msg)
+        elif response.status_code != 200:
+            error_msg = f"Coinbase API error: {response.status_code}"
+            try:
+                error_data = response.json()
+                error_msg += f" - {error_data.get('message', error_data.get('error', 'Unknown error'))}"
+                if 'errors' in error_data:
+                    error_msg += f" Errors: {error_data['errors']}"
+            except:
+                error_msg += f" - {response.text[:200]}"
+            logger.error(error_msg)
+            raise Exception(error_msg)
+        
+        return response.json()
+    
+    def iter_fill_pages(self, cursor: Optional[str] = None, since: Optional[datetime] = None, max_pages: Optional[int] = None):
+        """
+        Yield pages of normalized fills, newest first, for incremental sync
+        
+        Each page is a dict with the normalized 'transactions', the 'cursor' for
+        the next page (None on the last page) and the 'newest_trade_time' seen on
+        the page. `since` is sent as start_sequence_timestamp, so only fills at or
+        after the watermark are transferred.
+        
+        Args:
+            cursor: Cursor to resume from (None starts at the newest fill)
+            since: Watermark; fills strictly older than this are not returned
+            max_pages: Optional cap on the number of pages fetched
+        """
+        if not self.authenticate():
+            raise Exception("Failed to authenticate with Coinbase")
+        
+        page_count = 0
+        while max_pages is None or page_count < max_pages:
+            data = self._fetch_fills_page(self._fill_query_params(cursor, since))
+            fills = data.get("fills", [])
+            
+            # The server already applies start_sequence_timestamp; fills are only
+            # checked one by one if the page's oldest fill predates the watermark
+            reached_since = False
+            if since and fills:
+                oldest = self._parse_trade_time(fills[-1].get("trade_time"))
+                if oldest and oldest < since:
+                    reached_since = True
+                    kept = []
+                    for fill in fills:
+                        trade_time = self._parse_trade_time(fill.get("trade_time"))
+                        if trade_time and trade_time < since:
+                            break
+                        kept.append(fill)
+                    fills = kept
+            
+            # Fills are returned newest first
+            newest_trade_time = self._parse_trade_time(fills[0].get("trade_time")) if fills else None
+            
+            transactions = []
+            for fill in fills:
+                # USD-quoted products only
+                if not fill.get("product_id", "").endswith("-USD"):
+                    continue
+                
+                normalized = self.normalize_transaction(fill)
+                if normalized:
+                    transactions.append(normalized)
+            
+            cursor = None if reached_since or not data.get("fills") else (data.get("cursor") or None)
+            page_count += 1
+            
+            yield {
+                "transactions": transactions,
+                "cursor": cursor,
+                "newest_trade_time": newest_trade_time,
+                "fill_count": len(fills)
+            }
+            
+            if not cursor:
+                break
+    
+    def _fill_query_params(
+        self,
+        cursor: Optional[str] = None,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None
+    ) -> Dict:
+        """Query parameters for the fills endpoint; unset values are dropped by _make_request"""
+        return {
+            "cursor": cursor,
+            "limit": self.FILLS_PAGE_LIMIT,
+            "product_type": "SPOT",
+            "start_sequence_timestamp": self._format_timestamp(start_date),
+            "end_sequence_timestamp": self._format_timestamp(end_date)
+        }
+    
+    @staticmethod
+    def _format_timestamp(value: Optional[datetime]) -> Optional[str]:
+        """Format a datetime as RFC 3339 UTC; naive datetimes are treated as UTC"""
+        if not value:
+            return None
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    
+    @staticmethod
+    def _parse_trade_time(trade_time: Optional[str]) -> Optional[datetime]:
+        """Parse a Coinbase ISO timestamp into an aware datetime"""
+        if not trade_time:
+            return None
+        try:
+            parsed = datetime.fromisoformat(trade_time.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed
+    
     def authenticate(self) -> bool:
         """
         Authenticate with Coinbase API by validating credentials format
@@ -307,7 +452,8 @@ class CoinbaseService(BrokerService):
     def get_transactions(self, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, use_mock_data: bool = False) -> List[Dict]:
         """
         Fetch transactions (fills) from Coinbase Advanced Trade API
-        Handles pagination automatically
+        Handles pagination automatically; the date range and SPOT product type
+        are filtered server-side
         
         Args:
             start_date: Optional start date for filtering
@@ -327,54 +473,12 @@ class CoinbaseService(BrokerService):
         
         try:
             while page_count < max_pages:
-                # Start with minimal params - query params cause 401 errors
-                # We'll fetch all fills and filter client-side if needed
-                params = {}
-                
-                if cursor:
-                    params["cursor"] = cursor
-                
-                # Note: Adding query parameters (limit, product_types, dates) causes 401 errors
-                # This appears to be a JWT URI claim matching issue with query strings
-                # For now, fetch without filters and filter client-side
-                # TODO: Fix JWT URI claim format for query parameters
-                
-                # Make API request without query parameters (except cursor for pagination)
-                response = self._make_request("GET", "/orders/historical/fills", params=params if params else None)
-                
-                if response.status_code == 401:
-                    error_msg = "Coinbase API authentication failed. Please check your API key and secret."
-                    try:
-                        error_data = response.json()
-                        error_msg += f" Details: {error_data.get('message', 'Invalid credentials')}"
-                    except:
-                        pass
-                    logger.error(error_msg)
-                    raise Exception(error_msg)
-                elif response.status_code == 403:
-                    error_msg = "Coinbase API access forbidden. Check API key permissions."
-                    logger.error(error_msg)
-                    raise Exception(error_msg)
-                elif response.status_code == 429:
-                    error_msg = "Coinbase API rate limit exceeded. Please try again later."
-                    logger.error(error_msg)
-                    raise Exception(error_msg)
-                elif response.status_code != 200:
-                    error_msg = f"Coinbase API error: {response.status_code}"
-                    try:
-                        error_data = response.json()
-                        error_msg += f" - {error_data.get('message', error_data.get('error', 'Unknown error'))}"
-                        if 'errors' in error_data:
-                            error_msg += f" Errors: {error_data['errors']}"
-                    except:
-                        error_msg += f" - {response.text[:200]}"
-                    logger.error(error_msg)
-                    raise Exception(error_msg)
-                
-                data = response.json()
+                # Date range, product type and page size are filtered server-side
+                params = self._fill_query_params(cursor, start_date, end_date)
+                data = self._fetch_fills_page(params)
                 fills = data.get("fills", [])
                 
-                logger.info(f"Received {len(fills)} fills from Coinbase API")
+                logger.debug("Received %d fills from Coinbase API", len(fills))
                 
                 if not fills:
                     break
@@ -382,46 +486,12 @@ class CoinbaseService(BrokerService):
                 # Log sample fill for debugging
                 if page_count == 0 and fills:
                     sample_fill = fills[0]
-                    logger.info(f"Sample fill: product_id={sample_fill.get('product_id')}, trade_time={sample_fill.get('trade_time')}")
-                
-                # Filter client-side (since query params cause 401 errors)
-                filtered_fills = []
-                skipped_product_type = 0
-                skipped_date = 0
+                    logger.debug("Sample fill: product_id=%s, trade_time=%s", sample_fill.get('product_id'), sample_fill.get('trade_time'))
                 
+                # Normalize and add transactions (USD-quoted products only)
                 for fill in fills:
-                    # Filter by product type (SPOT only - ends with -USD)
-                    product_id = fill.get("product_id", "")
-                    if not product_id.endswith("-USD"):
-                        skipped_product_type += 1
-                        continue  # Skip non-SPOT products
-                    
-                    # Filter by date range if provided
-                    if start_date or end_date:
-                        try:
-                            trade_time_str = fill.get("trade_time")
-                            if trade_time_str:
-                                # Parse ISO format timestamp
-                                trade_time = datetime.fromisoformat(trade_time_str.replace('Z', '+00:00'))
-                                
-                                # Check date range
-                                if start_date and trade_time < start_date:
-                                    skipped_date += 1
-                                    continue
-                                if end_date and trade_time > end_date:
-                                    skipped_date += 1
-                                    continue
-                        except Exception as e:
-                            logger.warning(f"Error parsing trade_time for fill: {e}")
-                            # Include fill if we can't parse date (better than missing data)
-                    
-                    filtered_fills.append(fill)
-                
-                if page_count == 0:
-                    logger.info(f"Filtered: {len(filtered_fills)}/{len(fills)} fills passed filters (skipped {skipped_product_type} by product type, {skipped_date} by date)")
-                
-                # Normalize and add transactions
-                for fill in filtered_fills:
+                    if not fill.get("product_id", "").endswith("-USD"):
+                        continue
                     normalized = self.normalize_transaction(fill)
                     if normalized:
                         all_transactions.append(normalized)
@@ -432,7 +502,7 @@ class CoinbaseService(BrokerService):
                     break
                 
                 page_count += 1
-                logger.info(f"Fetched page {page_count}, total transactions so far: {len(all_transactions)}")
+                logger.debug("Fetched page %d, total transactions so far: %d", page_count, len(all_transactions))
             
             logger.info(f"Total transactions fetched from Coinbase: {len(all_transactions)}")
             return all_transactions
@@ -539,8 +609,8 @@ class CoinbaseService(BrokerService):
                 "fees": commission
             }
         except Exception as e:
-            logger.error(f"Error normalizing Coinbase transaction: {e}")
-            logger.error(f"Raw transaction data: {raw_transaction}")
+            logger.error("Error normalizing Coinbase transaction: %s", e)
+            logger.debug("Raw transaction data: %s", raw_transaction)
             return None
     
     def _get_mock_transactions(self, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> List[Dict]:
@@ -720,6 +790,13 @@ class CoinbaseService(BrokerService):
         return transactions
 
 
+def _account_fingerprint(identity: Optional[str]) -> str:
+    """Short hash of an account identity (API key, username) safe to store and log"""
+    if not identity:
+        return ''
+    return hashlib.sha256(identity.encode()).hexdigest()[:16]
+
+
 def get_broker_service(broker_name: str, **kwargs) -> Optional[BrokerService]:
     """Factory function to get broker service instance"""
     broker_name = broker_name.lower()
@@ -0,0 +1,104 @@
+"""
+Downsampling of long series to a point budget for charts
+
+Both methods return the indices of the points to keep, always including the
+first and the last point, so callers can slice any parallel columns:
+
+- lttb: Largest-Triangle-Three-Buckets (Steinarsson, 2013). Keeps the visual
+  shape: from each bucket, the point forming the largest triangle with the
+  point kept from the previous bucket and the average of the next bucket.
+- minmax: the lowest and the highest point of each bucket, so spikes and
+  dips survive; a good fit for price series. A budget of 3 leaves room for
+  one inner point only, which LTTB picks instead.
+
+Buckets are laid out as one padded index matrix, so candidate areas and
+extremes come from whole-matrix NumPy operations. LTTB still walks the
+buckets in order, since each choice anchors the next bucket's triangles, but
+each step is a single argmax over precomputed rows.
+"""
+from typing import Optional, Sequence
+
+import numpy as np
+
+METHODS = ('lttb', 'minmax')
+
+
+def downsample(y: Sequence[float], points: int, x: Optional[Sequence[float]] = None, method: str = 'lttb') -> np.ndarray:
+    """
+    Indices of at most `points` points of the series to keep
+
+    Args:
+        y: Values
+        points: Point budget, at least 3 (shorter series are kept whole)
+        x: Positions (default: evenly spaced, e.g. daily points)
+        method: 'lttb' or 'minmax'
+
+    Returns:
+        Increasing indices into y, starting at 0 and ending at len(y) - 1
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown downsampling method: {method}. Use {', '.join(METHODS)}")
+    if points < 3:
+        raise ValueError("points must be at least 3")
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if points >= n:
+        return np.arange(n)
+    x = np.arange(n, dtype=np.float64) if x is None else np.asarray(x, dtype=np.float64)
+    # min/max keeps two points per bucket, so it needs a budget of at least 4
+    if method == 'minmax' and points >= 4:
+        return _minmax(y, points)
+    return _lttb(x, y, points)
+
+
+def _buckets(n: int, count: int):
+    """Index matrix (count x widest bucket) of the inner points 1..n-2 split into count buckets"""
+    bounds = np.floor(np.linspace(1, n - 1, count + 1)).astype(np.int64)
+    starts, ends = bounds[:-1], bounds[1:]
+    width = int((ends - starts).max())
+    matrix = starts[:, None] + np.arange(width)
+    valid = matrix < ends[:, None]
+    # Padding repeats the bucket's first point, which never changes a max/min/argmax
+    return np.where(valid, matrix, starts[:, None]), valid, starts, ends
+
+
+def _lttb(x: np.ndarray, y: np.ndarray, points: int) -> np.ndarray:
+    n = len(y)
+    count = points - 2
+    matrix, valid, starts, ends = _buckets(n, count)
+
+    # Average of each bucket, and the next bucket's average as the third vertex
+    sizes = valid.sum(axis=1)
+    avg_x = np.where(valid, x[matrix], 0).sum(axis=1) / sizes
+    avg_y = np.where(valid, y[matrix], 0).sum(axis=1) / sizes
+    next_x = np.append(avg_x[1:], x[-1])
+    next_y = np.append(avg_y[1:], y[-1])
+    bx, by = x[matrix], y[matrix]
+
+    # Twice the triangle area with anchor a, candidate b and next average c is
+    # |(ax - cx) * (by - ay) - (ax - bx) * (cy - ay)|
+    #   = |(ax - cx) * by + (cy - ay) * bx + (ay * cx - ax * cy)|
+    # so each bucket needs only its anchor's coefficients
+    keep = np.empty(points, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    anchor = 0
+    for bucket in range(count):
+        ax, ay = x[anchor], y[anchor]
+        cx, cy = next_x[bucket], next_y[bucket]
+        areas = np.abs((ax - cx) * by[bucket] + (cy - ay) * bx[bucket] + (ay * cx - ax * cy))
+        anchor = matrix[bucket, np.argmax(areas)]
+        keep[bucket + 1] = anchor
+    return keep
+
+
+def _minmax(y: np.ndarray, points: int) -> np.ndarray:
+    n = len(y)
+    count = (points - 2) // 2
+    matrix, _, _, _ = _buckets(n, count)
+    values = y[matrix]
+    rows = np.arange(count)
+    low = matrix[rows, np.argmin(values, axis=1)]
+    high = matrix[rows, np.argmax(values, axis=1)]
+    # Keep each bucket's pair in time order (a flat bucket keeps one point)
+    inner = np.unique(np.concatenate([low, high]))
+    return np.concatenate([[0], inner, [n - 1]])
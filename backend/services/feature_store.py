@@ -0,0 +1,330 @@
+"""
+Technical indicators per symbol in memory-mapped column files
+
+Each symbol has a directory with one float64 file per column (day, close and
+the indicators in COLUMNS) and meta.json, which holds the row count and the
+running state of every indicator after the last row (plus the state before
+it). Appending a daily bar advances that state in O(1): SMAs and Bollinger
+bands keep running sums and read the close leaving the window from the close
+column, EMAs, MACD and Wilder's RSI are recursive. Values are written to the
+column files before meta.json is atomically replaced, so readers in other
+processes, which map the files read-only and trust only meta.json's row
+count, never see a partial row. Writers serialize on a lock file.
+"""
+from typing import Dict, List, Optional, Tuple
+import json
+import logging
+import math
+import os
+import threading
+
+import numpy as np
+
+from services.ohlc_store import OHLCStore, to_date
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are not serialized across processes
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SMA_WINDOWS = (20, 50, 200)
+EMA_SPANS = (12, 26)
+RSI_PERIOD = 14
+MACD_FAST, MACD_SLOW, MACD_SIGNAL = 12, 26, 9
+BOLLINGER_WINDOW, BOLLINGER_WIDTH = 20, 2.0
+
+COLUMNS = (
+    ('day', 'close')
+    + tuple(f"sma_{n}" for n in SMA_WINDOWS)
+    + tuple(f"ema_{n}" for n in EMA_SPANS)
+    + (f"rsi_{RSI_PERIOD}", 'macd', 'macd_signal', 'macd_hist', 'bb_middle', 'bb_upper', 'bb_lower')
+)
+INDICATORS = COLUMNS[2:]
+
+
+class IndicatorState:
+    """Running state of every indicator; update() consumes one close"""
+
+    def __init__(self, state: Optional[Dict] = None):
+        state = state or {}
+        self.count = state.get('count', 0)
+        self.sums = {int(n): value for n, value in state.get('sums', {}).items()} or {n: 0.0 for n in _sum_windows()}
+        self.band_sum_sq = state.get('band_sum_sq', 0.0)
+        self.emas = {int(n): value for n, value in state.get('emas', {}).items()}
+        self.signal = state.get('signal')
+        self.previous_close = state.get('previous_close')
+        self.avg_gain = state.get('avg_gain', 0.0)
+        self.avg_loss = state.get('avg_loss', 0.0)
+
+    def to_dict(self) -> Dict:
+        return {
+            'count': self.count,
+            'sums': {str(n): value for n, value in self.sums.items()},
+            'band_sum_sq': self.band_sum_sq,
+            'emas': {str(n): value for n, value in self.emas.items()},
+            'signal': self.signal,
+            'previous_close': self.previous_close,
+            'avg_gain': self.avg_gain,
+            'avg_loss': self.avg_loss
+        }
+
+    def update(self, close: float, closes_back) -> Tuple[float, ...]:
+        """
+        Advance by one close; returns the INDICATORS values for it
+
+        closes_back(k) is the close k bars before this one (k <= count), used
+        to drop the close that leaves each window.
+        """
+        count = self.count = self.count + 1
+        nan = math.nan
+
+        # Window sums, then SMA and Bollinger values once a window is full
+        for n in self.sums:
+            self.sums[n] += close - (closes_back(n) if count > n else 0.0)
+        leaving = closes_back(BOLLINGER_WINDOW) if count > BOLLINGER_WINDOW else 0.0
+        self.band_sum_sq += close * close - leaving * leaving
+        smas = [self.sums[n] / n if count >= n else nan for n in SMA_WINDOWS]
+
+        # EMAs seeded with the first close (pandas' ewm(span, adjust=False))
+        for n in set(EMA_SPANS) | {MACD_FAST, MACD_SLOW}:
+            previous = self.emas.get(n)
+            alpha = 2 / (n + 1)
+            self.emas[n] = close if previous is None else previous + alpha * (close - previous)
+        macd = self.emas[MACD_FAST] - self.emas[MACD_SLOW]
+        alpha = 2 / (MACD_SIGNAL + 1)
+        self.signal = macd if self.signal is None else self.signal + alpha * (macd - self.signal)
+
+        # Wilder's RSI: simple averages over the first period, then smoothed
+        rsi = nan
+        if self.previous_close is not None:
+            change = close - self.previous_close
+            gain, loss = max(change, 0.0), max(-change, 0.0)
+            changes = count - 1
+            if changes <= RSI_PERIOD:
+                self.avg_gain += gain / RSI_PERIOD
+                self.avg_loss += loss / RSI_PERIOD
+            else:
+                self.avg_gain += (gain - self.avg_gain) / RSI_PERIOD
+                self.avg_loss += (loss - self.avg_loss) / RSI_PERIOD
+            if changes >= RSI_PERIOD:
+                rsi = 100.0 if self.avg_loss == 0 else 100 - 100 / (1 + self.avg_gain / self.avg_loss)
+        self.previous_close = close
+
+        middle = upper = lower = nan
+        if count >= BOLLINGER_WINDOW:
+            middle = self.sums[BOLLINGER_WINDOW] / BOLLINGER_WINDOW
+            variance = self.band_sum_sq / BOLLINGER_WINDOW - middle * middle
+            width = BOLLINGER_WIDTH * math.sqrt(max(variance, 0.0))
+            upper, lower = middle + width, middle - width
+
+        return (
+            *smas,
+            *(self.emas[n] for n in EMA_SPANS),
+            rsi, macd, self.signal, macd - self.signal,
+            middle, upper, lower
+        )
+
+
+class FeatureStore:
+    """
+    Indicator columns for the symbols of an OHLC store, shared through files
+
+    sync() brings a symbol's columns up to date with the store, appending new
+    bars (and redoing the last one when that day's bar was updated); any
+    other change to the history rebuilds the columns. get() maps the files
+    read-only and can be used by any number of processes.
+    """
+
+    def __init__(self, directory: str, ohlc_store: Optional[OHLCStore] = None):
+        self.directory = directory
+        self.ohlc_store = ohlc_store
+        self._synced: Dict[str, int] = {}  # symbol -> OHLC store version synced from
+        self._maps: Dict[str, Tuple] = {}  # symbol -> (meta mtime, meta, {column: memmap})
+        self._lock = threading.Lock()
+
+    def sync(self, symbol: str) -> int:
+        """Append the store's new bars for a symbol; returns how many rows were written"""
+        symbol = symbol.upper()
+        version = self.ohlc_store.version(symbol)
+        with self._lock:
+            if self._synced.get(symbol) == version:
+                return 0
+            days, bars = self.ohlc_store.column(symbol, 'close')
+            if not len(days):
+                return 0
+            with _FileLock(os.path.join(self._path(symbol), '.lock')):
+                written = self._append(symbol, days, bars)
+            self._synced[symbol] = version
+        if written:
+            logger.info(f"Updated {written} {symbol} indicator rows")
+        return written
+
+    def get(self, symbol: str, columns: Optional[List[str]] = None, days: Optional[int] = None) -> Dict:
+        """
+        The last `days` rows (all by default) of a symbol's indicators
+
+        Returns:
+            Dictionary with 'dates' and 'values' ({column: [...]}, None before
+            an indicator has enough history), or an 'error'
+        """
+        symbol = symbol.upper()
+        columns = list(columns or INDICATORS)
+        unknown = [column for column in columns if column not in COLUMNS]
+        if unknown:
+            return {'error': f"Unknown indicators: {', '.join(unknown)}"}
+        meta, maps = self._open(symbol)
+        size = meta.get('size', 0) if meta else 0
+        start = max(0, size - days) if days else 0
+        return {
+            'symbol': symbol,
+            'rows': size - start,
+            'dates': [to_date(day).isoformat() for day in maps['day'][start:size]] if size else [],
+            'values': {
+                column: [None if value != value else float(value) for value in maps[column][start:size]]
+                if size else []
+                for column in columns
+            }
+        }
+
+    def array(self, symbol: str, column: str) -> np.ndarray:
+        """A column as a read-only array (a view of the mapped file)"""
+        meta, maps = self._open(symbol.upper())
+        if not meta:
+            return np.empty(0)
+        return maps[column][:meta['size']]
+
+    def _append(self, symbol: str, days: np.ndarray, closes: np.ndarray) -> int:
+        meta = _read_meta(self._path(symbol)) or {'size': 0, 'capacity': 0}
+        size = meta['size']
+        maps = self._writable(symbol, meta['capacity'])
+        state = IndicatorState(meta.get('state'))
+        previous_state = meta.get('previous_state')
+
+        start = 0
+        if size:
+            last_day = maps['day'][size - 1]
+            position = int(np.searchsorted(days, last_day))
+            if position != size - 1 or position >= len(days) or days[position] != last_day:
+                logger.info(f"{symbol} history changed, rebuilding indicators")
+                size, state, previous_state = 0, IndicatorState(), None
+            elif closes[position] != maps['close'][size - 1]:
+                # That day's bar was updated: redo it from the state before it
+                size, state = size - 1, IndicatorState(previous_state)
+                start = position
+            else:
+                start = position + 1
+        added = len(days) - start
+        if added <= 0:
+            return 0
+
+        if size + added > meta['capacity']:
+            maps = self._writable(symbol, max(size + added, 2 * meta['capacity'], 1024), keep=size)
+            meta['capacity'] = len(maps['day'])
+
+        close_column = maps['close']
+        rows = np.empty((added, len(COLUMNS)))
+        for i, (day, close) in enumerate(zip(days[start:], closes[start:])):
+            row = size + i
+            close_column[row] = close
+            previous_state = state.to_dict()
+            rows[i, 0], rows[i, 1] = day, close
+            rows[i, 2:] = state.update(float(close), lambda k, row=row: close_column[row - k])
+        for index, column in enumerate(COLUMNS):
+            maps[column][size:size + added] = rows[:, index]
+            maps[column].flush()
+
+        meta.update({
+            'symbol': symbol,
+            'size': size + added,
+            'columns': list(COLUMNS),
+            'state': state.to_dict(),
+            'previous_state': previous_state
+        })
+        _write_meta(self._path(symbol), meta)
+        return added
+
+    def _writable(self, symbol: str, capacity: int, keep: int = 0) -> Dict[str, np.memmap]:
+        """Column files of at least `capacity` rows, grown (keeping `keep` rows) when needed"""
+        path = self._path(symbol)
+        os.makedirs(path, exist_ok=True)
+        maps = {}
+        for column in COLUMNS:
+            file = os.path.join(path, f"{column}.f64")
+            existing = os.path.getsize(file) // 8 if os.path.exists(file) else 0
+            if existing >= max(capacity, 1):
+                maps[column] = np.memmap(file, dtype=np.float64, mode='r+', shape=(existing,))
+                continue
+            # Grow into a new file and swap it in; readers keep their old mapping until meta changes
+            grown = np.memmap(f"{file}.tmp", dtype=np.float64, mode='w+', shape=(max(capacity, 1),))
+            if keep and existing:
+                grown[:keep] = np.memmap(file, dtype=np.float64, mode='r', shape=(existing,))[:keep]
+            grown.flush()
+            os.replace(f"{file}.tmp", file)
+            maps[column] = grown
+        return maps
+
+    def _open(self, symbol: str) -> Tuple[Optional[Dict], Dict[str, np.ndarray]]:
+        """Read-only maps of a symbol's columns, reopened when meta.json changes"""
+        path = self._path(symbol)
+        try:
+            mtime = os.stat(os.path.join(path, 'meta.json')).st_mtime_ns
+        except OSError:
+            return None, {}
+        with self._lock:
+            cached = self._maps.get(symbol)
+            if cached and cached[0] == mtime:
+                return cached[1], cached[2]
+            meta = _read_meta(path)
+            if meta is None:
+                return None, {}
+            maps = {
+                column: np.memmap(os.path.join(path, f"{column}.f64"), dtype=np.float64, mode='r')
+                for column in COLUMNS
+            }
+            self._maps[symbol] = (mtime, meta, maps)
+            return meta, maps
+
+    def _path(self, symbol: str) -> str:
+        return os.path.join(self.directory, symbol)
+
+
+class _FileLock:
+    """Exclusive lock on a file, held across processes (no-op without fcntl)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = open(self.path, 'a')
+        if fcntl:
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
+
+
+def _sum_windows() -> Tuple[int, ...]:
+    return tuple(sorted(set(SMA_WINDOWS) | {BOLLINGER_WINDOW}))
+
+
+def _read_meta(path: str) -> Optional[Dict]:
+    try:
+        with open(os.path.join(path, 'meta.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(path: str, meta: Dict) -> None:
+    """Replace meta.json atomically, so readers see the old or the new row count"""
+    temporary = os.path.join(path, 'meta.json.tmp')
+    with open(temporary, 'w') as f:
+        json.dump(meta, f)
+    os.replace(temporary, os.path.join(path, 'meta.json'))
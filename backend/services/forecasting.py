@@ -0,0 +1,204 @@
+"""
+Next-day forecasters over daily OHLCV bars
+
+Every forecaster is fitted on the bars before a cutoff and predicts its
+target column (the close, or the open for model.pkl) of bar `end` from the
+bars before it, for many ends at once. Bars are the
+open, high, low, close, volume rows of the OHLC store (the column order
+model.pkl was trained on). SeriesWindows holds the bars with the derived
+arrays forecasters share (log returns, sliding windows, running min/max), so
+they are computed once per series rather than per fit or per fold.
+"""
+from typing import Callable, Dict, Optional
+import logging
+import os
+import pickle
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from services.ohlc_store import COLUMNS
+
+logger = logging.getLogger(__name__)
+
+OPEN, CLOSE = COLUMNS.index('open'), COLUMNS.index('close')
+
+# Window length and training cutoff of model.pkl (see prediction_model.py)
+LSTM_WINDOW = 100
+LSTM_TRAINED_UNTIL = '2022-12-01'
+
+
+class SeriesWindows:
+    """Bars of one series and the derived arrays forecasters reuse across fits"""
+
+    def __init__(self, days: np.ndarray, bars: np.ndarray):
+        self.days = days
+        self.bars = np.ascontiguousarray(bars, dtype=np.float64)
+        self.closes = self.bars[:, CLOSE]
+        # returns[t] = log(close[t + 1] / close[t]), the return ending on bar t + 1
+        self.returns = np.diff(np.log(self.closes))
+        self._windows: Dict[int, np.ndarray] = {}
+        self._running: Optional[tuple] = None
+
+    def __len__(self) -> int:
+        return len(self.bars)
+
+    def windows(self, length: int) -> np.ndarray:
+        """windows(length)[i] is bars[i:i + length] (a view, built once per length)"""
+        if length not in self._windows:
+            self._windows[length] = sliding_window_view(self.bars, (length, self.bars.shape[1]))[:, 0]
+        return self._windows[length]
+
+    def range_before(self, end: int) -> tuple:
+        """Per-column (min, max) of bars[:end], from running prefix extremes"""
+        if self._running is None:
+            self._running = (np.minimum.accumulate(self.bars), np.maximum.accumulate(self.bars))
+        return self._running[0][end - 1], self._running[1][end - 1]
+
+
+class Forecaster:
+    """Predicts the `target` column of bar `end` from bars[:end]"""
+
+    name = ''
+    # The column of bar `end` the forecasts are for
+    target = 'close'
+    # Bars needed before the first bar it can forecast
+    min_history = 1
+
+    def fit(self, series: SeriesWindows, train_end: int) -> 'Forecaster':
+        """Fit on bars[:train_end]; forecasters without parameters keep the default"""
+        return self
+
+    def predict(self, series: SeriesWindows, ends: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+
+class NaiveForecaster(Forecaster):
+    """Tomorrow closes where today did (the random-walk forecast)"""
+
+    name = 'naive'
+
+    def predict(self, series: SeriesWindows, ends: np.ndarray) -> np.ndarray:
+        return series.closes[ends - 1]
+
+
+class DriftForecaster(Forecaster):
+    """Random walk with the mean daily log return of the training bars"""
+
+    name = 'drift'
+    min_history = 2
+
+    def __init__(self):
+        self.drift = 0.0
+
+    def fit(self, series: SeriesWindows, train_end: int) -> 'DriftForecaster':
+        returns = series.returns[:train_end - 1]
+        self.drift = float(returns.mean()) if len(returns) else 0.0
+        return self
+
+    def predict(self, series: SeriesWindows, ends: np.ndarray) -> np.ndarray:
+        return series.closes[ends - 1] * np.exp(self.drift)
+
+
+class ARForecaster(Forecaster):
+    """
+    Autoregression of daily log returns on their last `order` values, with an
+    intercept (ARIMA(order, 1, 0) on log closes), fitted by least squares
+    """
+
+    def __init__(self, order: int = 5):
+        self.order = order
+        self.name = f"ar{order}"
+        self.min_history = order + 1
+        self.coefficients = np.zeros(order + 1)
+
+    def fit(self, series: SeriesWindows, train_end: int) -> 'ARForecaster':
+        returns = series.returns[:train_end - 1]
+        if len(returns) <= 2 * self.order:
+            return self
+        # Row k: the `order` returns before returns[k + order], newest first
+        lags = sliding_window_view(returns[:-1], self.order)[:, ::-1]
+        design = np.column_stack([np.ones(len(lags)), lags])
+        self.coefficients = np.linalg.lstsq(design, returns[self.order:], rcond=None)[0]
+        return self
+
+    def predict(self, series: SeriesWindows, ends: np.ndarray) -> np.ndarray:
+        # The returns ending on bars end - 1, end - 2, ... (returns[end - 2] ends on bar end - 1)
+        offsets = np.arange(self.order)
+        lags = series.returns[(ends - 2)[:, None] - offsets]
+        expected = self.coefficients[0] + lags @ self.coefficients[1:]
+        return series.closes[ends - 1] * np.exp(expected)
+
+
+class LSTMForecaster(Forecaster):
+    """
+    The pickled Keras LSTM (model.pkl) over 100-day windows of min-max scaled
+    OHLCV bars
+
+    It was trained to predict the next bar's scaled open with a scaler fitted
+    on the training bars, so fit() only fixes the scaler to bars[:train_end]
+    (no retraining) and the output is unscaled with the open column's range.
+    Loading needs TensorFlow; load errors surface from the first fit().
+    """
+
+    name = 'lstm'
+    target = 'open'
+    min_history = LSTM_WINDOW
+
+    def __init__(self, path: Optional[str] = None, batch_size: int = 256):
+        self.path = path or default_model_path()
+        self.batch_size = batch_size
+        self._model = None
+        self._scaler: Optional[Scaler] = None
+
+    def load(self):
+        """The unpickled Keras model (loaded on first use)"""
+        if self._model is None:
+            with open(self.path, 'rb') as f:
+                self._model = pickle.load(f)
+            logger.info(f"Loaded LSTM model from {self.path}")
+        return self._model
+
+    def fit(self, series: SeriesWindows, train_end: int) -> 'LSTMForecaster':
+        self.load()
+        self._scaler = Scaler(*series.range_before(train_end))
+        return self
+
+    def predict(self, series: SeriesWindows, ends: np.ndarray) -> np.ndarray:
+        return self._scaler.unscale_open(self.predict_scaled(self._scaler.windows(series, ends)))
+
+    def predict_scaled(self, windows: np.ndarray) -> np.ndarray:
+        """One forward pass over scaled windows (n x LSTM_WINDOW x 5); scaled opens"""
+        return self.load().predict(windows, batch_size=self.batch_size, verbose=0).reshape(-1)
+
+
+class Scaler:
+    """Per-column min-max scaling of bars, as sklearn's MinMaxScaler in prediction_model.py"""
+
+    def __init__(self, low: np.ndarray, high: np.ndarray):
+        self.low = low
+        self.span = np.where(high > low, high - low, 1.0)
+
+    def windows(self, series: SeriesWindows, ends: np.ndarray) -> np.ndarray:
+        """Scaled LSTM input windows for forecasting bars `ends`"""
+        return (series.windows(LSTM_WINDOW)[ends - LSTM_WINDOW] - self.low) / self.span
+
+    def unscale_open(self, values: np.ndarray) -> np.ndarray:
+        return values * self.span[OPEN] + self.low[OPEN]
+
+
+def forecasters(model_path: Optional[str] = None) -> Dict[str, Callable[[], Forecaster]]:
+    """Factories of the available forecasters by name"""
+    model_path = model_path or default_model_path()
+    return {
+        'naive': NaiveForecaster,
+        'drift': DriftForecaster,
+        'ar1': lambda: ARForecaster(1),
+        'ar5': lambda: ARForecaster(5),
+        'lstm': lambda: LSTMForecaster(model_path)
+    }
+
+
+def default_model_path() -> str:
+    """model.pkl next to app.py"""
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'model.pkl')
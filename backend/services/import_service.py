@@ -0,0 +1,180 @@
+"""
+Multi-source import: fetch several broker accounts concurrently, then
+dedup and bulk insert their transactions in one merged stage
+"""
+from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+import heapq
+from operator import itemgetter
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class MultiSourceImportService:
+    """Fan-out import across broker accounts with a bounded thread pool"""
+    
+    def __init__(self, transaction_service, sync_service, max_workers: int = 4):
+        self.transaction_service = transaction_service
+        self.sync_service = sync_service
+        self.max_workers = max_workers
+    
+    def import_sources(
+        self,
+        user_id: str,
+        sources: List[Dict],
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        job=None
+    ) -> Dict:
+        """
+        Import transactions from several broker accounts at once
+        
+        Each source is fetched on its own worker: Coinbase accounts without a
+        date range fetch incrementally from their stored watermark, everything
+        else uses get_transactions(). The per-source streams are merged by
+        timestamp so sells are validated against holdings in trade order, then
+        deduplicated and bulk inserted. Watermarks only advance for sources
+        whose transactions all imported.
+        
+        Args:
+            user_id: User ID
+            sources: List of {'broker', 'service', 'label', 'use_mock_data'}
+            start_date: Optional start date for non-incremental fetches
+            end_date: Optional end date for non-incremental fetches
+            job: Optional background Job for progress and cancellation
+        
+        Returns:
+            Dictionary with import totals and per-source throughput
+        """
+        incremental = not start_date and not end_date
+        fetched = []
+        source_reports = []
+        
+        workers = max(1, min(self.max_workers, len(sources)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='import-source') as pool:
+            futures = {
+                pool.submit(self._fetch_source, user_id, source, start_date, end_date, incremental, job): source
+                for source in sources
+            }
+            for future in as_completed(futures):
+                source = futures[future]
+                try:
+                    result = future.result()
+                    fetched.append(result)
+                    source_reports.append(result['report'])
+                except Exception as e:
+                    if job and job.is_cancelled():
+                        raise
+                    logger.error(f"Error fetching from {source['label']}: {e}")
+                    source_reports.append({
+                        'label': source['label'],
+                        'broker': source['broker'],
+                        'error': str(e)
+                    })
+                if job:
+                    job.update_progress(sources_done=len(source_reports), sources_total=len(sources))
+        
+        # One dedup + bulk insert stage over the timestamp-merged streams
+        insert_started = time.perf_counter()
+        known_ids = {}
+        duplicates = {'count': 0}
+        streams = [
+            sorted(((_transaction_epoch(tx), tx) for tx in result['transactions']), key=itemgetter(0))
+            for result in fetched
+        ]
+        merged = (tx for _, tx in heapq.merge(*streams, key=itemgetter(0)))
+        new_transactions = self._dedup(user_id, merged, known_ids, duplicates)
+        insert_result = self.transaction_service.add_transactions_bulk(new_transactions, job=job)
+        insert_seconds = time.perf_counter() - insert_started
+        
+        # Advance watermarks for incremental sources that imported cleanly
+        failed_sources = {error.get('source') for error in insert_result['errors']}
+        for result in fetched:
+            if result['state'] is not None:
+                self.sync_service.commit(result['state'], advance=result['broker'] not in failed_sources)
+        
+        total = sum(len(result['transactions']) for result in fetched)
+        return {
+            "message": f"Imported {insert_result['imported']} transactions from {len(fetched)} of {len(sources)} sources, skipped {duplicates['count']} duplicates",
+            "imported": insert_result['imported'],
+            "skipped": duplicates['count'],
+            "total": total,
+            "errors": insert_result['errors'][:10],  # Limit errors in response
+            "sources": sorted(source_reports, key=lambda report: report['label']),
+            "insert": {
+                "seconds": round(insert_seconds, 3),
+                "transactions_per_second": round(insert_result['imported'] / insert_seconds, 1) if insert_seconds > 0 else None
+            }
+        }
+    
+    def _fetch_source(
+        self,
+        user_id: str,
+        source: Dict,
+        start_date: Optional[datetime],
+        end_date: Optional[datetime],
+        incremental: bool,
+        job=None
+    ) -> Dict:
+        """Fetch one source's normalized transactions and measure throughput"""
+        service = source['service']
+        started = time.perf_counter()
+        state = None
+        pages = None
+        
+        if source.get('use_mock_data'):
+            transactions = service.get_transactions(start_date=start_date, end_date=end_date, use_mock_data=True)
+        elif incremental and hasattr(service, 'iter_fill_pages'):
+            transactions, state, pages = self.sync_service.fetch_new(user_id, source['broker'], service, job=job)
+        else:
+            transactions = service.get_transactions(start_date=start_date, end_date=end_date)
+        
+        seconds = time.perf_counter() - started
+        logger.info(f"Fetched {len(transactions)} transactions from {source['label']} in {seconds:.2f}s")
+        return {
+            'broker': source['broker'],
+            'transactions': transactions,
+            'state': state,
+            'report': {
+                'label': source['label'],
+                'broker': source['broker'],
+                'fetched': len(transactions),
+                'pages': pages,
+                'incremental': state is not None,
+                'seconds': round(seconds, 3),
+                'transactions_per_second': round(len(transactions) / seconds, 1) if seconds > 0 else None
+            }
+        }
+    
+    def _dedup(self, user_id: str, transactions, known_ids: Dict[str, set], duplicates: Dict):
+        """Yield transactions whose (source, external_id) is not yet imported"""
+        for transaction in transactions:
+            transaction['userId'] = user_id
+            source = transaction.get('source')
+            external_id = transaction.get('external_id')
+            if external_id:
+                if source not in known_ids:
+                    known_ids[source] = self.transaction_service.get_external_ids(user_id, source)
+                if external_id in known_ids[source]:
+                    duplicates['count'] += 1
+                    continue
+                known_ids[source].add(external_id)
+            yield transaction
+
+
+def _transaction_epoch(transaction: Dict) -> float:
+    """Sort key for normalized transactions; undated ones sort first"""
+    date = transaction.get('date')
+    if not date:
+        return 0.0
+    try:
+        parsed = datetime.fromisoformat(str(date).replace('Z', '+00:00'))
+    except ValueError:
+        return 0.0
+    # Naive dates (e.g. mock data) are treated as UTC
+    if parsed.tzinfo is None:
+        return (parsed - datetime(1970, 1, 1)).total_seconds()
+    return parsed.timestamp()
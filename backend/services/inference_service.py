@@ -0,0 +1,255 @@
+"""
+Micro-batched model inference for concurrent prediction requests
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from datetime import date, timedelta
+import logging
+import queue
+import threading
+import time
+
+import numpy as np
+
+from services import metrics
+from services.forecasting import LSTM_WINDOW, LSTMForecaster, Scaler, SeriesWindows
+from services.ohlc_store import COLUMNS, OHLCStore, to_date
+
+try:
+    import yfinance
+    YFINANCE_AVAILABLE = True
+except ImportError:
+    YFINANCE_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class _Request:
+    __slots__ = ('inputs', 'key', 'future', 'enqueued')
+
+    def __init__(self, inputs: np.ndarray, key):
+        self.inputs = inputs
+        self.key = key
+        self.future = Future()
+        self.enqueued = time.monotonic()
+
+
+class MicroBatcher:
+    """
+    Runs a batch predict function on one dedicated thread
+
+    Requests queue their input rows; the thread takes the oldest request,
+    keeps collecting until max_batch rows are queued or max_delay has passed
+    since that request arrived, runs one forward pass over all of them and
+    hands each request its slice of the output. Requests with the same key
+    (identical inputs, e.g. every dashboard asking for today's forecast) are
+    computed once per batch. A request larger than max_batch runs on its own.
+    """
+
+    def __init__(self, predict: Callable[[np.ndarray], np.ndarray], name: str = 'model',
+                 max_batch: int = 1024, max_delay: float = 0.01):
+        self.predict = predict
+        self.name = name
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {'requests': 0, 'batches': 0, 'rows': 0, 'deduplicated': 0, 'errors': 0}
+
+    def submit(self, inputs: np.ndarray, key=None) -> Future:
+        """Queue inputs (rows along the first axis); the Future resolves to their outputs"""
+        request = _Request(inputs, key)
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"inference-{self.name}", daemon=True)
+                self._thread.start()
+        self._queue.put(request)
+        return request.future
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats['queued'] = self._queue.qsize()
+        stats['mean_batch_rows'] = stats['rows'] / stats['batches'] if stats['batches'] else 0
+        return stats
+
+    def close(self) -> None:
+        """Stop the thread after the requests already queued"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch, rows = [first], len(first.inputs)
+            deadline = first.enqueued + self.max_delay
+            stopping = False
+            while rows < self.max_batch:
+                try:
+                    request = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if request is _STOP:
+                    stopping = True
+                    break
+                batch.append(request)
+                rows += len(request.inputs)
+            self._execute(batch)
+            if stopping:
+                return
+
+    def _execute(self, batch: List[_Request]) -> None:
+        started = time.monotonic()
+        # One set of rows per distinct key; requests without a key are always distinct
+        unique: Dict = {}
+        for request in batch:
+            unique.setdefault(request.key if request.key is not None else id(request), request)
+        distinct = list(unique.values())
+        try:
+            outputs = self.predict(np.concatenate([request.inputs for request in distinct]))
+        except Exception as e:
+            logger.error(f"Batched {self.name} inference failed: {e}", exc_info=True)
+            for request in batch:
+                request.future.set_exception(e)
+            with self._lock:
+                self._stats['errors'] += 1
+            return
+
+        offsets = np.cumsum([0] + [len(request.inputs) for request in distinct])
+        results = {
+            id(request): outputs[start:end]
+            for request, start, end in zip(distinct, offsets[:-1], offsets[1:])
+        }
+        for request in batch:
+            source = unique[request.key if request.key is not None else id(request)]
+            request.future.set_result(results[id(source)])
+            metrics.INFERENCE_QUEUE_DELAY.observe(started - request.enqueued, model=self.name)
+        metrics.INFERENCE_BATCH_ROWS.observe(int(offsets[-1]), model=self.name)
+        with self._lock:
+            self._stats['requests'] += len(batch)
+            self._stats['batches'] += 1
+            self._stats['rows'] += int(offsets[-1])
+            self._stats['deduplicated'] += len(batch) - len(distinct)
+
+
+class InferenceService:
+    """
+    LSTM price predictions served through a MicroBatcher
+
+    Input bars come from the OHLC store (coin.csv at startup), topped up from
+    yfinance at most every refresh_seconds instead of on every request. The
+    model is unpickled once, on the inference thread. Scaling happens in the
+    request thread (the scaler is fitted on the whole history, like the
+    training data of model.pkl); only the forward pass is batched.
+    """
+
+    def __init__(
+        self,
+        ohlc_store: OHLCStore,
+        forecaster: Optional[LSTMForecaster] = None,
+        symbol: str = 'BTC',
+        yfinance_symbol: Optional[str] = None,
+        refresh_seconds: float = 3600,
+        max_batch: int = 1024,
+        max_delay: float = 0.01,
+        timeout: float = 30
+    ):
+        self.ohlc_store = ohlc_store
+        self.forecaster = forecaster or LSTMForecaster()
+        self.symbol = symbol
+        self.yfinance_symbol = yfinance_symbol
+        self.refresh_seconds = refresh_seconds
+        self.timeout = timeout
+        self.batcher = MicroBatcher(self.forecaster.predict_scaled, name=self.forecaster.name,
+                                    max_batch=max_batch, max_delay=max_delay)
+        self._series: Optional[Tuple[int, SeriesWindows, Scaler]] = None  # (store version, series, scaler)
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+
+    def predict(self, days: int = 100) -> Tuple[Dict, int]:
+        """
+        Model forecasts of the last `days` bars and of the next one
+
+        Returns:
+            Tuple of (result, status_code); result has 'dates' and 'predictions'
+            (the forecast for each date), 'actual' values of the forecast
+            column ('target', the open for model.pkl) where known and 'next'
+            (the forecast for the day after the last bar)
+        """
+        self._refresh_bars()
+        version, series, scaler = self._current_series()
+        if series is None or len(series) < LSTM_WINDOW:
+            return {'error': f"Not enough {self.symbol} price history for predictions"}, 503
+
+        # Forecast bar `end` from bars[:end]; end == len(series) is the next day
+        ends = np.arange(max(LSTM_WINDOW, len(series) - days + 1), len(series) + 1)
+        future = self.batcher.submit(scaler.windows(series, ends), key=(version, int(ends[0])))
+        try:
+            predictions = scaler.unscale_open(future.result(timeout=self.timeout))
+        except FutureTimeout:
+            return {'error': 'Prediction timed out'}, 503
+
+        last = to_date(series.days[-1])
+        target = COLUMNS.index(self.forecaster.target)
+        dates = [to_date(series.days[end - 1]) + timedelta(days=1) for end in ends]
+        return {
+            'symbol': self.symbol,
+            'model': self.forecaster.name,
+            'last_bar': last.isoformat(),
+            'dates': [day.isoformat() for day in dates],
+            'predictions': [float(value) for value in predictions],
+            # model.pkl forecasts the open of each bar, so that is what it is compared with
+            'target': self.forecaster.target,
+            'actual': [float(series.bars[end, target]) if end < len(series) else None for end in ends],
+            'next': {'date': dates[-1].isoformat(), 'price': float(predictions[-1])}
+        }, 200
+
+    def stats(self) -> Dict:
+        return self.batcher.stats()
+
+    def close(self) -> None:
+        self.batcher.close()
+
+    def _current_series(self) -> Tuple[int, Optional[SeriesWindows], Optional[Scaler]]:
+        version = self.ohlc_store.version(self.symbol)
+        with self._lock:
+            if self._series is None or self._series[0] != version:
+                days, bars = self.ohlc_store.bars(self.symbol)
+                if not len(days):
+                    return version, None, None
+                series = SeriesWindows(days, bars)
+                self._series = (version, series, Scaler(*series.range_before(len(series))))
+            return self._series
+
+    def _refresh_bars(self) -> None:
+        """Append recent daily bars from yfinance, at most every refresh_seconds"""
+        if not (YFINANCE_AVAILABLE and self.yfinance_symbol):
+            return
+        with self._lock:
+            if time.monotonic() - self._refreshed_at < self.refresh_seconds and self._refreshed_at:
+                return
+            # Failed downloads wait for the next interval as well
+            self._refreshed_at = time.monotonic()
+        last = self.ohlc_store.last_day(self.symbol)
+        start = last or date.today() - timedelta(days=2 * LSTM_WINDOW)
+        try:
+            frame = yfinance.download(self.yfinance_symbol, start=start.isoformat(), progress=False)
+            if frame is None or frame.empty:
+                return
+            # Newer yfinance versions return one column per ticker under each field
+            bars = np.column_stack([
+                np.asarray(frame[name.title()], dtype=np.float64).reshape(len(frame), -1)[:, 0]
+                for name in COLUMNS
+            ])
+            added = self.ohlc_store.extend(self.symbol, [stamp.date() for stamp in frame.index], bars)
+            logger.info(f"Appended {added} {self.symbol} bars from yfinance")
+        except Exception as e:
+            logger.warning(f"Could not refresh {self.yfinance_symbol} bars from yfinance: {e}")
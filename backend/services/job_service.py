@@ -0,0 +1,180 @@
+"""
+Background job queue for long-running work such as broker imports
+"""
+from typing import Callable, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import threading
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when cancellation has been requested"""
+
+
+class Job:
+    """Handle passed to a job function for progress reporting and cancellation"""
+    
+    def __init__(self, job_id: str, user_id: str, kind: str):
+        self.id = job_id
+        self.user_id = user_id
+        self.kind = kind
+        self.status = 'queued'
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel_event = threading.Event()
+        self._lock = threading.Lock()
+    
+    def update_progress(self, **fields) -> None:
+        """Merge fields into the job's progress"""
+        with self._lock:
+            self.progress.update(fields)
+    
+    def is_cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+    
+    def check_cancelled(self) -> None:
+        """Raise JobCancelled if cancellation was requested; call between units of work"""
+        if self._cancel_event.is_set():
+            raise JobCancelled()
+    
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                'id': self.id,
+                'kind': self.kind,
+                'status': self.status,
+                'progress': dict(self.progress),
+                'result': self.result,
+                'error': self.error,
+                'cancel_requested': self._cancel_event.is_set(),
+                'created_at': _iso(self.created_at),
+                'started_at': _iso(self.started_at),
+                'finished_at': _iso(self.finished_at)
+            }
+
+
+class JobQueue:
+    """
+    In-process job queue backed by a thread pool
+    
+    Job functions take the Job handle and return a (result, status_code) tuple
+    like the other services; a status code >= 400 marks the job as failed.
+    Jobs live in memory, so status polling must reach the same process that
+    accepted the job (the app runs as a single process).
+    """
+    
+    def __init__(self, max_workers: int = 4, max_jobs_per_user: int = 1, retention_seconds: int = 3600):
+        self.max_jobs_per_user = max_jobs_per_user
+        self.retention_seconds = retention_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+    
+    def submit(self, user_id: str, kind: str, fn: Callable[[Job], tuple]) -> tuple:
+        """Queue a job for a user, enforcing the per-user concurrency limit"""
+        with self._lock:
+            self._prune()
+            active = [
+                job for job in self._jobs.values()
+                if job.user_id == user_id and job.status in ACTIVE_STATUSES
+            ]
+            if len(active) >= self.max_jobs_per_user:
+                return {
+                    'error': f'Too many active jobs. Wait for job {active[0].id} to finish or cancel it.',
+                    'active_jobs': [job.id for job in active]
+                }, 429
+            
+            job = Job(uuid.uuid4().hex, user_id, kind)
+            self._jobs[job.id] = job
+        
+        self._executor.submit(self._run, job, fn)
+        logger.info(f"Queued {kind} job {job.id} for user {user_id}")
+        return job.to_dict(), 202
+    
+    def get(self, job_id: str, user_id: Optional[str] = None) -> tuple:
+        """Get a job's status and progress"""
+        job = self._find(job_id, user_id)
+        if not job:
+            return {'error': 'Job not found'}, 404
+        return job.to_dict(), 200
+    
+    def list(self, user_id: str) -> List[Dict]:
+        """List a user's jobs, newest first"""
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if job.user_id == user_id]
+        jobs.sort(key=lambda job: job.created_at, reverse=True)
+        return [job.to_dict() for job in jobs]
+    
+    def cancel(self, job_id: str, user_id: Optional[str] = None) -> tuple:
+        """Request cancellation; a running job stops at its next checkpoint"""
+        job = self._find(job_id, user_id)
+        if not job:
+            return {'error': 'Job not found'}, 404
+        if job.status not in ACTIVE_STATUSES:
+            return {'error': f'Job already {job.status}'}, 409
+        
+        job._cancel_event.set()
+        logger.info(f"Cancellation requested for job {job_id}")
+        return job.to_dict(), 200
+    
+    def _find(self, job_id: str, user_id: Optional[str]) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job and user_id and job.user_id != user_id:
+            return None
+        return job
+    
+    def _run(self, job: Job, fn: Callable[[Job], tuple]) -> None:
+        if job.is_cancelled():
+            self._finish(job, 'cancelled')
+            return
+        
+        with job._lock:
+            job.status = 'running'
+            job.started_at = time.time()
+        
+        try:
+            result, status_code = fn(job)
+            if status_code >= 400:
+                error = result.get('error') if isinstance(result, dict) else str(result)
+                self._finish(job, 'failed', result=result, error=error)
+            else:
+                self._finish(job, 'succeeded', result=result)
+        except JobCancelled:
+            self._finish(job, 'cancelled')
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {e}", exc_info=True)
+            self._finish(job, 'failed', error=str(e))
+    
+    def _finish(self, job: Job, status: str, result=None, error: Optional[str] = None) -> None:
+        with job._lock:
+            job.status = status
+            job.result = result
+            job.error = error
+            job.finished_at = time.time()
+        logger.info(f"Job {job.id} {status}")
+    
+    def _prune(self) -> None:
+        """Drop finished jobs older than the retention window (caller holds the lock)"""
+        cutoff = time.time() - self.retention_seconds
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+def _iso(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat() if timestamp else None
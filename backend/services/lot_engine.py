@@ -0,0 +1,410 @@
+"""
+Tax-lot matching for realized and unrealized P&L
+
+Each buy opens a lot at its cost per coin; each sell consumes open lots of the
+same symbol in the order of the chosen method and realizes proceeds minus the
+cost of the coins it consumed:
+
+    fifo  oldest lot first   (deque, O(1) per lot)
+    lifo  newest lot first   (stack, O(1) per lot)
+    hifo  dearest lot first  (heap,  O(log n) per lot)
+
+Every sell records exactly what it took, so an edit can be applied
+incrementally: the affected symbol's fills after the edit's timestamp are
+undone in reverse, the edited fill is inserted and only those fills are
+replayed.
+"""
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, deque
+import heapq
+import itertools
+import logging
+import threading
+
+from services.metrics import span
+from services.repositories import VISIBLE_STATUSES
+from services.time_index import parse_epochs, to_epoch
+
+logger = logging.getLogger(__name__)
+
+METHODS = ('fifo', 'lifo', 'hifo')
+
+# Transaction columns the engine reads
+LOT_FIELDS = ['id', 'symbol', 'type', 'coins', 'value_usd', 'date', 'status']
+
+# Lots with fewer coins than this left are treated as fully consumed
+EPSILON = 1e-12
+
+# Running totals after a fill: open coins, open cost, realized P&L, proceeds, unmatched coins
+_ZERO = (0.0, 0.0, 0.0, 0.0, 0.0)
+
+_sequence = itertools.count()
+
+
+class Lot:
+    """Coins bought in one transaction that are still held"""
+
+    __slots__ = ('transaction_id', 'epoch', 'coins', 'price', 'removed')
+
+    def __init__(self, transaction_id, epoch: float, coins: float, price: float):
+        self.transaction_id = transaction_id
+        self.epoch = epoch
+        self.coins = coins
+        self.price = price
+        self.removed = False
+
+
+class _Fill:
+    """One transaction as processed by a symbol book, with what it changed"""
+
+    __slots__ = ('key', 'transaction_id', 'type', 'coins', 'value', 'lot', 'matches', 'totals')
+
+    def __init__(self, key: Tuple, transaction_id, tx_type: str, coins: float, value: float):
+        self.key = key
+        self.transaction_id = transaction_id
+        self.type = tx_type
+        self.coins = coins
+        self.value = value
+        self.lot: Optional[Lot] = None
+        # (lot, coins before, emptied) per lot a sell consumed, in order
+        self.matches: List[Tuple[Lot, float, bool]] = []
+        self.totals = _ZERO
+
+
+class _SymbolBook:
+    """Open lots and processed fills of one symbol"""
+
+    def __init__(self, method: str):
+        self.method = method
+        self.fills: List[_Fill] = []
+        self.keys: List[Tuple] = []
+        self.lots = deque() if method == 'fifo' else []
+        self.garbage = 0  # removed lots still in the hifo heap
+
+    @property
+    def totals(self) -> Tuple:
+        return self.fills[-1].totals if self.fills else _ZERO
+
+    def open_lots(self) -> List[Lot]:
+        if self.method == 'hifo':
+            return [entry[-1] for entry in sorted(self.lots) if not entry[-1].removed]
+        return list(self.lots)
+
+    def append(self, fill: _Fill) -> None:
+        """Process a fill later than every fill already in the book"""
+        coins, cost, realized, proceeds, unmatched = self.totals
+        if fill.type == 'buy':
+            fill.lot = None
+            if fill.coins > EPSILON:
+                fill.lot = Lot(fill.transaction_id, fill.key[0], fill.coins, fill.value / fill.coins)
+                self._push(fill.lot)
+                coins += fill.coins
+                cost += fill.value
+        else:
+            matched_cost, remaining = self._match(fill)
+            coins -= fill.coins - remaining
+            cost -= matched_cost
+            # Coins sold beyond the open lots have no known cost: realized at zero basis
+            realized += fill.value - matched_cost
+            proceeds += fill.value
+            unmatched += remaining
+        fill.totals = (coins, cost, realized, proceeds, unmatched)
+        self.fills.append(fill)
+        self.keys.append(fill.key)
+
+    def insert(self, fill: _Fill) -> int:
+        """Add a fill anywhere in time; returns how many fills were (re)processed"""
+        position = bisect_right(self.keys, fill.key)
+        tail = self._rollback(position)
+        self.append(fill)
+        for later in tail:
+            self.append(later)
+        return len(tail) + 1
+
+    def remove(self, key: Tuple) -> int:
+        """Drop the fill with this key; returns how many fills were reprocessed"""
+        position = bisect_left(self.keys, key)
+        if position == len(self.keys) or self.keys[position] != key:
+            return 0
+        tail = self._rollback(position)[1:]
+        for later in tail:
+            self.append(later)
+        return len(tail)
+
+    def _rollback(self, position: int) -> List[_Fill]:
+        """Undo every fill from position on, newest first; returns them oldest first"""
+        tail = self.fills[position:]
+        for fill in reversed(tail):
+            if fill.type == 'buy':
+                if fill.lot is not None:
+                    self._unpush(fill.lot)
+            else:
+                for lot, before, emptied in reversed(fill.matches):
+                    lot.coins = before
+                    if emptied:
+                        self._restore(lot)
+                fill.matches = []
+        del self.fills[position:]
+        del self.keys[position:]
+        return tail
+
+    def _match(self, fill: _Fill) -> Tuple[float, float]:
+        """Consume lots for a sell; returns (cost of the coins matched, coins left unmatched)"""
+        remaining = fill.coins
+        matched_cost = 0.0
+        fill.matches = []
+        while remaining > EPSILON:
+            lot = self._peek()
+            if lot is None:
+                break
+            before = lot.coins
+            if before <= remaining + EPSILON:
+                self._pop()
+                taken = before
+                lot.coins = 0.0
+                fill.matches.append((lot, before, True))
+            else:
+                taken = remaining
+                lot.coins = before - remaining
+                fill.matches.append((lot, before, False))
+            matched_cost += taken * lot.price
+            remaining -= taken
+        return matched_cost, remaining if remaining > 0 else 0.0
+
+    # Lot containers: the next lot to sell is lots[0] (fifo), lots[-1] (lifo) or the heap top (hifo)
+
+    def _push(self, lot: Lot) -> None:
+        if self.method == 'hifo':
+            heapq.heappush(self.lots, (-lot.price, lot.epoch, next(_sequence), lot))
+        else:
+            self.lots.append(lot)
+
+    def _peek(self) -> Optional[Lot]:
+        if not self.lots:
+            return None
+        if self.method == 'fifo':
+            return self.lots[0]
+        if self.method == 'lifo':
+            return self.lots[-1]
+        while self.lots and self.lots[0][-1].removed:
+            heapq.heappop(self.lots)
+            self.garbage -= 1
+        return self.lots[0][-1] if self.lots else None
+
+    def _pop(self) -> None:
+        if self.method == 'fifo':
+            self.lots.popleft()
+        elif self.method == 'lifo':
+            self.lots.pop()
+        else:
+            heapq.heappop(self.lots)
+
+    def _restore(self, lot: Lot) -> None:
+        """Put back a lot an undone sell emptied (it was next in line, so it goes first)"""
+        if self.method == 'fifo':
+            self.lots.appendleft(lot)
+        else:
+            self._push(lot)
+
+    def _unpush(self, lot: Lot) -> None:
+        """Take out an undone buy's lot; once later fills are undone it is the newest lot"""
+        if self.method != 'hifo':
+            self.lots.pop()
+            return
+        # Heap entries can't be removed in place: mark them and compact when half are dead
+        lot.removed = True
+        self.garbage += 1
+        if self.garbage > 64 and self.garbage * 2 > len(self.lots):
+            self.lots = [entry for entry in self.lots if not entry[-1].removed]
+            heapq.heapify(self.lots)
+            self.garbage = 0
+
+
+class LotEngine:
+    """
+    Per-symbol lot books for one user's transactions under one matching method
+
+    Build with load(), then keep current with apply()/remove() as transactions
+    are written; both only reprocess the edited symbol's fills from the edited
+    timestamp on.
+    """
+
+    def __init__(self, method: str = 'fifo'):
+        if method not in METHODS:
+            raise ValueError(f"Unknown lot method: {method}. Use {', '.join(METHODS)}")
+        self.method = method
+        self.books: Dict[str, _SymbolBook] = {}
+        self._fills_by_id: Dict[str, Tuple[str, Tuple]] = {}  # transaction id -> (symbol, key)
+        self.lock = threading.Lock()
+        self.reprocessed = 0
+
+    def load(self, transactions: Iterable[Dict]) -> 'LotEngine':
+        """Process a full set of transactions (any order)"""
+        rows = [
+            transaction for transaction in transactions
+            if transaction.get('status', 'active') in VISIBLE_STATUSES
+        ]
+        by_symbol: Dict[str, List[_Fill]] = {}
+        for transaction, epoch in zip(rows, parse_epochs([row.get('date') for row in rows]).tolist()):
+            parsed = self._parse(transaction, epoch)
+            if parsed:
+                symbol, fill = parsed
+                by_symbol.setdefault(symbol, []).append(fill)
+        for symbol, fills in by_symbol.items():
+            fills.sort(key=lambda fill: fill.key)
+            book = self.books.setdefault(symbol, _SymbolBook(self.method))
+            for fill in fills:
+                book.append(fill)
+                self._fills_by_id[fill.transaction_id] = (symbol, fill.key)
+        return self
+
+    def apply(self, transaction: Dict) -> int:
+        """Add or replace one transaction; returns how many fills were reprocessed"""
+        transaction_id = str(transaction.get('id'))
+        count = self.remove(transaction_id)
+        parsed = self._parse(transaction)
+        if parsed is None:
+            return count
+        symbol, fill = parsed
+        book = self.books.setdefault(symbol, _SymbolBook(self.method))
+        count += book.insert(fill)
+        self._fills_by_id[transaction_id] = (symbol, fill.key)
+        self.reprocessed += count
+        return count
+
+    def remove(self, transaction_id) -> int:
+        """Drop one transaction (e.g. deleted); returns how many fills were reprocessed"""
+        location = self._fills_by_id.pop(str(transaction_id), None)
+        if location is None:
+            return 0
+        symbol, key = location
+        count = self.books[symbol].remove(key)
+        self.reprocessed += count
+        return count
+
+    def open_lots(self, symbol: str) -> List[Dict]:
+        """Remaining lots of a symbol in the order they would be sold"""
+        book = self.books.get(symbol.upper())
+        if book is None:
+            return []
+        return [
+            {'transaction_id': lot.transaction_id, 'coins': lot.coins, 'price': lot.price, 'cost': lot.coins * lot.price}
+            for lot in book.open_lots()
+        ]
+
+    def report(self, prices: Dict[str, float]) -> Dict:
+        """
+        Realized and unrealized P&L per symbol at {symbol: usd} prices
+
+        Cost basis is the cost of the coins still in open lots; unmatched_coins
+        counts coins sold without an open lot to match (realized at zero cost).
+        """
+        coins_report = {}
+        totals = {'cost_basis': 0.0, 'value': 0.0, 'realized_pnl': 0.0, 'unrealized_pnl': 0.0, 'proceeds': 0.0}
+        for symbol, book in sorted(self.books.items()):
+            if not book.fills:
+                continue
+            coins, cost, realized, proceeds, unmatched = book.totals
+            if coins <= EPSILON:
+                coins, cost = 0.0, 0.0
+            price = prices.get(symbol, 0)
+            value = coins * price
+            unrealized = value - cost
+            coins_report[symbol] = {
+                'coins': coins,
+                'cost_basis': cost,
+                'average_cost': cost / coins if coins else 0,
+                'price': price,
+                'value': value,
+                'realized_pnl': realized,
+                'unrealized_pnl': unrealized,
+                'unrealized_pnl_percent': (unrealized / cost * 100) if cost > 0 else 0,
+                'proceeds': proceeds,
+                'open_lots': len(book.lots) - book.garbage,
+                'unmatched_coins': unmatched
+            }
+            totals['cost_basis'] += cost
+            totals['value'] += value
+            totals['realized_pnl'] += realized
+            totals['unrealized_pnl'] += unrealized
+            totals['proceeds'] += proceeds
+        totals['total_pnl'] = totals['realized_pnl'] + totals['unrealized_pnl']
+        return {'method': self.method, 'coins': coins_report, 'totals': totals}
+
+    def _parse(self, transaction: Dict, epoch: Optional[float] = None) -> Optional[Tuple[str, _Fill]]:
+        if transaction.get('status', 'active') not in VISIBLE_STATUSES:
+            return None
+        tx_type = (transaction.get('type') or '').lower()
+        if epoch is None:
+            epoch = to_epoch(transaction.get('date'))
+        # parse_epochs() marks unparseable dates with NaN
+        if tx_type not in ('buy', 'sell') or epoch is None or epoch != epoch:
+            return None
+        transaction_id = str(transaction.get('id'))
+        # Buys before sells at the same instant, then by id for a stable order
+        key = (epoch, 0 if tx_type == 'buy' else 1, transaction_id)
+        fill = _Fill(key, transaction_id, tx_type, float(transaction.get('coins', 0)),
+                     float(transaction.get('value_usd', 0)))
+        return (transaction.get('symbol') or '').upper(), fill
+
+
+class LotBooks:
+    """
+    Bounded LRU of LotEngines per (user, method), kept current by writes
+
+    TransactionService applies each single-transaction write to the user's
+    cached engines incrementally and drops them after bulk writes. Like
+    ResultCache, state is per process.
+    """
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self._engines: OrderedDict = OrderedDict()  # (user_id, method) -> LotEngine
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str, method: str, load: Callable[[], Iterable[Dict]]) -> LotEngine:
+        """The user's engine for a method, built from load() on a miss"""
+        key = (user_id, method)
+        with self._lock:
+            engine = self._engines.get(key)
+            if engine is not None:
+                self._engines.move_to_end(key)
+                return engine
+            generation = self._generations.get(user_id, 0)
+
+        # Includes paging time when load() streams the transactions
+        with span('lot_engine', method):
+            engine = LotEngine(method).load(load())
+
+        with self._lock:
+            # A write landed while loading: serve this engine once but don't keep it
+            if self._generations.get(user_id, 0) == generation:
+                self._engines[key] = engine
+                while len(self._engines) > self.max_entries:
+                    self._engines.popitem(last=False)
+        return engine
+
+    def apply(self, user_id: str, transaction: Dict) -> None:
+        """Apply an added or updated transaction to the user's cached engines"""
+        for engine in self._bump(user_id):
+            with engine.lock:
+                engine.apply(transaction)
+
+    def remove(self, user_id: str, transaction_id) -> None:
+        for engine in self._bump(user_id):
+            with engine.lock:
+                engine.remove(transaction_id)
+
+    def invalidate(self, user_id: str) -> None:
+        """Drop the user's engines (e.g. after a bulk insert); the next read rebuilds them"""
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            for key in [key for key in self._engines if key[0] == user_id]:
+                del self._engines[key]
+
+    def _bump(self, user_id: str) -> List[LotEngine]:
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            return [engine for key, engine in self._engines.items() if key[0] == user_id]
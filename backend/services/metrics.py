@@ -0,0 +1,261 @@
+"""
+Request instrumentation: latency histograms, per-request spans, Prometheus
+text exposition and an opt-in sampling profiler for slow requests
+"""
+from typing import Dict, List, Optional, Tuple
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+import contextvars
+import bisect
+import os
+import sys
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Seconds; roughly Prometheus' defaults, extended down for cache hits
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram with labels, safe across threads"""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...], buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple, List] = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, '')) for name in self.label_names)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(series.items()):
+            labels = _format_labels(zip(self.label_names, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                le = _join_labels(labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            le = _join_labels(labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {values[-1]}")
+            lines.append(f"{self.name}_sum{{{labels}}} {values[-2]:.6f}")
+            lines.append(f"{self.name}_count{{{labels}}} {values[-1]}")
+        return lines
+
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'HTTP request latency', ('endpoint', 'method', 'status')
+)
+SPAN_LATENCY = Histogram(
+    'span_duration_seconds', 'Time spent in instrumented operations', ('span', 'detail')
+)
+INFERENCE_BATCH_ROWS = Histogram(
+    'inference_batch_rows', 'Inputs per batched model forward pass', ('model',),
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048)
+)
+INFERENCE_QUEUE_DELAY = Histogram(
+    'inference_queue_delay_seconds', 'Time a prediction request waits for its batch to start', ('model',)
+)
+
+# Spans recorded during the current request: list of (name, seconds)
+_request_spans: contextvars.ContextVar = contextvars.ContextVar('request_spans', default=None)
+
+
+def begin_request() -> None:
+    """Start collecting spans for the current request"""
+    _request_spans.set([])
+
+
+def end_request() -> List[Tuple[str, float]]:
+    """Stop collecting and return the request's spans"""
+    spans = _request_spans.get() or []
+    _request_spans.set(None)
+    return spans
+
+
+@contextmanager
+def span(name: str, detail: str = ''):
+    """Time a block into the span histogram and the current request's spans"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        SPAN_LATENCY.observe(elapsed, span=name, detail=detail)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((name, elapsed))
+
+
+def server_timing(spans: List[Tuple[str, float]], total: float) -> str:
+    """Server-Timing header value: per-span totals and call counts, in ms"""
+    totals = defaultdict(lambda: [0.0, 0])
+    for name, elapsed in spans:
+        totals[name][0] += elapsed
+        totals[name][1] += 1
+    entries = [
+        f'{name};dur={seconds * 1000:.1f};desc="{count}x"'
+        for name, (seconds, count) in totals.items()
+    ]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ', '.join(entries)
+
+
+def render_metrics(extra: Optional[Dict[str, Dict[str, Dict]]] = None) -> str:
+    """
+    Prometheus text exposition of the histograms plus extra gauges
+
+    extra maps a metric prefix to {label_value: {field: number}}; e.g.
+    {'rate_limiter': {'coinbase': {'throttled': 2}}} renders as
+    rate_limiter_throttled{name="coinbase"} 2.
+    """
+    lines = REQUEST_LATENCY.render() + SPAN_LATENCY.render()
+    lines += INFERENCE_BATCH_ROWS.render() + INFERENCE_QUEUE_DELAY.render()
+    for prefix, groups in (extra or {}).items():
+        fields = sorted({field for values in groups.values() for field, value in values.items() if _is_number(value)})
+        for field in fields:
+            metric = f"{prefix}_{field}"
+            lines.append(f"# TYPE {metric} gauge")
+            for label, values in sorted(groups.items()):
+                value = values.get(field)
+                if _is_number(value):
+                    lines.append(f'{metric}{{name="{_escape(label)}"}} {float(value):g}')
+    return '\n'.join(lines) + '\n'
+
+
+class InstrumentedClient:
+    """
+    Wraps a Supabase client so every query's execute() is recorded as a
+    'supabase' span labelled with the table name
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def table(self, name: str):
+        return _InstrumentedQuery(self._client.table(name), name)
+
+    def __getattr__(self, attr):
+        return getattr(self._client, attr)
+
+
+class _InstrumentedQuery:
+    def __init__(self, builder, table: str):
+        self._builder = builder
+        self._table = table
+
+    def execute(self):
+        with span('supabase', self._table):
+            return self._builder.execute()
+
+    def __getattr__(self, attr):
+        value = getattr(self._builder, attr)
+        if not callable(value):
+            return value
+
+        def chain(*args, **kwargs):
+            result = value(*args, **kwargs)
+            # Builder methods return the next builder in the chain
+            return _InstrumentedQuery(result, self._table) if hasattr(result, 'execute') else result
+        return chain
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of profiled request threads and writes folded stacks
+
+    One sampler thread serves all profiled requests. Output files use the
+    folded format ("frame;frame;frame count") read by flamegraph.pl and
+    speedscope.
+    """
+
+    def __init__(self, output_dir: str, interval: float = 0.005):
+        self.output_dir = output_dir
+        self.interval = interval
+        self._active: Dict[int, Counter] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, thread_id: int) -> None:
+        with self._lock:
+            self._active[thread_id] = Counter()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+                self._thread.start()
+
+    def stop(self, thread_id: int) -> Counter:
+        with self._lock:
+            return self._active.pop(thread_id, Counter())
+
+    def dump(self, stacks: Counter, name: str) -> Optional[str]:
+        """Write folded stacks for one request; returns the file path"""
+        if not stacks:
+            return None
+        os.makedirs(self.output_dir, exist_ok=True)
+        safe_name = ''.join(c if c.isalnum() else '_' for c in name)
+        path = os.path.join(self.output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{safe_name}.folded")
+        with open(path, 'w') as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+                thread_ids = list(self._active)
+            frames = sys._current_frames()
+            for thread_id in thread_ids:
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = _fold(frame)
+                with self._lock:
+                    counter = self._active.get(thread_id)
+                    if counter is not None:
+                        counter[stack] += 1
+            time.sleep(self.interval)
+
+
+def _fold(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def _format_labels(pairs) -> str:
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in pairs)
+
+
+def _join_labels(labels: str, extra: str) -> str:
+    return '{' + (f"{labels},{extra}" if labels else extra) + '}'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
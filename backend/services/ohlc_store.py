@@ -0,0 +1,207 @@
+"""
+Daily OHLC bars per symbol in growable NumPy arrays
+"""
+from typing import Dict, List, Optional, Tuple
+from datetime import date, datetime
+import csv
+import logging
+import os
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EPOCH_DAY = date(1970, 1, 1)
+COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+
+
+class GrowableArray:
+    """Append-only array with amortized O(1) appends (capacity doubles) and cheap truncation"""
+
+    def __init__(self, dtype=np.float64, width: Optional[int] = None, capacity: int = 256):
+        shape = (capacity,) if width is None else (capacity, width)
+        self._data = np.empty(shape, dtype=dtype)
+        self.size = 0
+
+    @property
+    def values(self) -> np.ndarray:
+        """View of the filled part (valid until the next append)"""
+        return self._data[:self.size]
+
+    def extend(self, values) -> None:
+        values = np.asarray(values, dtype=self._data.dtype)
+        needed = self.size + len(values)
+        if needed > len(self._data):
+            capacity = max(needed, 2 * len(self._data))
+            grown = np.empty((capacity,) + self._data.shape[1:], dtype=self._data.dtype)
+            grown[:self.size] = self._data[:self.size]
+            self._data = grown
+        self._data[self.size:needed] = values
+        self.size = needed
+
+    def truncate(self, size: int) -> None:
+        self.size = min(self.size, size)
+
+    def __len__(self) -> int:
+        return self.size
+
+
+class _Series:
+    def __init__(self):
+        self.days = GrowableArray(np.int64)
+        self.bars = GrowableArray(np.float64, width=len(COLUMNS))
+        self.path: Optional[str] = None
+        self.mtime = 0.0
+
+
+class OHLCStore:
+    """
+    Daily bars per symbol, appended in date order
+
+    Series load from CSV files with Date,Open,High,Low,Close[,Adj Close],Volume
+    columns (the yfinance export prediction_model.py writes to coin.csv).
+    refresh() re-reads a file only when it changed and appends the bars after
+    the last one held. Each append bumps version(), which consumers use to
+    update incrementally and to key cached results.
+    """
+
+    def __init__(self):
+        self._series: Dict[str, _Series] = {}
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, spec: str, base_dir: str = '') -> 'OHLCStore':
+        """Build from "BTC=coin.csv,ETH=/data/eth.csv" (relative paths under base_dir)"""
+        store = cls()
+        for entry in spec.split(','):
+            if '=' not in entry:
+                continue
+            symbol, path = (part.strip() for part in entry.split('=', 1))
+            path = path if os.path.isabs(path) else os.path.join(base_dir, path)
+            try:
+                store.load_csv(symbol, path)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not load OHLC data for {symbol} from {path}: {e}")
+        return store
+
+    def load_csv(self, symbol: str, path: str) -> int:
+        """Attach a CSV file to a symbol and append its new bars; returns how many were added"""
+        symbol = symbol.upper()
+        with self._lock:
+            series = self._series.setdefault(symbol, _Series())
+            series.path = path
+            series.mtime = 0.0
+        return self._read(symbol, series)
+
+    def refresh(self) -> int:
+        """Append bars added to any attached file since the last read"""
+        with self._lock:
+            attached = [(symbol, series) for symbol, series in self._series.items() if series.path]
+        added = 0
+        for symbol, series in attached:
+            try:
+                if os.path.getmtime(series.path) != series.mtime:
+                    added += self._read(symbol, series)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not refresh OHLC data for {symbol}: {e}")
+        return added
+
+    def append(self, symbol: str, day, open_: float, high: float, low: float, close: float, volume: float = 0) -> None:
+        """Append one bar; a bar for the last day held replaces it"""
+        self.extend(symbol, [day], [(open_, high, low, close, volume)])
+
+    def extend(self, symbol: str, days: List, bars: List[Tuple]) -> int:
+        """Append bars (oldest first) newer than the last one held; returns how many were added"""
+        symbol = symbol.upper()
+        numbers = np.array([_day_number(day) for day in days], dtype=np.int64)
+        with self._lock:
+            series = self._series.setdefault(symbol, _Series())
+            last = series.days.values[-1] if series.days.size else None
+            if last is not None and len(numbers) and numbers[0] == last:
+                # Same day again: replace the last bar (e.g. today's bar updated)
+                series.days.truncate(series.days.size - 1)
+                series.bars.truncate(series.bars.size - 1)
+                last = series.days.values[-1] if series.days.size else None
+            keep = numbers > last if last is not None else np.ones(len(numbers), dtype=bool)
+            if len(numbers) and np.any(np.diff(numbers[keep]) <= 0):
+                raise ValueError(f"{symbol} bars must be in increasing date order")
+            added = int(keep.sum())
+            if added:
+                series.days.extend(numbers[keep])
+                series.bars.extend(np.asarray(bars, dtype=np.float64).reshape(-1, len(COLUMNS))[keep])
+                self._versions[symbol] = self._versions.get(symbol, 0) + 1
+            return added
+
+    def symbols(self) -> List[str]:
+        with self._lock:
+            return [symbol for symbol, series in self._series.items() if series.days.size]
+
+    def version(self, symbol: Optional[str] = None) -> int:
+        """Appends so far for a symbol (or all symbols)"""
+        with self._lock:
+            if symbol is None:
+                return sum(self._versions.values())
+            return self._versions.get(symbol.upper(), 0)
+
+    def closes(self, symbol: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(days since 1970, closes) for a symbol; copies, safe to keep"""
+        return self.column(symbol, 'close')
+
+    def bars(self, symbol: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(days since 1970, bars x COLUMNS) for a symbol; copies, safe to keep"""
+        with self._lock:
+            series = self._series.get(symbol.upper())
+            if series is None:
+                return np.empty(0, dtype=np.int64), np.empty((0, len(COLUMNS)))
+            return series.days.values.copy(), series.bars.values.copy()
+
+    def column(self, symbol: str, name: str) -> Tuple[np.ndarray, np.ndarray]:
+        index = COLUMNS.index(name)
+        with self._lock:
+            series = self._series.get(symbol.upper())
+            if series is None:
+                return np.empty(0, dtype=np.int64), np.empty(0)
+            return series.days.values.copy(), series.bars.values[:, index].copy()
+
+    def last_day(self, symbol: str) -> Optional[date]:
+        with self._lock:
+            series = self._series.get(symbol.upper())
+            if series is None or not series.days.size:
+                return None
+            return to_date(series.days.values[-1])
+
+    def _read(self, symbol: str, series: _Series) -> int:
+        mtime = os.path.getmtime(series.path)
+        days, bars = [], []
+        with open(series.path, newline='') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                try:
+                    bar = tuple(float(row[name.title()]) for name in COLUMNS)
+                    day = _day_number(row['Date'][:10])
+                except (KeyError, TypeError, ValueError):
+                    continue  # header repeats and blank rows in yfinance exports
+                days.append(day)
+                bars.append(bar)
+        added = self.extend(symbol, days, bars) if days else 0
+        series.mtime = mtime
+        if added:
+            logger.info(f"Loaded {added} {symbol} daily bars from {series.path}")
+        return added
+
+
+def to_date(day_number: int) -> date:
+    return date.fromordinal(EPOCH_DAY.toordinal() + int(day_number))
+
+
+def _day_number(day) -> int:
+    """Days since 1970-01-01 of a date, datetime, ISO string or day number"""
+    if isinstance(day, (int, np.integer)):
+        return int(day)
+    if isinstance(day, str):
+        day = date.fromisoformat(day[:10])
+    if isinstance(day, datetime):
+        day = day.date()
+    return day.toordinal() - EPOCH_DAY.toordinal()
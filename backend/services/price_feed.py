@@ -0,0 +1,188 @@
+"""
+Shared price feed and live portfolio subscriptions for streaming clients
+"""
+from typing import Dict, Iterator, List, Optional
+from collections import defaultdict
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PriceFeed:
+    """
+    One background ticker shared by every streaming connection
+
+    Each tick fetches prices once for the union of symbols held by connected
+    users (through TransactionService's cache and rate limiter) and hands the
+    snapshot to every subscription, so N open dashboards cost one price fetch
+    per tick rather than N. The thread runs only while someone is subscribed.
+    """
+
+    def __init__(self, transaction_service, interval: float = 60):
+        self.transaction_service = transaction_service
+        self.interval = interval
+        self.prices: Dict[str, float] = {}
+        self._subscriptions: Dict[str, set] = defaultdict(set)  # user_id -> subscriptions
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.ticks = 0
+
+    def subscribe(self, user_id: str) -> 'PortfolioSubscription':
+        """Open a live portfolio subscription; close() it when the client leaves"""
+        subscription = PortfolioSubscription(user_id, self)
+        subscription.load()
+        with self._lock:
+            self._subscriptions[user_id].add(subscription)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='price-feed', daemon=True)
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription: 'PortfolioSubscription') -> None:
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def notify_data_changed(self, user_id: str) -> None:
+        """TransactionService change listener: reload that user's open subscriptions"""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(user_id, ()))
+        for subscription in subscriptions:
+            subscription.mark_reload()
+
+    def prices_for(self, symbols: List[str]) -> Dict[str, float]:
+        """Latest snapshot, fetching symbols the feed has not priced yet"""
+        mapping = self.transaction_service.symbol_coin_mapping
+        missing = [symbol for symbol in symbols if mapping.get(symbol, symbol.lower()) not in self.prices]
+        if missing:
+            fetched = self.transaction_service._fetch_prices(missing)
+            with self._lock:
+                self.prices = {**self.prices, **fetched}
+        return self.prices
+
+    def connection_count(self) -> int:
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                subscriptions = [sub for subs in self._subscriptions.values() for sub in subs]
+                if not subscriptions:
+                    self._thread = None
+                    return
+            symbols = sorted({symbol for sub in subscriptions for symbol in sub.symbols})
+            if symbols:
+                try:
+                    prices = self.transaction_service._fetch_prices(symbols)
+                    if prices:
+                        with self._lock:
+                            self.prices = {**self.prices, **prices}
+                        self.ticks += 1
+                        for subscription in subscriptions:
+                            subscription.on_prices(self.prices)
+                except Exception as e:
+                    logger.error(f"Price feed tick failed: {e}")
+            time.sleep(self.interval)
+
+
+class PortfolioSubscription:
+    """
+    One streaming connection's view of a user's portfolio
+
+    Holdings are aggregated once when the subscription opens (and again only
+    after the user's transactions change); price ticks just revalue them.
+    Ticks are coalesced, so a slow client only ever sees the latest prices.
+    """
+
+    def __init__(self, user_id: str, feed: PriceFeed):
+        self.user_id = user_id
+        self.feed = feed
+        self.holdings: Dict[str, Dict] = {}
+        self._sent: Dict[str, Dict] = {}
+        self._pending_prices: Optional[Dict[str, float]] = None
+        self._reload = False
+        self._condition = threading.Condition()
+        self.closed = False
+
+    @property
+    def symbols(self) -> List[str]:
+        return [symbol for symbol, details in self.holdings.items() if details['coins'] > 0]
+
+    def load(self) -> None:
+        """Aggregate the user's holdings (in the database when the backend can)"""
+        self.holdings = self.feed.transaction_service.get_holdings(self.user_id)
+
+    def on_prices(self, prices: Dict[str, float]) -> None:
+        with self._condition:
+            self._pending_prices = prices
+            self._condition.notify()
+
+    def mark_reload(self) -> None:
+        with self._condition:
+            self._reload = True
+            self._condition.notify()
+
+    def close(self) -> None:
+        self.closed = True
+        self.feed.unsubscribe(self)
+        with self._condition:
+            self._condition.notify()
+
+    def snapshot(self) -> Dict:
+        """Full valuation; the first event sent to a client"""
+        summary = self._value(self.feed.prices_for(self.symbols))
+        self._sent = summary['coins']
+        return summary
+
+    def events(self, heartbeat: float = 15) -> Iterator[Optional[Dict]]:
+        """
+        Yield portfolio deltas as prices tick or transactions change
+
+        Each delta holds the totals, the coins whose value changed and the
+        symbols no longer held. None is yielded after `heartbeat` idle seconds
+        so the caller can keep the connection alive.
+        """
+        while not self.closed:
+            with self._condition:
+                if self._pending_prices is None and not self._reload:
+                    self._condition.wait(heartbeat)
+                prices, reload = self._pending_prices, self._reload
+                self._pending_prices, self._reload = None, False
+
+            if self.closed:
+                return
+            if prices is None and not reload:
+                yield None
+                continue
+
+            if reload:
+                self.load()
+            delta = self._diff(self._value(self.feed.prices_for(self.symbols) if reload else prices))
+            if delta:
+                yield delta
+
+    def _value(self, prices: Dict[str, float]) -> Dict:
+        return self.feed.transaction_service.price_holdings(self.holdings, prices)
+
+    def _diff(self, summary: Dict) -> Optional[Dict]:
+        coins = summary['coins']
+        changed = {symbol: data for symbol, data in coins.items() if self._sent.get(symbol) != data}
+        removed = [symbol for symbol in self._sent if symbol not in coins]
+        self._sent = coins
+        if not changed and not removed:
+            return None
+        return {
+            'total_cost': summary['total_cost'],
+            'total_value': summary['total_value'],
+            'gain': summary['gain'],
+            'gain_percent': summary['gain_percent'],
+            'coins': changed,
+            'removed': removed,
+            'timestamp': time.time()
+        }
@@ -0,0 +1,284 @@
+"""
+Monte Carlo projection of a portfolio's value from historical daily returns
+
+Paths are simulated in chunks on a process pool. Each chunk draws the log
+returns of every held symbol for the whole horizon at once, either by
+bootstrapping historical days (all symbols from the same day, which keeps
+their correlation) or from a multivariate normal fitted to them (GBM, one
+draw per interval between checkpoints), and keeps only the portfolio value
+at the requested checkpoint days. A chunk has at most CHUNK_PATHS paths and
+holds at most chunk_bytes of draws at a time (long bootstrap horizons are
+drawn in blocks of days), so memory stays bounded however many paths and
+days are asked for. Every chunk has its own RNG stream spawned from the request's seed, so
+results do not depend on the number of workers.
+"""
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, timedelta
+import logging
+import multiprocessing
+import threading
+
+import numpy as np
+
+from services.metrics import span
+from services.ohlc_store import to_date
+from services.risk_service import RiskService
+
+logger = logging.getLogger(__name__)
+
+METHODS = ('bootstrap', 'gbm')
+PERCENTILES = (5, 25, 50, 75, 95)
+CHUNK_PATHS = 1000
+# Days of draws a path is sized for when splitting paths into chunks; longer
+# bootstrap horizons are drawn in blocks instead of shrinking the chunks
+CHUNK_DAYS = 3650
+
+
+def simulate_chunk(task: Tuple) -> np.ndarray:
+    """
+    Portfolio values of one chunk of paths at the checkpoint days
+
+    Runs in a pool worker, so it takes plain arrays. task is (method, model,
+    values, horizon, checkpoints, paths, seed, chunk_bytes) where model is the
+    days x symbols matrix of historical log returns for 'bootstrap' or their
+    mean and covariance root for 'gbm', and checkpoints are increasing days in
+    1..horizon.
+
+    Returns:
+        paths x len(checkpoints) array
+    """
+    method, model, values, horizon, checkpoints, paths, seed, chunk_bytes = task
+    rng = np.random.default_rng(seed)
+    starts = np.concatenate([[0], checkpoints[:-1]])
+    if method == 'bootstrap':
+        # Sum the resampled days between consecutive checkpoints, a block of
+        # days at a time so the draws never exceed chunk_bytes
+        symbols = model.shape[1]
+        block = max(1, chunk_bytes // (paths * symbols * 8))
+        steps = np.zeros((paths, len(checkpoints), symbols))
+        for first in range(0, checkpoints[-1], block):
+            last = min(first + block, checkpoints[-1])
+            draws = model[rng.integers(0, len(model), size=(paths, last - first))]
+            # Checkpoint interval of each day in the block, and where it changes
+            intervals = np.searchsorted(checkpoints, np.arange(first, last), side='right')
+            cuts = np.concatenate([[0], np.flatnonzero(np.diff(intervals)) + 1])
+            # Intervals of a block are consecutive, so they are a slice of steps
+            steps[:, intervals[0]:intervals[-1] + 1] += np.add.reduceat(draws, cuts, axis=1)
+    else:
+        # Normal log returns summed over n days are normal with n times the mean
+        # and covariance, so only one draw per checkpoint interval is needed
+        mean, root = model
+        lengths = (checkpoints - starts)[:, None]
+        steps = rng.standard_normal((paths, len(checkpoints), len(mean))) @ root.T
+        steps *= np.sqrt(lengths)
+        steps += mean * lengths
+    # Buy and hold: each symbol compounds on its own
+    return np.exp(np.cumsum(steps, axis=1)) @ values
+
+
+class ProjectionService:
+    """
+    Percentile bands of a user's current holdings over a future horizon
+
+    Holdings and their price history come from the RiskService, so the
+    projection covers the same symbols (and reports the same coverage) as
+    /api/analytics/risk. Results are cached like risk results, per seed.
+    """
+
+    def __init__(
+        self,
+        risk_service: RiskService,
+        result_cache=None,
+        workers: int = 1,
+        chunk_bytes: int = 32 * 1024 * 1024,
+        max_paths: int = 20000,
+        max_days: int = 3650,
+        price_ttl: float = 60
+    ):
+        self.risk_service = risk_service
+        self.result_cache = result_cache
+        self.workers = max(1, workers)
+        self.chunk_bytes = chunk_bytes
+        self.max_paths = max_paths
+        self.max_days = max_days
+        # Cached results expire with the price cache, like risk results
+        self.price_ttl = price_ttl
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+
+    def get_projection(
+        self,
+        user_id: str,
+        paths: int = 5000,
+        horizon: int = 365,
+        method: str = 'bootstrap',
+        lookback: int = 730,
+        points: int = 30,
+        seed: int = 0
+    ) -> Dict:
+        """
+        Simulate future values of the user's holdings
+
+        Args:
+            user_id: User ID
+            paths: Number of simulated paths (at most max_paths)
+            horizon: Days ahead (at most max_days)
+            method: 'bootstrap' (resample historical days) or 'gbm'
+            lookback: Days of history the returns are drawn from or fitted to
+            points: Number of checkpoint days in the bands
+            seed: Seed of the random streams; equal seeds give equal results
+
+        Returns:
+            Dictionary with the starting value, percentile bands per checkpoint
+            and the distribution of the final value
+        """
+        store = self.risk_service.ohlc_store
+        store.refresh()
+        paths = min(paths, self.max_paths)
+        horizon = min(horizon, self.max_days)
+        params = {
+            'paths': paths, 'horizon': horizon, 'method': method, 'lookback': lookback,
+            'points': points, 'seed': seed,
+            'date': date.today().isoformat(), 'bars': store.version()
+        }
+        compute = lambda: self._compute_projection(user_id, paths, horizon, method, lookback, points, seed)
+        if self.result_cache is None:
+            return compute()
+        return self.result_cache.get_or_compute(
+            user_id, 'projection', params, compute, ttl=self.price_ttl
+        )
+
+    def simulate(
+        self,
+        log_returns: np.ndarray,
+        values: np.ndarray,
+        paths: int,
+        horizon: int,
+        checkpoints: np.ndarray,
+        method: str = 'bootstrap',
+        seed: int = 0
+    ) -> np.ndarray:
+        """
+        Portfolio values (paths x checkpoints) of holdings worth `values` today
+
+        log_returns is the days x symbols matrix of historical daily log
+        returns. Chunks run on the process pool when there is more than one
+        worker, in the calling process otherwise.
+        """
+        if method == 'bootstrap':
+            model = log_returns
+        else:
+            model = (log_returns.mean(axis=0), _covariance_root(log_returns))
+        steps = checkpoints[-1] if method == 'bootstrap' else len(checkpoints)
+        sizes = self._chunk_sizes(paths, steps, len(values))
+        seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+        tasks = [
+            (method, model, values, horizon, checkpoints, size, child, self.chunk_bytes)
+            for size, child in zip(sizes, seeds)
+        ]
+        if self.workers > 1 and len(tasks) > 1:
+            try:
+                return np.concatenate(list(self._executor().map(simulate_chunk, tasks)))
+            except BrokenProcessPool as e:
+                logger.error(f"Projection worker pool failed, simulating in process: {e}")
+                self._reset_pool()
+        return np.concatenate([simulate_chunk(task) for task in tasks])
+
+    def close(self) -> None:
+        self._reset_pool()
+
+    def _compute_projection(
+        self, user_id: str, paths: int, horizon: int, method: str, lookback: int, points: int, seed: int
+    ) -> Dict:
+        try:
+            with span('projection', method):
+                holdings = self.risk_service.holdings_history(user_id)
+                stats, values = holdings['stats'], holdings['values']
+                total_value, covered_value = holdings['total_value'], holdings['covered_value']
+                result = {
+                    'method': method,
+                    'paths': paths,
+                    'horizon': horizon,
+                    'seed': seed,
+                    'start_value': covered_value,
+                    'coverage': covered_value / total_value if total_value > 0 else 0,
+                    'missing': sorted(symbol for symbol in holdings['coins'] if symbol not in stats),
+                    'percentiles': list(PERCENTILES),
+                    'history': None,
+                    'bands': [],
+                    'final': None
+                }
+                if not stats or covered_value <= 0:
+                    return result
+
+                symbols = holdings['symbols']
+                days, matrix = holdings['days'][-lookback:], holdings['returns'][:, -lookback:]
+                if len(days) < 2:
+                    return result
+                log_returns = np.log1p(np.maximum(matrix.T, -0.999999))
+                result['history'] = {
+                    'days': len(days),
+                    'start_date': to_date(days[0]).isoformat(),
+                    'end_date': to_date(days[-1]).isoformat()
+                }
+
+                checkpoints = np.unique(np.linspace(1, horizon, min(points, horizon)).round().astype(np.int64))
+                current = np.array([values[symbol] for symbol in symbols])
+                simulated = self.simulate(log_returns, current, paths, horizon, checkpoints, method, seed)
+
+                bands = np.percentile(simulated, PERCENTILES, axis=0)
+                today = date.today()
+                result['bands'] = [
+                    {
+                        'day': int(day),
+                        'date': (today + timedelta(days=int(day))).isoformat(),
+                        **{f"p{q}": float(bands[i, k]) for i, q in enumerate(PERCENTILES)}
+                    }
+                    for k, day in enumerate(checkpoints)
+                ]
+                final = simulated[:, -1]
+                result['final'] = {
+                    'mean': float(final.mean()),
+                    **{f"p{q}": float(bands[i, -1]) for i, q in enumerate(PERCENTILES)},
+                    'probability_of_loss': float((final < covered_value).mean())
+                }
+                return result
+        except Exception as e:
+            logger.error(f"Error projecting portfolio: {e}", exc_info=True)
+            return {'error': str(e)}
+
+    def _chunk_sizes(self, paths: int, steps: int, symbols: int) -> List[int]:
+        """Split paths so one chunk's draws fit chunk_bytes (independently of the worker count)"""
+        per_path = max(1, min(steps, CHUNK_DAYS) * symbols * 8)
+        size = max(1, min(self.chunk_bytes // per_path, CHUNK_PATHS))
+        return [min(size, paths - start) for start in range(0, paths, size)]
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                # Workers only run simulate_chunk; forking avoids re-importing the app
+                # in every worker (spawn would re-run app.py as __mp_main__)
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+                logger.info(f"Started projection pool with {self.workers} workers")
+            return self._pool
+
+    def _reset_pool(self) -> None:
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _covariance_root(log_returns: np.ndarray) -> np.ndarray:
+    """A matrix R with R @ R.T equal to the covariance (Cholesky, or eigen for singular ones)"""
+    covariance = np.atleast_2d(np.cov(log_returns, rowvar=False))
+    try:
+        return np.linalg.cholesky(covariance)
+    except np.linalg.LinAlgError:
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+        return eigenvectors * np.sqrt(np.maximum(eigenvalues, 0))
+
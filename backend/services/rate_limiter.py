@@ -0,0 +1,177 @@
+"""
+Shared token-bucket rate limiting for upstream APIs (CoinGecko, Coinbase)
+"""
+from typing import Callable, Dict, Optional
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import threading
+import time
+import logging
+
+from services.metrics import span
+
+logger = logging.getLogger(__name__)
+
+# Known quotas, used until configure_rate_limiter() is called from app config.
+# CoinGecko's public API allows roughly 10-30 calls/minute; Coinbase Advanced
+# Trade private endpoints allow 30 requests/second per key.
+UPSTREAM_DEFAULTS = {
+    'coingecko': {'rate': 10 / 60, 'burst': 3},
+    'coinbase': {'rate': 10.0, 'burst': 10},
+}
+
+
+class RateLimitTimeout(Exception):
+    """Raised when waiting for a rate limit token would exceed max_wait"""
+
+
+class TokenBucket:
+    """
+    Token bucket shared by every caller of one upstream
+
+    The fill rate starts at the configured quota. A 429 halves it (down to
+    min_rate) and blocks the bucket until Retry-After has passed; each
+    successful call then restores a fraction of the quota.
+    """
+
+    def __init__(self, name: str, rate: float, burst: int, min_rate: Optional[float] = None, recovery: float = 0.05):
+        self.name = name
+        self.base_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate or rate / 8
+        self.recovery = recovery
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+        self._stats = {
+            'calls': 0,
+            'waited_calls': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+            'throttled': 0,
+            'timeouts': 0
+        }
+
+    def acquire(self, max_wait: Optional[float] = None) -> float:
+        """Block until a token is available; returns the seconds spent waiting"""
+        started = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    waited = now - started
+                    self._record_wait(waited)
+                    return waited
+                delay = max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+
+            if max_wait is not None and (now - started) + delay > max_wait:
+                with self._lock:
+                    self._stats['timeouts'] += 1
+                raise RateLimitTimeout(f"{self.name} rate limit: queue wait would exceed {max_wait}s")
+            time.sleep(delay)
+
+    def on_throttled(self, retry_after: Optional[float] = None) -> None:
+        """Tighten after a 429: halve the rate and pause until Retry-After"""
+        with self._lock:
+            now = time.monotonic()
+            self.rate = max(self.min_rate, self.rate / 2)
+            pause = retry_after if retry_after is not None else 1 / self.rate
+            self.blocked_until = max(self.blocked_until, now + pause)
+            self.tokens = 0.0
+            self.updated = self.blocked_until
+            self._stats['throttled'] += 1
+        logger.warning(f"{self.name} throttled (429); rate now {self.rate:.3f}/s, paused {pause:.1f}s")
+
+    def on_success(self) -> None:
+        """Gradually restore the configured rate after throttling"""
+        if self.rate < self.base_rate:
+            with self._lock:
+                self.rate = min(self.base_rate, self.rate + self.base_rate * self.recovery)
+
+    def request(self, send: Callable, max_retries: int = 3, max_wait: Optional[float] = None):
+        """
+        Run `send` (returning a requests.Response) under the rate limit
+
+        429 responses adapt the bucket and are retried after Retry-After, up to
+        max_retries; the last response is returned if they keep failing.
+        """
+        response = None
+        for attempt in range(max_retries + 1):
+            with span('rate_limit_wait', self.name):
+                self.acquire(max_wait)
+            with span('upstream', self.name):
+                response = send()
+            if response.status_code != 429:
+                self.on_success()
+                return response
+            self.on_throttled(_retry_after_seconds(response.headers.get('Retry-After')))
+        return response
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                **self._stats,
+                'rate_per_second': self.rate,
+                'base_rate_per_second': self.base_rate,
+                'avg_wait_seconds': (
+                    self._stats['wait_seconds_total'] / self._stats['calls'] if self._stats['calls'] else 0
+                )
+            }
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def _record_wait(self, waited: float) -> None:
+        self._stats['calls'] += 1
+        if waited > 0.001:
+            self._stats['waited_calls'] += 1
+        self._stats['wait_seconds_total'] += waited
+        self._stats['wait_seconds_max'] = max(self._stats['wait_seconds_max'], waited)
+
+
+_limiters: Dict[str, TokenBucket] = {}
+_registry_lock = threading.Lock()
+
+
+def configure_rate_limiter(name: str, rate: float, burst: int, min_rate: Optional[float] = None) -> TokenBucket:
+    """Create (or replace) the shared limiter for an upstream"""
+    with _registry_lock:
+        _limiters[name] = TokenBucket(name, rate, burst, min_rate)
+        return _limiters[name]
+
+
+def get_rate_limiter(name: str) -> TokenBucket:
+    """Get the shared limiter for an upstream, creating it from known quotas"""
+    with _registry_lock:
+        if name not in _limiters:
+            defaults = UPSTREAM_DEFAULTS.get(name, {'rate': 1.0, 'burst': 1})
+            _limiters[name] = TokenBucket(name, defaults['rate'], defaults['burst'])
+        return _limiters[name]
+
+
+def rate_limiter_stats() -> Dict[str, Dict]:
+    """Wait time and throttling metrics for every upstream"""
+    with _registry_lock:
+        limiters = dict(_limiters)
+    return {name: limiter.stats() for name, limiter in limiters.items()}
+
+
+def _retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header (delta seconds or HTTP date)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
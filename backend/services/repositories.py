@@ -0,0 +1,544 @@
+"""
+Storage backends for TransactionService
+
+SupabaseTransactionRepository goes through PostgREST (supabase-py), as the
+service always has. PostgresTransactionRepository talks to the database
+directly over a bounded psycopg2 pool and aggregates holdings server-side with
+GROUP BY; SQLiteTransactionRepository runs the same SQL against a local file
+or :memory: database for tests and benchmarks.
+"""
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from decimal import Decimal
+import sqlite3
+import threading
+import time
+import uuid
+import logging
+
+from services.metrics import span
+
+try:
+    from psycopg2 import pool as psycopg2_pool
+    from psycopg2.extras import RealDictCursor, execute_values
+    PSYCOPG2_AVAILABLE = True
+except ImportError:
+    PSYCOPG2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Columns of the transactions table (supabase_schema.sql)
+TRANSACTION_COLUMNS = (
+    'id', 'name', 'symbol', 'type', 'value_usd', 'purchased_price', 'coins', 'date',
+    'status', 'created_by', 'user_id', 'source', 'external_id', 'created_at', 'updated_at'
+)
+VISIBLE_STATUSES = ('active', 'pending')
+# PostgREST's default db-max-rows: larger selects are cut short without an error
+POSTGREST_MAX_ROWS = 1000
+
+
+class PoolTimeout(Exception):
+    """Raised when no database connection frees up within the pool timeout"""
+
+
+class TransactionRepository:
+    """
+    Transaction storage used by TransactionService
+
+    Reads only see active/pending rows. Rows are returned as dicts with
+    JSON-friendly values (ISO date strings, float amounts, string ids).
+    """
+
+    # Most rows one select can return (None: no server-side cap)
+    max_rows: Optional[int] = None
+
+    def insert(self, row: Dict) -> Optional[Dict]:
+        """Insert one prepared row; returns the stored row (with its id)"""
+        raise NotImplementedError
+
+    def insert_many(self, rows: List[Dict]) -> int:
+        """Insert prepared rows in one round trip; returns the number stored"""
+        raise NotImplementedError
+
+    def get(self, transaction_id: str) -> Optional[Dict]:
+        """Any row by id, whatever its status"""
+        raise NotImplementedError
+
+    def update(self, transaction_id: str, values: Dict) -> None:
+        raise NotImplementedError
+
+    def page(self, user_id: Optional[str], columns: Optional[List[str]], after: Optional[tuple], limit: int) -> List[Dict]:
+        """Rows newest first by (date, id), strictly after the (date, id) keyset"""
+        raise NotImplementedError
+
+    def external_ids(self, user_id: str, source: str) -> set:
+        raise NotImplementedError
+
+    def holdings(self, user_id: str, symbol: str, exclude_id: Optional[str] = None) -> Dict:
+        """Net {'coins', 'total_value'} for one symbol"""
+        raise NotImplementedError
+
+    def aggregate_holdings(self, user_id: Optional[str]) -> Optional[Dict[str, Dict]]:
+        """
+        Net {'coins', 'total_value'} per symbol computed by the database
+
+        Returns None when the backend cannot aggregate server-side; the
+        service then folds streamed rows itself.
+        """
+        return None
+
+    def stats(self) -> Dict:
+        return {}
+
+
+class SupabaseTransactionRepository(TransactionRepository):
+    """
+    PostgREST access through supabase-py
+
+    Holdings come from the get_user_holdings() function in
+    supabase_schema.sql (one row per symbol). On a database that does not have
+    it yet, the repository falls back to fetching the rows and summing them here.
+    """
+
+    HOLDINGS_RPC = 'get_user_holdings'
+
+    def __init__(self, client, max_rows: int = POSTGREST_MAX_ROWS):
+        self.db = client
+        self.max_rows = max_rows
+        self.rpc_available = True
+
+    def insert(self, row: Dict) -> Optional[Dict]:
+        result = self.db.table('transactions').insert(row).execute()
+        return result.data[0] if result.data else None
+
+    def insert_many(self, rows: List[Dict]) -> int:
+        result = self.db.table('transactions').insert(rows).execute()
+        return len(result.data or [])
+
+    def get(self, transaction_id: str) -> Optional[Dict]:
+        result = self.db.table('transactions').select('*').eq('id', transaction_id).execute()
+        return result.data[0] if result.data else None
+
+    def update(self, transaction_id: str, values: Dict) -> None:
+        self.db.table('transactions').update(values).eq('id', transaction_id).execute()
+
+    def page(self, user_id: Optional[str], columns: Optional[List[str]], after: Optional[tuple], limit: int) -> List[Dict]:
+        query = self.db.table('transactions')\
+            .select(','.join(columns) if columns else '*')\
+            .in_('status', list(VISIBLE_STATUSES))
+
+        if user_id:
+            query = query.eq('user_id', user_id)
+
+        if after:
+            date, transaction_id = after
+            query = query.or_(f'date.lt."{date}",and(date.eq."{date}",id.lt.{transaction_id})')
+
+        result = query.order('date', desc=True).order('id', desc=True).limit(limit).execute()
+        return result.data
+
+    def external_ids(self, user_id: str, source: str) -> set:
+        rows = self._select_all(
+            lambda: self.db.table('transactions')
+            .select('external_id')
+            .in_('status', list(VISIBLE_STATUSES))
+            .eq('user_id', user_id)
+            .eq('source', source),
+            key='external_id'
+        )
+        return {row['external_id'] for row in rows if row.get('external_id')}
+
+    def holdings(self, user_id: str, symbol: str, exclude_id: Optional[str] = None) -> Dict:
+        aggregated = self._holdings_rpc(user_id, symbol, exclude_id)
+        if aggregated is not None:
+            return aggregated.get(symbol, {"coins": 0, "total_value": 0})
+
+        def query():
+            query = self.db.table('transactions')\
+                .select('id,symbol,type,value_usd,coins')\
+                .in_('status', list(VISIBLE_STATUSES))\
+                .eq('symbol', symbol)\
+                .eq('user_id', user_id)
+            return query.neq('id', exclude_id) if exclude_id else query
+        return fold_holdings(self._select_all(query, key='id')).get(symbol, {"coins": 0, "total_value": 0})
+
+    def aggregate_holdings(self, user_id: Optional[str]) -> Optional[Dict[str, Dict]]:
+        return self._holdings_rpc(user_id)
+
+    def _select_all(self, query: Callable[[], Any], key: str) -> List[Dict]:
+        """
+        Every row of a filtered select, in keyset pages of max_rows ordered by `key`
+
+        A single select would stop at max_rows without an error. Rows whose key
+        is NULL sort last and end the scan.
+        """
+        rows, last = [], None
+        while True:
+            page = query()
+            if last is not None:
+                page = page.gt(key, last)
+            data = page.order(key).limit(self.max_rows).execute().data or []
+            rows.extend(data)
+            if len(data) < self.max_rows or data[-1].get(key) is None:
+                return rows
+            last = data[-1][key]
+
+    def _holdings_rpc(self, user_id: Optional[str], symbol: Optional[str] = None,
+                      exclude_id: Optional[str] = None) -> Optional[Dict[str, Dict]]:
+        """Per-symbol holdings from the database function, or None to fall back"""
+        if not self.rpc_available:
+            return None
+        params = {'p_user_id': user_id, 'p_symbol': symbol, 'p_exclude_id': exclude_id}
+        try:
+            result = self.db.rpc(self.HOLDINGS_RPC, params).execute()
+        except Exception as e:
+            if 'PGRST202' in str(e) or 'Could not find the function' in str(e):
+                # Schema predates the function; stop asking until restart
+                logger.warning("%s() is not installed; summing holdings from rows (apply supabase_schema.sql)",
+                               self.HOLDINGS_RPC)
+                self.rpc_available = False
+            else:
+                logger.error("Error calling %s(): %s", self.HOLDINGS_RPC, e)
+            return None
+        return {row['symbol']: _net(row) for row in result.data or []}
+
+
+class SqlTransactionRepository(TransactionRepository):
+    """
+    Shared SQL for direct database backends
+
+    Subclasses provide the connection handling and parameter placeholder.
+    Holdings are summed by the database, so only one row per symbol comes back.
+    """
+
+    placeholder = '%s'
+    span_name = 'sql'
+
+    def __init__(self, table: str = 'transactions'):
+        if not table.replace('_', '').isalnum():
+            raise ValueError(f"Invalid table name: {table}")
+        self.table = table
+
+    def _query(self, sql: str, params: Iterable = ()) -> List[Dict]:
+        """Run one statement and return its rows as dicts"""
+        raise NotImplementedError
+
+    def _to_db(self, column: str, value):
+        return value
+
+    def insert(self, row: Dict) -> Optional[Dict]:
+        columns = _checked_columns(row)
+        p = self.placeholder
+        rows = self._query(
+            f"INSERT INTO {self.table} ({', '.join(columns)}) VALUES ({', '.join([p] * len(columns))}) RETURNING *",
+            [self._to_db(column, row[column]) for column in columns]
+        )
+        return rows[0] if rows else None
+
+    def get(self, transaction_id: str) -> Optional[Dict]:
+        rows = self._query(f"SELECT * FROM {self.table} WHERE id = {self.placeholder}", [transaction_id])
+        return rows[0] if rows else None
+
+    def update(self, transaction_id: str, values: Dict) -> None:
+        if not values:
+            return
+        columns = _checked_columns(values)
+        p = self.placeholder
+        assignments = ', '.join(f"{column} = {p}" for column in columns)
+        self._query(
+            f"UPDATE {self.table} SET {assignments} WHERE id = {p}",
+            [self._to_db(column, values[column]) for column in columns] + [transaction_id]
+        )
+
+    def page(self, user_id: Optional[str], columns: Optional[List[str]], after: Optional[tuple], limit: int) -> List[Dict]:
+        p = self.placeholder
+        where, params = self._visible(user_id)
+        if after:
+            date, transaction_id = after
+            where.append(f"(date < {p} OR (date = {p} AND id < {p}))")
+            date = self._to_db('date', date)
+            params += [date, date, transaction_id]
+        select = ', '.join(_checked_columns(dict.fromkeys(columns))) if columns else '*'
+        return self._query(
+            f"SELECT {select} FROM {self.table} WHERE {' AND '.join(where)} "
+            f"ORDER BY date DESC, id DESC LIMIT {p}",
+            params + [limit]
+        )
+
+    def external_ids(self, user_id: str, source: str) -> set:
+        where, params = self._visible(user_id)
+        rows = self._query(
+            f"SELECT external_id FROM {self.table} WHERE {' AND '.join(where)} "
+            f"AND source = {self.placeholder} AND external_id IS NOT NULL",
+            params + [source]
+        )
+        return {row['external_id'] for row in rows}
+
+    def holdings(self, user_id: str, symbol: str, exclude_id: Optional[str] = None) -> Dict:
+        where, params = self._visible(user_id)
+        where.append(f"symbol = {self.placeholder}")
+        params.append(symbol)
+        if exclude_id:
+            where.append(f"id <> {self.placeholder}")
+            params.append(exclude_id)
+        rows = self._query(f"SELECT {_NET_SUMS} FROM {self.table} WHERE {' AND '.join(where)}", params)
+        return _net(rows[0]) if rows else {"coins": 0, "total_value": 0}
+
+    def aggregate_holdings(self, user_id: Optional[str]) -> Optional[Dict[str, Dict]]:
+        where, params = self._visible(user_id)
+        rows = self._query(
+            f"SELECT symbol, {_NET_SUMS} FROM {self.table} WHERE {' AND '.join(where)} GROUP BY symbol",
+            params
+        )
+        return {row['symbol']: _net(row) for row in rows}
+
+    def _visible(self, user_id: Optional[str]) -> tuple:
+        where = [f"status IN ({', '.join(repr(status) for status in VISIBLE_STATUSES)})"]
+        params = []
+        if user_id:
+            where.append(f"user_id = {self.placeholder}")
+            params.append(user_id)
+        return where, params
+
+
+class PostgresTransactionRepository(SqlTransactionRepository):
+    """
+    Direct Postgres access over a bounded, thread-safe connection pool
+
+    psycopg2's ThreadedConnectionPool raises as soon as it runs out of
+    connections; a semaphore in front of it makes callers queue for up to
+    pool_timeout seconds instead, so bursts wait rather than fail.
+    """
+
+    span_name = 'postgres'
+
+    def __init__(self, dsn: Optional[str] = None, minconn: int = 1, maxconn: int = 10,
+                 pool_timeout: float = 10, table: str = 'transactions', **connect_kwargs):
+        if not PSYCOPG2_AVAILABLE:
+            raise ImportError("psycopg2 is required for the Postgres backend (pip install psycopg2-binary)")
+        super().__init__(table)
+        self.pool_timeout = pool_timeout
+        self._pool = psycopg2_pool.ThreadedConnectionPool(minconn, maxconn, dsn, **connect_kwargs)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._stats_lock = threading.Lock()
+        self._stats = {'queries': 0, 'pool_waits': 0, 'pool_wait_seconds': 0.0, 'pool_timeouts': 0, 'max_connections': maxconn}
+
+    @contextmanager
+    def connection(self):
+        """Borrow a pooled connection; commits on success, rolls back on error"""
+        started = time.monotonic()
+        acquired = self._slots.acquire(blocking=False)
+        if not acquired:
+            acquired = self._slots.acquire(timeout=self.pool_timeout)
+            waited = time.monotonic() - started
+            with self._stats_lock:
+                self._stats['pool_waits'] += 1
+                self._stats['pool_wait_seconds'] += waited
+                if not acquired:
+                    self._stats['pool_timeouts'] += 1
+            if not acquired:
+                raise PoolTimeout(f"No database connection available within {self.pool_timeout}s")
+        try:
+            conn = self._pool.getconn()
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                self._pool.putconn(conn)
+        finally:
+            self._slots.release()
+
+    def _query(self, sql: str, params: Iterable = ()) -> List[Dict]:
+        with span(self.span_name, self.table), self.connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute(sql, list(params))
+                rows = cursor.fetchall() if cursor.description else []
+        with self._stats_lock:
+            self._stats['queries'] += 1
+        return [_from_db(row) for row in rows]
+
+    def insert_many(self, rows: List[Dict]) -> int:
+        inserted = 0
+        with span(self.span_name, self.table), self.connection() as conn:
+            with conn.cursor() as cursor:
+                # Rows without a date take the column default, so insert per column set
+                for columns, group in _group_by_columns(rows).items():
+                    execute_values(
+                        cursor,
+                        f"INSERT INTO {self.table} ({', '.join(columns)}) VALUES %s",
+                        [[row[column] for column in columns] for row in group],
+                        page_size=len(group)
+                    )
+                    inserted += len(group)
+        with self._stats_lock:
+            self._stats['queries'] += 1
+        return inserted
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def close(self) -> None:
+        self._pool.closeall()
+
+
+class SQLiteTransactionRepository(SqlTransactionRepository):
+    """
+    SQLite stand-in for the Postgres backend (tests, benchmarks, local runs)
+
+    Uses the same SQL and indexes as the Postgres schema. Timestamps are
+    stored as canonical UTC ISO strings so they sort like timestamptz.
+    """
+
+    placeholder = '?'
+    span_name = 'sqlite'
+
+    def __init__(self, path: str = ':memory:', table: str = 'transactions'):
+        super().__init__(table)
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self._queries = 0
+        self.create_schema()
+
+    def create_schema(self) -> None:
+        """Create the table and the indexes from supabase_schema.sql"""
+        with self._lock, self._conn:
+            self._conn.executescript(f"""
+                CREATE TABLE IF NOT EXISTS {self.table} (
+                    id TEXT PRIMARY KEY,
+                    name TEXT,
+                    symbol TEXT NOT NULL,
+                    type TEXT NOT NULL CHECK (type IN ('buy', 'sell')),
+                    value_usd REAL NOT NULL,
+                    purchased_price REAL NOT NULL,
+                    coins REAL NOT NULL,
+                    date TEXT NOT NULL,
+                    status TEXT DEFAULT 'active' CHECK (status IN ('active', 'pending', 'delete')),
+                    created_by TEXT DEFAULT 'system',
+                    user_id TEXT NOT NULL DEFAULT 'default',
+                    source TEXT DEFAULT 'manual',
+                    external_id TEXT,
+                    created_at TEXT,
+                    updated_at TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_{self.table}_user_status_date ON {self.table}(user_id, status, date DESC);
+                CREATE INDEX IF NOT EXISTS idx_{self.table}_user_symbol_status ON {self.table}(user_id, symbol, status);
+                CREATE INDEX IF NOT EXISTS idx_{self.table}_external_id ON {self.table}(external_id, source);
+            """)
+
+    def _query(self, sql: str, params: Iterable = ()) -> List[Dict]:
+        with span(self.span_name, self.table), self._lock, self._conn:
+            rows = [dict(row) for row in self._conn.execute(sql, list(params)).fetchall()]
+            self._queries += 1
+        return rows
+
+    def _to_db(self, column: str, value):
+        return _canonical_timestamp(value) if column in ('date', 'created_at', 'updated_at') else value
+
+    def insert(self, row: Dict) -> Optional[Dict]:
+        return super().insert(self._with_defaults(row))
+
+    def insert_many(self, rows: List[Dict]) -> int:
+        rows = [self._with_defaults(row) for row in rows]
+        with span(self.span_name, self.table), self._lock, self._conn:
+            for columns, group in _group_by_columns(rows).items():
+                self._conn.executemany(
+                    f"INSERT INTO {self.table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                    [[self._to_db(column, row[column]) for column in columns] for row in group]
+                )
+            self._queries += 1
+        return len(rows)
+
+    def update(self, transaction_id: str, values: Dict) -> None:
+        super().update(transaction_id, {**values, 'updated_at': datetime.now(timezone.utc)})
+
+    def stats(self) -> Dict:
+        return {'queries': self._queries}
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def _with_defaults(self, row: Dict) -> Dict:
+        # Column defaults Postgres would fill in (gen_random_uuid(), NOW())
+        now = datetime.now(timezone.utc)
+        return {'id': str(uuid.uuid4()), 'date': now, 'created_at': now, 'updated_at': now, **row}
+
+
+# Net coins and cost: buys add, sells subtract
+_NET_SUMS = (
+    "COALESCE(SUM(CASE WHEN lower(type) = 'buy' THEN coins WHEN lower(type) = 'sell' THEN -coins ELSE 0 END), 0) AS coins, "
+    "COALESCE(SUM(CASE WHEN lower(type) = 'buy' THEN value_usd WHEN lower(type) = 'sell' THEN -value_usd ELSE 0 END), 0) AS total_value"
+)
+
+
+def fold_holdings(transactions: Iterable[Dict]) -> Dict[str, Dict]:
+    """Net {'coins', 'total_value'} per symbol from transaction rows"""
+    collection = {}
+    for transaction in transactions:
+        coin = transaction.get('symbol', '')
+        transaction_type = transaction.get('type', '').lower()
+        transaction_value = float(transaction.get('value_usd', 0))
+        transaction_coins = float(transaction.get('coins', 0))
+
+        holding = collection.setdefault(coin, {"coins": 0, "total_value": 0})
+        if transaction_type == "buy":
+            holding["coins"] += transaction_coins
+            holding["total_value"] += transaction_value
+        elif transaction_type == "sell":
+            holding["coins"] -= transaction_coins
+            holding["total_value"] -= transaction_value
+    return collection
+
+
+def _net(row: Dict) -> Dict:
+    return {"coins": float(row['coins'] or 0), "total_value": float(row['total_value'] or 0)}
+
+
+def _checked_columns(row: Dict) -> List[str]:
+    # Column names are interpolated into SQL, so only known columns are allowed
+    unknown = [column for column in row if column not in TRANSACTION_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+    return list(row)
+
+
+def _group_by_columns(rows: List[Dict]) -> Dict[tuple, List[Dict]]:
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(_checked_columns(row)), []).append(row)
+    return groups
+
+
+def _from_db(row: Dict) -> Dict:
+    """Decimal, datetime and UUID values to their JSON-friendly forms"""
+    converted = {}
+    for key, value in row.items():
+        if isinstance(value, Decimal):
+            value = float(value)
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        elif isinstance(value, uuid.UUID):
+            value = str(value)
+        converted[key] = value
+    return converted
+
+
+def _canonical_timestamp(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return value
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc).isoformat(timespec='microseconds')
+    return value
@@ -0,0 +1,113 @@
+"""
+Per-user cache for computed analytics results
+"""
+from typing import Any, Callable, Dict, Optional
+from collections import OrderedDict, defaultdict
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache:
+    """
+    Bounded LRU cache of computed results keyed by (user, endpoint, params, data version)
+
+    Each user has a data version that TransactionService bumps after every
+    write, so results computed from older data are never served again (they
+    age out of the LRU). Results that depend on live prices are stored with a
+    TTL matching the price cache. Like JobQueue, state is per process.
+    """
+
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()  # key -> (value, expires_at)
+        # Written only by bump() and never dropped: a version that restarted at 0
+        # would let results and ETags from before the reset match again
+        self._versions: Dict[str, int] = {}
+        self._user_keys: Dict[str, set] = defaultdict(set)
+        self._stats = defaultdict(lambda: {'hits': 0, 'misses': 0})
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def data_version(self, user_id: str) -> int:
+        with self._lock:
+            # Reads must not add entries: ETag checks run for any userId sent
+            return self._versions.get(user_id, 0)
+
+    def bump(self, user_id: str) -> None:
+        """Invalidate a user's cached results after their transactions changed"""
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            # Free the stale entries now rather than waiting for LRU eviction
+            for key in self._user_keys.pop(user_id, ()):
+                self._entries.pop(key, None)
+
+    def get_or_compute(
+        self,
+        user_id: str,
+        endpoint: str,
+        params: Dict,
+        compute: Callable[[], Any],
+        ttl: Optional[float] = None
+    ) -> Any:
+        """
+        Return the cached result for these params, computing it on a miss
+
+        Args:
+            user_id: User ID
+            endpoint: Name used for the key and per-endpoint metrics
+            params: Parameters the result depends on (hashable values)
+            compute: Produces the result on a miss
+            ttl: Seconds until the entry expires (None: only writes invalidate it)
+        """
+        with self._lock:
+            key = (user_id, endpoint, tuple(sorted(params.items())), self._versions.get(user_id, 0))
+            entry = self._entries.get(key)
+            if entry and (entry[1] is None or entry[1] > time.monotonic()):
+                self._entries.move_to_end(key)
+                self._stats[endpoint]['hits'] += 1
+                return entry[0]
+            self._stats[endpoint]['misses'] += 1
+
+        value = compute()
+
+        # Error results are returned but not cached
+        if isinstance(value, dict) and 'error' in value:
+            return value
+
+        with self._lock:
+            expires_at = time.monotonic() + ttl if ttl is not None else None
+            if key[3] != self._versions.get(user_id, 0):
+                # The user's data changed while computing; don't store a stale result
+                return value
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            self._user_keys[user_id].add(key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                keys = self._user_keys.get(evicted[0])
+                if keys is not None:
+                    keys.discard(evicted)
+                    if not keys:
+                        del self._user_keys[evicted[0]]
+                self._evictions += 1
+        return value
+
+    def stats(self) -> Dict:
+        """Hit/miss counts per endpoint plus size and evictions"""
+        with self._lock:
+            endpoints = {}
+            for endpoint, counts in self._stats.items():
+                lookups = counts['hits'] + counts['misses']
+                endpoints[endpoint] = {
+                    **counts,
+                    'hit_rate': counts['hits'] / lookups if lookups else 0
+                }
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'evictions': self._evictions,
+                'endpoints': endpoints
+            }
@@ -0,0 +1,257 @@
+"""
+Time-weighted (TWR) and money-weighted (XIRR) returns from transaction cash flows
+
+Fills are netted per symbol and day into cash-flow and holdings matrices
+(days x symbols, plus a portfolio column). Holdings are marked at each day's
+traded price (value_usd / coins of that day's fills, carried forward until the
+symbol trades again) and at current prices at the end of a period ending now.
+
+TWR chains the growth between consecutive flow days, so it ignores when money
+was added. Log growth is prefix-summed once, which makes every period a
+difference of two sums. The money-weighted return is the rate that
+discounts a period's flows (starting value in, net trades, ending value out)
+to zero; XIRR is that rate annualized. All periods and symbols are solved
+together by xirr_batch().
+"""
+from typing import Dict, Optional, Tuple
+from datetime import datetime
+import logging
+
+import numpy as np
+
+from services.time_index import TimeIndex, to_epoch
+
+logger = logging.getLogger(__name__)
+
+DAY = 86400.0
+YEAR = 365.0 * DAY
+
+# Rates are solved for in x = log(1 + r), bracketed to r in about (-99.99%, 1e6%)
+_X_MIN, _X_MAX = np.log(1e-4), np.log(1e4)
+
+
+def xirr_batch(
+    cashflows: np.ndarray,
+    years: np.ndarray,
+    groups: np.ndarray,
+    count: int,
+    tol: float = 1e-10,
+    max_iter: int = 50
+) -> np.ndarray:
+    """
+    Solve many XIRR problems at once
+
+    Flow i belongs to problem groups[i] and happens years[i] after that
+    problem's start. Newton's method runs on all problems together (one
+    bincount per iteration for the NPV and one for its derivative); problems
+    it does not converge on are bracketed on a grid and bisected together.
+
+    Returns:
+        Annual rate per problem, NaN where no rate zeroes the NPV (e.g. the
+        flows never change sign)
+    """
+    cashflows = np.asarray(cashflows, dtype=np.float64)
+    years = np.asarray(years, dtype=np.float64)
+    groups = np.asarray(groups, dtype=np.int64)
+
+    def npv(x: np.ndarray, derivative: bool = False):
+        # sum(cf * (1 + r) ** -t) == sum(cf * exp(-t * x)); d/dx == sum(-t * cf * exp(-t * x))
+        discounted = cashflows * np.exp(-years * x[groups])
+        value = np.bincount(groups, discounted, minlength=count)
+        if not derivative:
+            return value
+        return value, np.bincount(groups, -years * discounted, minlength=count)
+
+    # A root needs flows of both signs
+    has_in = np.bincount(groups, cashflows > 0, minlength=count) > 0
+    has_out = np.bincount(groups, cashflows < 0, minlength=count) > 0
+    solvable = has_in & has_out
+
+    x = np.full(count, np.log1p(0.1))
+    converged = ~solvable
+    with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+        for _ in range(max_iter):
+            value, slope = npv(x, derivative=True)
+            step = np.where(converged | (slope == 0), 0.0, value / np.where(slope == 0, 1, slope))
+            x = np.clip(x - step, _X_MIN, _X_MAX)
+            converged |= np.abs(step) < tol
+            if converged.all():
+                break
+
+        # Newton can stall at the bracket or oscillate: scan a grid for the sign
+        # change nearest r = 0 and bisect that interval, for all leftovers at once
+        value = npv(x)
+        scale = np.bincount(groups, np.abs(cashflows), minlength=count)
+        unsolved = solvable & ~(np.isfinite(value) & (np.abs(value) <= 1e-7 * np.maximum(scale, 1)))
+        if unsolved.any():
+            grid = np.linspace(_X_MIN, _X_MAX, 65)
+            signs = np.sign(np.array([npv(np.full(count, point)) for point in grid]))
+            changes = signs[:-1] != signs[1:]
+            distance = np.where(changes, np.abs((grid[:-1] + grid[1:]) / 2)[:, None], np.inf)
+            nearest = distance.argmin(axis=0)
+            bracketed = unsolved & changes.any(axis=0)
+            lo, hi = grid[nearest], grid[nearest + 1]
+            f_lo = npv(lo)
+            for _ in range(60):
+                mid = (lo + hi) / 2
+                f_mid = npv(mid)
+                left = np.sign(f_mid) == np.sign(f_lo)
+                lo = np.where(left, mid, lo)
+                f_lo = np.where(left, f_mid, f_lo)
+                hi = np.where(left, hi, mid)
+            x = np.where(bracketed, (lo + hi) / 2, x)
+            solvable &= ~unsolved | bracketed
+
+    rates = np.expm1(x)
+    rates[~solvable] = np.nan
+    return rates
+
+
+def compute_returns(
+    index: TimeIndex,
+    periods: Dict[str, Tuple],
+    prices: Dict[str, float],
+    now: Optional[float] = None
+) -> Dict[str, Dict]:
+    """
+    TWR and XIRR of the portfolio and of each symbol for several periods
+
+    Args:
+        index: The user's TimeIndex
+        periods: {name: (start, end)} with datetimes/ISO strings; a None start
+            means since the first transaction, a None end means now
+        prices: Current {symbol: usd} prices for periods ending now (a symbol
+            without one is marked at its last traded price)
+        now: Epoch seconds of "now" (default: the current time)
+
+    Returns:
+        {name: {'twr', 'mwr', 'xirr', 'symbols': {symbol: {...}}}}: TWR and the
+        money-weighted return over the period, and the latter annualized
+        (XIRR); None where a return is undefined or the annual rate overflows
+    """
+    if now is None:
+        now = to_epoch(datetime.now())
+    symbols = index.symbols
+    if index.size == 0:
+        return {name: {'twr': None, 'mwr': None, 'xirr': None, 'symbols': {}} for name in periods}
+
+    days, cash, coins_after, marks = _daily(index, len(symbols))
+    day_epochs = days * DAY
+
+    # Values before and after each day's flows, marked at that day's prices;
+    # the last column is the portfolio
+    value_after = _with_total(coins_after * marks)
+    value_before = _with_total((coins_after - np.diff(coins_after, axis=0, prepend=0)) * marks)
+    cash = _with_total(cash)
+    columns = cash.shape[1]
+
+    # Growth from the previous flow day's closing value to this day's opening value
+    previous = np.vstack([np.zeros((1, columns)), value_after[:-1]])
+    valid = (previous > 0) & (value_before > 0)
+    cum_log = _prefix(_log_ratio(value_before, previous, valid))
+    cum_valid = _prefix(valid.astype(np.int64))
+
+    current = np.array([prices.get(symbol) or 0 for symbol in symbols], dtype=np.float64)
+    current = np.where(current > 0, current, marks[-1])
+    zeros = np.zeros(columns)
+
+    flow_cash, flow_times, flow_groups = [], [], []
+    twr = np.full((len(periods), columns), np.nan)
+    span = np.zeros(len(periods))
+    for p, (start, end) in enumerate(periods.values()):
+        start_epoch = to_epoch(start) if start is not None else None
+        end_epoch = to_epoch(end) if end is not None else now
+        # Flow days strictly after the start's day, up to and including the end's day
+        i = 0 if start_epoch is None else int(np.searchsorted(days, np.floor(start_epoch / DAY), side='right'))
+        j = int(np.searchsorted(days, np.floor(end_epoch / DAY), side='right'))
+        if start_epoch is None:
+            start_epoch = day_epochs[0]
+        start_value = value_after[i - 1] if i > 0 else zeros
+        last_value = value_after[j - 1] if j > 0 else zeros
+        if end is None:
+            end_value = _with_total(coins_after[j - 1] * current) if j > 0 else zeros
+        else:
+            end_value = last_value
+
+        # TWR: chained growth across flow days i..j-1, then on to the end value
+        final_valid = (last_value > 0) & (end_value > 0)
+        growth = cum_log[j] - cum_log[i] + _log_ratio(end_value, last_value, final_valid)
+        defined = (cum_valid[j] - cum_valid[i] + final_valid) > 0
+        twr[p] = np.where(defined, np.expm1(growth), np.nan)
+
+        # Money-weighted flows per column: the starting value in, net trades, the
+        # ending value out. Time runs 0..1 over the period so the solved rate is
+        # the period's return, annualized afterwards (short periods would overflow)
+        group_ids = p * columns + np.arange(columns)
+        span[p] = max(end_epoch - start_epoch, DAY)
+        trade_times = np.clip((day_epochs[i:j] - start_epoch) / span[p], 0, 1)
+        flow_cash += [-start_value, cash[i:j].ravel(), end_value]
+        flow_times += [zeros, np.repeat(trade_times, columns), np.ones(columns)]
+        flow_groups += [group_ids, np.tile(group_ids, j - i), group_ids]
+
+    mwr = xirr_batch(
+        np.concatenate(flow_cash), np.concatenate(flow_times), np.concatenate(flow_groups),
+        len(periods) * columns
+    ).reshape(len(periods), columns)
+    with np.errstate(over='ignore', invalid='ignore'):
+        xirr = np.expm1(np.log1p(mwr) * (YEAR / span)[:, None])
+
+    results = {}
+    for p, name in enumerate(periods):
+        results[name] = {
+            'twr': _number(twr[p, -1]),
+            'mwr': _number(mwr[p, -1]),
+            'xirr': _number(xirr[p, -1]),
+            'symbols': {
+                symbol: {'twr': _number(twr[p, k]), 'mwr': _number(mwr[p, k]), 'xirr': _number(xirr[p, k])}
+                for k, symbol in enumerate(symbols)
+            }
+        }
+    return results
+
+
+def _daily(index: TimeIndex, n_symbols: int) -> Tuple[np.ndarray, ...]:
+    """
+    Net the fills per day and symbol
+
+    Returns the sorted flow days (days since 1970) and days x symbols matrices
+    of investor cash flow (buys negative), coins held after the day and the
+    mark price (that day's traded price, else the last one before it).
+    """
+    days, day_index = np.unique(np.floor(index.epochs / DAY), return_inverse=True)
+    cells = day_index * n_symbols + index.symbol_codes
+    shape = (len(days), n_symbols)
+
+    def net(weights):
+        return np.bincount(cells, weights, minlength=shape[0] * shape[1]).reshape(shape)
+
+    cash = -net(index.cost_deltas)
+    coins_after = np.cumsum(net(index.coin_deltas), axis=0)
+    traded_coins = net(np.abs(index.coin_deltas))
+    traded_value = net(np.abs(index.cost_deltas))
+
+    observed = traded_coins > 0
+    last_seen = np.maximum.accumulate(np.where(observed, np.arange(shape[0])[:, None], -1), axis=0)
+    traded_price = np.divide(traded_value, traded_coins, out=np.zeros(shape), where=observed)
+    marks = np.where(last_seen >= 0, traded_price[np.maximum(last_seen, 0), np.arange(shape[1])], 0.0)
+    return days, cash, coins_after, marks
+
+
+def _with_total(values: np.ndarray) -> np.ndarray:
+    """Append the portfolio column (the sum over symbols)"""
+    return np.concatenate([values, values.sum(axis=-1, keepdims=True)], axis=-1)
+
+
+def _log_ratio(numerator: np.ndarray, denominator: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    """log(numerator / denominator) where valid, else 0"""
+    return np.where(valid, np.log(np.where(valid, numerator, 1) / np.where(valid, denominator, 1)), 0.0)
+
+
+def _prefix(values: np.ndarray) -> np.ndarray:
+    out = np.zeros((values.shape[0] + 1,) + values.shape[1:], dtype=values.dtype)
+    np.cumsum(values, axis=0, out=out[1:])
+    return out
+
+
+def _number(value: float) -> Optional[float]:
+    return None if not np.isfinite(value) else float(value)
@@ -0,0 +1,323 @@
+"""
+Portfolio risk metrics from daily closes in the OHLC store
+"""
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime
+import logging
+import threading
+
+import numpy as np
+
+from services.metrics import span
+from services.ohlc_store import GrowableArray, OHLCStore, to_date
+
+logger = logging.getLogger(__name__)
+
+# Crypto trades every day of the year
+PERIODS_PER_YEAR = 365
+
+
+class SeriesStats:
+    """
+    Return and drawdown statistics of one close series, extended bar by bar
+
+    Daily returns are kept with prefix sums of r, r**2 and min(r, 0)**2, so the
+    mean, volatility and downside deviation of any trailing window are O(1)
+    differences, and the running peak, worst drawdown and their positions are
+    kept as prefix arrays. update() only processes bars it has not seen (plus
+    the last one, which may have been replaced by a fresher bar for that day).
+    """
+
+    def __init__(self):
+        self.days = GrowableArray(np.int64)
+        self.closes = GrowableArray()
+        self.returns = GrowableArray()
+        self._sum = GrowableArray()
+        self._sum_sq = GrowableArray()
+        self._down_sq = GrowableArray()
+        for prefix in (self._sum, self._sum_sq, self._down_sq):
+            prefix.extend([0.0])
+        self._peak = GrowableArray()
+        self._peak_at = GrowableArray(np.int64)
+        self._worst = GrowableArray()  # deepest drawdown so far
+        self._worst_at = GrowableArray(np.int64)
+
+    def update(self, days: np.ndarray, closes: np.ndarray) -> int:
+        """Catch up with a series that has only grown; returns how many bars were processed"""
+        keep = max(len(self.closes) - 1, 0)
+        if keep and (len(days) < keep or days[keep - 1] != self.days.values[keep - 1]
+                     or closes[keep - 1] != self.closes.values[keep - 1]):
+            keep = 0  # history changed: start over
+        self._truncate(keep)
+
+        new_days, new_closes = days[keep:], np.asarray(closes[keep:], dtype=np.float64)
+        if not len(new_closes):
+            return 0
+        previous = self.closes.values[-1] if keep else None
+        self.days.extend(new_days)
+        self.closes.extend(new_closes)
+
+        # Returns of the new bars against the bar before each
+        bases = new_closes[:-1] if previous is None else np.concatenate([[previous], new_closes[:-1]])
+        changed = new_closes[1:] if previous is None else new_closes
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns = np.where(bases > 0, changed / np.where(bases > 0, bases, 1) - 1, 0.0)
+        self.returns.extend(returns)
+        for prefix, values in ((self._sum, returns), (self._sum_sq, returns ** 2),
+                               (self._down_sq, np.minimum(returns, 0) ** 2)):
+            prefix.extend(prefix.values[-1] + np.cumsum(values))
+
+        # Running peak and deepest drawdown, with the positions where each was set
+        positions = np.arange(keep, keep + len(new_closes))
+        last_peak = self._peak.values[-1] if keep else -np.inf
+        peak = np.maximum.accumulate(np.concatenate([[last_peak], new_closes]))[1:]
+        new_peak = new_closes >= np.concatenate([[last_peak], peak[:-1]])
+        self._peak.extend(peak)
+        self._peak_at.extend(_carry(positions, new_peak, self._peak_at.values[-1] if keep else 0))
+
+        drawdown = new_closes / peak - 1
+        last_worst = self._worst.values[-1] if keep else np.inf
+        worst = np.minimum.accumulate(np.concatenate([[last_worst], drawdown]))[1:]
+        new_worst = drawdown < np.concatenate([[last_worst], worst[:-1]])
+        self._worst.extend(worst)
+        self._worst_at.extend(_carry(positions, new_worst, self._worst_at.values[-1] if keep else 0))
+        return len(new_closes)
+
+    def summary(self, window: int, points: int, lookback: int, risk_free_rate: float = 0.0) -> Dict:
+        """Volatility, Sharpe/Sortino over the last `lookback` returns, drawdowns and rolling volatility"""
+        n_returns = len(self.returns)
+        if not n_returns:
+            return {'bars': len(self.closes)}
+        n = min(lookback, n_returns)
+        s1, s2, d2 = self._sum.values, self._sum_sq.values, self._down_sq.values
+        mean = (s1[-1] - s1[-1 - n]) / n
+        volatility = _std(s1[-1] - s1[-1 - n], s2[-1] - s2[-1 - n], n)
+        downside = np.sqrt((d2[-1] - d2[-1 - n]) / n)
+        excess = mean - risk_free_rate / PERIODS_PER_YEAR
+        annual = np.sqrt(PERIODS_PER_YEAR)
+
+        trough = int(self._worst_at.values[-1])
+        peak = int(self._peak_at.values[trough])
+        closes = self.closes.values
+        return {
+            'bars': len(self.closes),
+            'start_date': to_date(self.days.values[0]).isoformat(),
+            'end_date': to_date(self.days.values[-1]).isoformat(),
+            'volatility': _number(volatility * annual),
+            'mean_return': _number(mean * PERIODS_PER_YEAR),
+            'sharpe': _number(excess / volatility * annual) if volatility > 0 else None,
+            'sortino': _number(excess / downside * annual) if downside > 0 else None,
+            'max_drawdown': _number(-self._worst.values[-1]),
+            'max_drawdown_peak': to_date(self.days.values[peak]).isoformat(),
+            'max_drawdown_trough': to_date(self.days.values[trough]).isoformat(),
+            'current_drawdown': _number(1 - closes[-1] / self._peak.values[-1]),
+            'rolling_volatility': self.rolling_volatility(window, points)
+        }
+
+    def rolling_volatility(self, window: int, points: int) -> List[Dict]:
+        """Annualized volatility of the `window` returns ending at each of the last `points` days"""
+        n_returns = len(self.returns)
+        if n_returns < window or window < 2:
+            return []
+        ends = np.arange(max(window, n_returns - points + 1), n_returns + 1)
+        s1, s2 = self._sum.values, self._sum_sq.values
+        volatility = _std(s1[ends] - s1[ends - window], s2[ends] - s2[ends - window], window) * np.sqrt(PERIODS_PER_YEAR)
+        # Return k ends on bar k + 1
+        days = self.days.values[ends]
+        return [
+            {'date': to_date(day).isoformat(), 'volatility': float(value)}
+            for day, value in zip(days, volatility)
+        ]
+
+    def aligned_returns(self, days: np.ndarray) -> np.ndarray:
+        """Returns ending on the given days (which must all be return days of this series)"""
+        return self.returns.values[np.searchsorted(self.days.values[1:], days)]
+
+    def return_days(self) -> np.ndarray:
+        return self.days.values[1:]
+
+    def _truncate(self, bars: int) -> None:
+        for array in (self.days, self.closes, self._peak, self._peak_at, self._worst, self._worst_at):
+            array.truncate(bars)
+        returns = max(bars - 1, 0)
+        self.returns.truncate(returns)
+        for prefix in (self._sum, self._sum_sq, self._down_sq):
+            prefix.truncate(returns + 1)
+
+
+class RiskService:
+    """
+    Risk analytics of a user's current holdings over historical daily closes
+
+    Per-symbol statistics are kept across requests and extended only by the
+    bars appended to the store since. The portfolio series applies today's
+    value weights (from get_coin_wise_details) to each symbol's daily returns.
+    Results are cached per user data version, day and store version, and
+    expire with the price cache since the weights follow current prices.
+    """
+
+    def __init__(self, transaction_service, ohlc_store: OHLCStore, result_cache=None, risk_free_rate: float = 0.0,
+                 price_ttl: float = 60):
+        self.transaction_service = transaction_service
+        self.ohlc_store = ohlc_store
+        self.result_cache = result_cache
+        self.risk_free_rate = risk_free_rate
+        # Cached results expire with the price cache, since the weights follow current prices
+        self.price_ttl = price_ttl
+        self._stats: Dict[str, Tuple[int, SeriesStats]] = {}  # symbol -> (store version, stats)
+        # Guards the per-symbol stats while they are updated or read; never
+        # held across database or price requests
+        self._lock = threading.RLock()
+
+    def get_risk(self, user_id: str, window: int = 30, points: int = 90, lookback: int = 365) -> Dict:
+        """
+        Volatility, drawdown, Sharpe/Sortino and correlations of the user's holdings
+
+        Args:
+            user_id: User ID
+            window: Rolling volatility window in days
+            points: Number of trailing rolling volatility points to return
+            lookback: Days of returns behind volatility, Sharpe, Sortino and correlation
+
+        Returns:
+            Dictionary with portfolio and per-coin metrics and a correlation matrix
+        """
+        self.ohlc_store.refresh()
+        params = {
+            'window': window, 'points': points, 'lookback': lookback,
+            'date': datetime.now().date().isoformat(), 'bars': self.ohlc_store.version()
+        }
+        compute = lambda: self._compute_risk(user_id, window, points, lookback)
+        if self.result_cache is None:
+            return compute()
+        return self.result_cache.get_or_compute(
+            user_id, 'risk', params, compute, ttl=self.price_ttl
+        )
+
+    def symbol_stats(self, symbol: str) -> SeriesStats:
+        """A symbol's statistics, updated with any bars appended since the last call"""
+        version = self.ohlc_store.version(symbol)
+        with self._lock:
+            seen, stats = self._stats.get(symbol, (None, None))
+            if stats is None:
+                stats = SeriesStats()
+            if seen != version:
+                stats.update(*self.ohlc_store.closes(symbol))
+                self._stats[symbol] = (version, stats)
+            return stats
+
+    def holdings_history(self, user_id: str) -> Dict:
+        """
+        The user's holdings with daily price history, their values and returns
+
+        Returns:
+            Dictionary with 'coins' (get_coin_wise_details), 'stats' and
+            'values' for the symbols with history, 'total_value' of every
+            holding, 'covered_value' of those with history, and 'symbols'
+            (sorted), 'days' and 'returns' (symbols x days) on the days every
+            one of those symbols has a return
+        """
+        coins = self.transaction_service.get_coin_wise_details(user_id).get('coins', {})
+        available = set(self.ohlc_store.symbols())
+        with self._lock:
+            stats = {symbol: self.symbol_stats(symbol) for symbol in coins if symbol in available}
+            stats = {symbol: s for symbol, s in stats.items() if len(s.returns)}
+            values = {}
+            for symbol, s in stats.items():
+                details = coins[symbol]
+                values[symbol] = details.get('value') or details.get('coins', 0) * s.closes.values[-1]
+            symbols = sorted(stats)
+            days, returns = aligned_returns(stats, symbols)
+        return {
+            'coins': coins,
+            'stats': stats,
+            'values': values,
+            'total_value': sum(details.get('value', 0) for details in coins.values()),
+            'covered_value': sum(values.values()),
+            'symbols': symbols,
+            'days': days,
+            'returns': returns
+        }
+
+    def _compute_risk(self, user_id: str, window: int, points: int, lookback: int) -> Dict:
+        try:
+            with span('risk', 'compute'):
+                # Holdings and prices are fetched before taking the lock
+                holdings = self.holdings_history(user_id)
+                coins, stats, values = holdings['coins'], holdings['stats'], holdings['values']
+                total_value, covered_value = holdings['total_value'], holdings['covered_value']
+
+                result = {
+                    'window': window,
+                    'lookback': lookback,
+                    'coverage': covered_value / total_value if total_value > 0 else 0,
+                    'missing': sorted(symbol for symbol in coins if symbol not in stats),
+                    'coins': {},
+                    'portfolio': None,
+                    'correlation': {'symbols': [], 'matrix': []}
+                }
+                # The shared stats may be extended by other requests meanwhile
+                with self._lock:
+                    for symbol, s in stats.items():
+                        result['coins'][symbol] = {
+                            'weight': values[symbol] / covered_value if covered_value > 0 else 0,
+                            **s.summary(window, points, lookback, self.risk_free_rate)
+                        }
+                if not stats or covered_value <= 0:
+                    return result
+
+                # Returns on the days every held symbol has a bar
+                symbols, common, matrix = holdings['symbols'], holdings['days'], holdings['returns']
+                if not len(common):
+                    return result
+                weights = np.array([values[symbol] / covered_value for symbol in symbols])
+
+                # The portfolio as a series of its own: an equity curve from the weighted returns
+                portfolio = SeriesStats()
+                equity = np.concatenate([[1.0], np.cumprod(1 + weights @ matrix)])
+                portfolio.update(np.concatenate([[common[0] - 1], common]), equity)
+                result['portfolio'] = portfolio.summary(window, points, lookback, self.risk_free_rate)
+
+                recent = matrix[:, -lookback:]
+                if recent.shape[1] > 1:
+                    with np.errstate(divide='ignore', invalid='ignore'):
+                        correlation = np.atleast_2d(np.corrcoef(recent))
+                    result['correlation'] = {
+                        'symbols': symbols,
+                        'matrix': [[_number(value) for value in row] for row in correlation]
+                    }
+                return result
+        except Exception as e:
+            logger.error(f"Error calculating risk metrics: {e}", exc_info=True)
+            return {'error': str(e)}
+
+
+def aligned_returns(stats: Dict[str, SeriesStats], symbols: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Days every symbol has a return for, and the symbols x days matrix of those returns"""
+    if not symbols:
+        return np.empty(0, dtype=np.int64), np.empty((0, 0))
+    common = stats[symbols[0]].return_days()
+    for symbol in symbols[1:]:
+        common = np.intersect1d(common, stats[symbol].return_days(), assume_unique=True)
+    if not len(common):
+        return common, np.empty((len(symbols), 0))
+    return common.copy(), np.vstack([stats[symbol].aligned_returns(common) for symbol in symbols])
+
+
+def _std(total: np.ndarray, total_sq: np.ndarray, n: int) -> np.ndarray:
+    """Sample standard deviation from a sum and a sum of squares"""
+    if n < 2:
+        return np.zeros_like(total) if isinstance(total, np.ndarray) else 0.0
+    variance = (total_sq - total * total / n) / (n - 1)
+    return np.sqrt(np.maximum(variance, 0))
+
+
+def _carry(positions: np.ndarray, updated: np.ndarray, previous: int) -> np.ndarray:
+    """Position of the latest update at or before each position (previous before the first)"""
+    marked = np.where(updated, positions, -1)
+    return np.maximum.accumulate(np.concatenate([[previous], marked]))[1:]
+
+
+def _number(value) -> Optional[float]:
+    value = float(value)
+    return value if np.isfinite(value) else None
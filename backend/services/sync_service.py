@@ -0,0 +1,297 @@
+"""
+Broker sync service for incremental, resumable broker imports
+"""
+from typing import Dict, List, Optional
+from datetime import datetime, timezone
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SyncStateStore:
+    """Persists per-(user, broker, account) sync cursors and watermarks in Supabase"""
+    
+    TABLE = 'broker_sync_state'
+    
+    def __init__(self, supabase_client):
+        self.db = supabase_client
+    
+    def get(self, user_id: str, broker: str, account: str = '') -> Dict:
+        """Load sync state, returning an empty state if none is stored yet"""
+        try:
+            result = self.db.table(self.TABLE)\
+                .select('*')\
+                .eq('user_id', user_id)\
+                .eq('broker', broker)\
+                .eq('account', account)\
+                .limit(1)\
+                .execute()
+            
+            if result.data:
+                return result.data[0]
+        except Exception as e:
+            logger.error(f"Error loading sync state for {broker}: {e}")
+        
+        return {
+            'user_id': user_id,
+            'broker': broker,
+            'account': account,
+            'cursor': None,
+            'last_trade_time': None,
+            'pending_trade_time': None,
+            'last_synced_at': None
+        }
+    
+    def save(self, state: Dict) -> None:
+        """Upsert sync state"""
+        row = {
+            'user_id': state['user_id'],
+            'broker': state['broker'],
+            'account': state.get('account', ''),
+            'cursor': state.get('cursor'),
+            'last_trade_time': state.get('last_trade_time'),
+            'pending_trade_time': state.get('pending_trade_time'),
+            'last_synced_at': state.get('last_synced_at'),
+            'updated_at': datetime.now(timezone.utc).isoformat()
+        }
+        try:
+            self.db.table(self.TABLE).upsert(row, on_conflict='user_id,broker,account').execute()
+        except Exception as e:
+            # Dedup on external_id still protects a replayed page, so a failed
+            # checkpoint only costs re-fetching on the next sync
+            logger.error(f"Error saving sync state for {state['broker']}: {e}")
+
+
+class BrokerSyncService:
+    """
+    Imports broker transactions, fetching only fills newer than the stored
+    watermark and checkpointing the page cursor so an interrupted sync
+    (crash, rate limit) resumes where it stopped.
+    
+    Sync state per (user, broker, account):
+        cursor: next page of an interrupted run (None when idle)
+        last_trade_time: newest trade_time fully imported (the watermark)
+        pending_trade_time: newest trade_time seen by the interrupted run
+    """
+    
+    def __init__(self, transaction_service, state_store: SyncStateStore):
+        self.transaction_service = transaction_service
+        self.state_store = state_store
+    
+    def import_transactions(
+        self,
+        user_id: str,
+        transactions: List[Dict],
+        known_ids: Optional[Dict[str, set]] = None,
+        job=None
+    ) -> Dict:
+        """
+        Insert normalized broker transactions, skipping ones already imported
+        
+        Args:
+            user_id: User ID
+            transactions: Normalized transactions from a broker service
+            known_ids: Optional {source: external_ids} already imported; loaded
+                lazily per source and updated in place as transactions are added
+            job: Optional background Job for cancellation checks
+        
+        Returns:
+            Dictionary with imported/skipped counts and errors
+        """
+        if known_ids is None:
+            known_ids = {}
+        
+        imported_count = 0
+        skipped_count = 0
+        errors = []
+        
+        for transaction in transactions:
+            if job:
+                job.check_cancelled()
+            try:
+                # Add user ID and ensure required fields
+                transaction['userId'] = user_id
+                source = transaction.get('source')
+                external_id = transaction.get('external_id')
+                
+                # Check for duplicate using external_id
+                if external_id:
+                    if source not in known_ids:
+                        known_ids[source] = self.transaction_service.get_external_ids(user_id, source)
+                    
+                    if external_id in known_ids[source]:
+                        skipped_count += 1
+                        logger.debug("Skipping duplicate transaction: %s (source: %s)", external_id, source)
+                        continue
+                else:
+                    # If no external_id, log a warning
+                    logger.warning("Transaction missing external_id: %s %s", transaction.get('symbol'), transaction.get('type'))
+                
+                # Add transaction
+                result, status_code = self.transaction_service.add_transaction(transaction)
+                if status_code == 201:
+                    imported_count += 1
+                    if external_id:
+                        known_ids[source].add(external_id)
+                    logger.debug("Imported transaction: %s %s (external_id: %s)", transaction.get('symbol'), transaction.get('type'), external_id)
+                else:
+                    error_msg = result.get('error', 'Unknown error') if isinstance(result, dict) else str(result)
+                    logger.error("Failed to import transaction: %s", error_msg)
+                    errors.append({
+                        "transaction": external_id or transaction.get('symbol', 'unknown'),
+                        "error": error_msg
+                    })
+            except Exception as e:
+                logger.error("Error importing transaction: %s", e)
+                errors.append({
+                    "transaction": transaction.get('external_id', 'unknown'),
+                    "error": str(e)
+                })
+        
+        return {
+            "imported": imported_count,
+            "skipped": skipped_count,
+            "errors": errors
+        }
+    
+    def sync(self, user_id: str, broker: str, broker_service, job=None) -> Dict:
+        """
+        Incrementally sync a broker account
+        
+        If a previous run was interrupted, it is resumed from the saved cursor
+        first; a fresh pass from the newest fill down to the watermark follows,
+        so fills that arrived after the interruption are picked up as well.
+        
+        Args:
+            user_id: User ID
+            broker: Broker name (also the transaction source)
+            broker_service: Broker service exposing iter_fill_pages()
+            job: Optional background Job for progress reporting and cancellation
+        
+        Returns:
+            Dictionary with import totals and the resulting sync state
+        """
+        state = self.state_store.get(user_id, broker, broker_service.account_id)
+        first_sync = not state.get('last_trade_time') and not state.get('cursor')
+        resumed = bool(state.get('cursor'))
+        known_ids = {broker: self.transaction_service.get_external_ids(user_id, broker)}
+        
+        totals = {"imported": 0, "skipped": 0, "total": 0, "pages": 0, "errors": []}
+        
+        if resumed:
+            logger.info(f"Resuming interrupted {broker} sync for user {user_id}")
+            self._run_pass(user_id, broker_service, state, state['cursor'], known_ids, totals, job)
+        self._run_pass(user_id, broker_service, state, None, known_ids, totals, job)
+        
+        return {
+            **totals,
+            "first_sync": first_sync,
+            "resumed": resumed,
+            "watermark": state.get('last_trade_time')
+        }
+    
+    def fetch_new(self, user_id: str, broker: str, broker_service, job=None) -> tuple:
+        """
+        Fetch fills newer than the watermark without importing them
+        
+        Used when several accounts are fetched concurrently and imported in one
+        merged stage. Nothing is checkpointed; pass the returned state to
+        commit() once the transactions are imported, so a failed import simply
+        re-fetches from the same watermark next time.
+        
+        Returns:
+            (transactions, state, pages)
+        """
+        state = self.state_store.get(user_id, broker, broker_service.account_id)
+        watermark = _parse_timestamp(state.get('last_trade_time'))
+        
+        transactions = []
+        newest = None
+        pages = 0
+        for page in broker_service.iter_fill_pages(since=watermark):
+            transactions.extend(page['transactions'])
+            pages += 1
+            page_newest = page.get('newest_trade_time')
+            if page_newest and (newest is None or page_newest > newest):
+                newest = page_newest
+            if job:
+                job.check_cancelled()
+        
+        state['pending_trade_time'] = newest.isoformat() if newest else None
+        return transactions, state, pages
+    
+    def commit(self, state: Dict, advance: bool = True) -> None:
+        """Finish a fetch_new() run, advancing the watermark if the import succeeded"""
+        watermark = _parse_timestamp(state.get('last_trade_time'))
+        pending = _parse_timestamp(state.get('pending_trade_time'))
+        if advance and pending and (watermark is None or pending > watermark):
+            state['last_trade_time'] = pending.isoformat()
+        state['cursor'] = None
+        state['pending_trade_time'] = None
+        state['last_synced_at'] = datetime.now(timezone.utc).isoformat()
+        self.state_store.save(state)
+    
+    def _run_pass(
+        self,
+        user_id: str,
+        broker_service,
+        state: Dict,
+        cursor: Optional[str],
+        known_ids: Dict[str, set],
+        totals: Dict,
+        job=None
+    ) -> None:
+        """Page from `cursor` down to the watermark, checkpointing after each page"""
+        watermark = _parse_timestamp(state.get('last_trade_time'))
+        pending = _parse_timestamp(state.get('pending_trade_time')) if cursor else None
+        pass_errors = 0
+        
+        for page in broker_service.iter_fill_pages(cursor=cursor, since=watermark):
+            result = self.import_transactions(user_id, page['transactions'], known_ids, job)
+            totals['imported'] += result['imported']
+            totals['skipped'] += result['skipped']
+            totals['total'] += len(page['transactions'])
+            totals['pages'] += 1
+            totals['errors'].extend(result['errors'])
+            pass_errors += len(result['errors'])
+            
+            newest = page.get('newest_trade_time')
+            if newest and (pending is None or newest > pending):
+                pending = newest
+            
+            # Checkpoint only after the page is imported so a crash replays it
+            if page['cursor']:
+                state['cursor'] = page['cursor']
+                state['pending_trade_time'] = pending.isoformat() if pending else None
+                self.state_store.save(state)
+            
+            if job:
+                job.update_progress(
+                    pages=totals['pages'],
+                    fetched=totals['total'],
+                    imported=totals['imported'],
+                    skipped=totals['skipped']
+                )
+                job.check_cancelled()
+        
+        # Pass finished: advance the watermark unless something failed to import,
+        # in which case the next sync rescans the same range (dedup skips the rest)
+        state['pending_trade_time'] = pending.isoformat() if pending else None
+        self.commit(state, advance=pass_errors == 0)
+
+
+def _parse_timestamp(value) -> Optional[datetime]:
+    """Parse a stored timestamp into an aware datetime"""
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        try:
+            parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        except ValueError:
+            logger.warning(f"Could not parse sync timestamp: {value}")
+            return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
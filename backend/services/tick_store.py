@@ -0,0 +1,238 @@
+"""
+Intraday price ticks per symbol in fixed-size memory-mapped ring buffers
+
+Each symbol has one file: a 32-byte header (magic, capacity, number of ticks
+ever written) followed by `capacity` (timestamp, price) float64 records. The
+file never grows; once full, each new tick overwrites the oldest, so disk use
+is 32 + 16 * capacity bytes per symbol. A tick is written to its slot before
+the header count is advanced, so readers in other processes, which trust
+only the count, never see a partial record. Writers serialize on an flock of
+the file and drop ticks closer than min_interval to the previous one, so
+several workers fetching the same prices record them once.
+
+Reads are views of the mapping: a time range that does not cross the ring's
+wrap point is returned without copying. Readers take no lock, so the slot
+the next tick goes to is never part of a view: a file keeps the last
+capacity - 1 ticks readable, and a view stays sorted and intact until at
+least one more tick (min_interval later) has been written after it was
+taken. Timestamps are epoch seconds and increase within a file, so ranges
+and as-of lookups are binary searches.
+"""
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are not serialized across processes
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'TICKRNG1'
+HEADER = np.dtype([('magic', 'S8'), ('capacity', '<u8'), ('count', '<u8'), ('reserved', '<u8')])
+TICK = np.dtype([('ts', '<f8'), ('price', '<f8')])
+
+TimeLike = Union[datetime, float, int, None]
+
+
+def to_timestamp(value: TimeLike) -> Optional[float]:
+    """Epoch seconds of a naive (local) or aware datetime, or a number as is"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    return value.timestamp()
+
+
+class TickRing:
+    """One symbol's ring buffer file"""
+
+    def __init__(self, path: str, capacity: int):
+        self.path = path
+        if not os.path.exists(path):
+            self._create(path, capacity)
+        self._file = open(path, 'r+b')
+        self._header = np.memmap(self._file, dtype=HEADER, mode='r+', shape=(1,))
+        if self._header['magic'][0] != MAGIC:
+            raise ValueError(f"{path} is not a tick file")
+        # An existing file keeps the capacity it was created with
+        self.capacity = int(self._header['capacity'][0])
+        if self.capacity != capacity:
+            logger.info(f"{path} holds {self.capacity} ticks (configured: {capacity})")
+        self._records = np.memmap(self._file, dtype=TICK, mode='r+', offset=HEADER.itemsize, shape=(self.capacity,))
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _create(path: str, capacity: int) -> None:
+        # Built under a temporary name, so other processes only ever open complete files
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, 'wb') as f:
+            f.write(np.array([(MAGIC, capacity, 0, 0)], dtype=HEADER).tobytes())
+            f.truncate(HEADER.itemsize + capacity * TICK.itemsize)
+        try:
+            os.link(temp, path)  # fails if another process created it first
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temp)
+
+    @property
+    def count(self) -> int:
+        """Ticks ever written (the last capacity - 1 of them are readable)"""
+        return int(self._header['count'][0])
+
+    def append(self, timestamp: float, price: float, min_interval: float = 0) -> bool:
+        """Write a tick unless it is not at least min_interval newer than the last one"""
+        with self._lock:
+            if fcntl:
+                fcntl.flock(self._file, fcntl.LOCK_EX)
+            try:
+                count = self.count
+                if count and timestamp < self._records['ts'][(count - 1) % self.capacity] + max(min_interval, 1e-6):
+                    return False
+                self._records[count % self.capacity] = (timestamp, price)
+                self._header['count'] = count + 1
+                return True
+            finally:
+                if fcntl:
+                    fcntl.flock(self._file, fcntl.LOCK_UN)
+
+    def segments(self) -> List[np.ndarray]:
+        """
+        The readable ticks as at most two read-only views, oldest first
+
+        The slot the next append() writes is left out, so at most capacity - 1
+        ticks are readable and a view is only overwritten once another tick,
+        at least min_interval later, has been appended after it was taken.
+        """
+        count = self.count
+        records = self._records.view(np.ndarray)
+        readable = min(count, self.capacity - 1)
+        first = (count - readable) % self.capacity
+        if first + readable <= self.capacity:
+            parts = [records[first:first + readable]]
+        else:
+            parts = [records[first:], records[:first + readable - self.capacity]]
+        views = []
+        for part in parts:
+            if len(part):
+                view = part[:]
+                view.flags.writeable = False
+                views.append(view)
+        return views
+
+    def range(self, start: Optional[float] = None, end: Optional[float] = None) -> np.ndarray:
+        """Ticks with start <= ts <= end; a view unless the range crosses the wrap point"""
+        parts = []
+        for segment in self.segments():
+            lo = 0 if start is None else int(np.searchsorted(segment['ts'], start, side='left'))
+            hi = len(segment) if end is None else int(np.searchsorted(segment['ts'], end, side='right'))
+            if hi > lo:
+                parts.append(segment[lo:hi])
+        if not parts:
+            return np.empty(0, dtype=TICK)
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def at(self, when: float) -> Optional[Tuple[float, float]]:
+        """The last (timestamp, price) at or before `when`"""
+        for segment in reversed(self.segments()):
+            index = int(np.searchsorted(segment['ts'], when, side='right'))
+            if index:
+                return float(segment['ts'][index - 1]), float(segment['price'][index - 1])
+        return None
+
+    def close(self) -> None:
+        with self._lock:
+            self._records.flush()
+            self._header.flush()
+            del self._records, self._header
+            self._file.close()
+
+
+class TickStore:
+    """
+    Ring buffers of fetched prices, one file per symbol under `directory`
+
+    Register record() as a TransactionService price listener to keep every
+    CoinGecko response instead of dropping it when the price cache expires.
+    """
+
+    def __init__(self, directory: str, capacity: int = 32768, min_interval: float = 30):
+        self.directory = directory
+        self.capacity = capacity
+        self.min_interval = min_interval
+        self._rings: Dict[str, TickRing] = {}
+        self._lock = threading.Lock()
+
+    def record(self, prices: Dict[str, float], timestamp: Optional[float] = None) -> int:
+        """Append one tick per symbol with a positive price; returns how many were written"""
+        timestamp = time.time() if timestamp is None else timestamp
+        written = 0
+        for symbol, price in prices.items():
+            ring = self._ring(symbol, create=True) if price and price > 0 else None
+            if ring is not None:
+                written += ring.append(timestamp, float(price), self.min_interval)
+        return written
+
+    def symbols(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name[:-len('.ticks')] for name in os.listdir(self.directory) if name.endswith('.ticks'))
+
+    def ticks(self, symbol: str, start: TimeLike = None, end: TimeLike = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(timestamps, prices) recorded in [start, end], oldest first"""
+        ring = self._ring(symbol)
+        if ring is None:
+            return np.empty(0), np.empty(0)
+        ticks = ring.range(to_timestamp(start), to_timestamp(end))
+        return ticks['ts'], ticks['price']
+
+    def price_at(self, symbol: str, when: TimeLike, max_age: Optional[float] = None) -> Optional[float]:
+        """Last price recorded at or before `when`, if not older than max_age seconds"""
+        ring = self._ring(symbol)
+        when = to_timestamp(when)
+        tick = ring.at(when) if ring is not None else None
+        if tick is None or (max_age is not None and when - tick[0] > max_age):
+            return None
+        return tick[1]
+
+    def prices_at(self, symbols: Iterable[str], when: TimeLike, max_age: Optional[float] = None) -> Dict[str, float]:
+        """price_at() for several symbols; symbols without a recent enough tick are left out"""
+        prices = {}
+        for symbol in symbols:
+            price = self.price_at(symbol, when, max_age)
+            if price is not None:
+                prices[symbol] = price
+        return prices
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            rings = dict(self._rings)
+        return {
+            symbol: {'stored': min(ring.count, ring.capacity - 1), 'written': ring.count, 'capacity': ring.capacity}
+            for symbol, ring in rings.items()
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            rings, self._rings = self._rings, {}
+        for ring in rings.values():
+            ring.close()
+
+    def _ring(self, symbol: str, create: bool = False) -> Optional[TickRing]:
+        symbol = symbol.upper()
+        if not symbol.replace('-', '').replace('_', '').isalnum():
+            return None  # symbols name files
+        with self._lock:
+            ring = self._rings.get(symbol)
+            if ring is None:
+                path = os.path.join(self.directory, f"{symbol}.ticks")
+                if not create and not os.path.exists(path):
+                    return None
+                os.makedirs(self.directory, exist_ok=True)
+                ring = self._rings[symbol] = TickRing(path, self.capacity)
+            return ring
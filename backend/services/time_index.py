@@ -0,0 +1,198 @@
+"""
+Per-user time index over transactions for date-range analytics
+"""
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+from datetime import datetime
+import logging
+
+import numpy as np
+
+from services.repositories import VISIBLE_STATUSES
+
+logger = logging.getLogger(__name__)
+
+# Dates are compared as naive wall-clock times, as the analytics always have:
+# timezone offsets are dropped rather than converted
+_EPOCH = datetime(1970, 1, 1)
+
+DateLike = Union[datetime, str, None]
+
+
+class TimeIndex:
+    """
+    Transactions sorted by time with prefix sums, for O(log n) range queries
+
+    Dates are parsed once into a sorted epoch array. Prefix sums of cost
+    (signed value), volume and buy/sell counts cover the whole portfolio; each
+    symbol also gets its own sorted epochs with prefix sums of signed coins and
+    cost. Any [start, end] range is then two binary searches and a difference
+    of prefix sums, and a series of dates is one vectorized searchsorted.
+    Bounds are inclusive, matching the original linear filters.
+    """
+
+    def __init__(self, transactions: Iterable[Dict]):
+        visible = [
+            transaction for transaction in transactions
+            if transaction.get('status', 'active') in VISIBLE_STATUSES
+        ]
+        epochs = parse_epochs([transaction.get('date') for transaction in visible])
+        parsed = ~np.isnan(epochs)
+        if not parsed.all():
+            logger.debug("Time index skipped %d transactions without a parseable date", int((~parsed).sum()))
+            visible = [transaction for transaction, ok in zip(visible, parsed) if ok]
+            epochs = epochs[parsed]
+
+        order = np.argsort(epochs, kind='stable')
+        visible = [visible[i] for i in order]
+        self.size = len(visible)
+        self.epochs = epochs[order]
+        types = [transaction.get('type', '').lower() for transaction in visible]
+        buys = np.array([t == 'buy' for t in types], dtype=bool)
+        sells = np.array([t == 'sell' for t in types], dtype=bool)
+        sign = buys.astype(np.float64) - sells
+        coins = np.array([float(transaction.get('coins', 0)) for transaction in visible], dtype=np.float64)
+        values = np.array([float(transaction.get('value_usd', 0)) for transaction in visible], dtype=np.float64)
+
+        self._cum_cost = _prefix(sign * values)
+        self._cum_volume = _prefix(values)
+        self._cum_buys = _prefix(buys.astype(np.int64))
+        self._cum_sells = _prefix(sells.astype(np.int64))
+
+        # Per-fill arrays in time order, for consumers that aggregate them differently
+        self.coin_deltas = sign * coins
+        self.cost_deltas = sign * values
+
+        # Per symbol: its own epochs and prefix sums of signed coins and cost
+        symbols = np.array([transaction.get('symbol', '').upper() for transaction in visible], dtype=object)
+        self._symbols: Dict[str, tuple] = {}
+        self.symbol_codes = np.zeros(self.size, dtype=np.int64)  # position in self.symbols
+        for code, symbol in enumerate(sorted(set(symbols.tolist()))):
+            positions = np.flatnonzero(symbols == symbol)
+            self.symbol_codes[positions] = code
+            self._symbols[symbol] = (
+                self.epochs[positions],
+                _prefix(sign[positions] * coins[positions]),
+                _prefix(sign[positions] * values[positions])
+            )
+
+    @property
+    def symbols(self) -> List[str]:
+        return list(self._symbols)
+
+    def holdings_at(self, when: DateLike) -> Dict[str, Dict]:
+        """Net {'coins', 'total_value'} per symbol over transactions up to `when`"""
+        if when is None:
+            return {}
+        t = to_epoch(when)
+        holdings = {}
+        for symbol, (epochs, cum_coins, cum_cost) in self._symbols.items():
+            count = int(np.searchsorted(epochs, t, side='right'))
+            if count:
+                holdings[symbol] = {"coins": float(cum_coins[count]), "total_value": float(cum_cost[count])}
+        return holdings
+
+    def portfolio_at(self, when: DateLike) -> Dict:
+        """Holdings and cost basis at `when`; value is the cost until historical prices exist"""
+        holdings = self.holdings_at(when)
+        total_cost = sum(h["total_value"] for h in holdings.values())
+        return {'total_cost': total_cost, 'total_value': total_cost, 'holdings': holdings}
+
+    def cost_at(self, when: DateLike) -> float:
+        """Net cost basis of everything bought/sold up to `when`"""
+        if when is None:
+            return 0.0
+        return float(self._cum_cost[np.searchsorted(self.epochs, to_epoch(when), side='right')])
+
+    def cost_series(self, dates: Sequence[DateLike]) -> np.ndarray:
+        """cost_at() for many dates in one vectorized search"""
+        points = np.array([to_epoch(date) for date in dates], dtype=np.float64)
+        return self._cum_cost[np.searchsorted(self.epochs, points, side='right')]
+
+    def activity(self, start: DateLike = None, end: DateLike = None) -> Dict:
+        """Transaction, buy and sell counts and volume in [start, end] (open-ended when None)"""
+        lo, hi = self._bounds(start, end)
+        return {
+            'transactions': hi - lo,
+            'buys': int(self._cum_buys[hi] - self._cum_buys[lo]),
+            'sells': int(self._cum_sells[hi] - self._cum_sells[lo]),
+            'volume': float(self._cum_volume[hi] - self._cum_volume[lo]),
+            'net_cost': float(self._cum_cost[hi] - self._cum_cost[lo])
+        }
+
+    def flows(self, start: DateLike = None, end: DateLike = None) -> Dict[str, Dict]:
+        """Net coins and cost added per symbol in [start, end]"""
+        flows = {}
+        for symbol, (epochs, cum_coins, cum_cost) in self._symbols.items():
+            lo = 0 if start is None else int(np.searchsorted(epochs, to_epoch(start), side='left'))
+            hi = len(epochs) if end is None else int(np.searchsorted(epochs, to_epoch(end), side='right'))
+            if hi > lo:
+                flows[symbol] = {
+                    "coins": float(cum_coins[hi] - cum_coins[lo]),
+                    "total_value": float(cum_cost[hi] - cum_cost[lo])
+                }
+        return flows
+
+    def rolling_activity(self, ends: Sequence[DateLike], window_seconds: float) -> Dict[str, np.ndarray]:
+        """activity() over the trailing window ending at each date, vectorized"""
+        end_points = np.array([to_epoch(end) for end in ends], dtype=np.float64)
+        hi = np.searchsorted(self.epochs, end_points, side='right')
+        lo = np.searchsorted(self.epochs, end_points - window_seconds, side='left')
+        return {
+            'transactions': hi - lo,
+            'buys': self._cum_buys[hi] - self._cum_buys[lo],
+            'sells': self._cum_sells[hi] - self._cum_sells[lo],
+            'volume': self._cum_volume[hi] - self._cum_volume[lo],
+            'net_cost': self._cum_cost[hi] - self._cum_cost[lo]
+        }
+
+    def _bounds(self, start: DateLike, end: DateLike) -> tuple:
+        lo = 0 if start is None else int(np.searchsorted(self.epochs, to_epoch(start), side='left'))
+        hi = self.size if end is None else int(np.searchsorted(self.epochs, to_epoch(end), side='right'))
+        return lo, max(lo, hi)
+
+
+def to_epoch(value: DateLike) -> Optional[float]:
+    """Seconds since 1970 of a datetime or ISO string, ignoring its timezone"""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    return (value.replace(tzinfo=None) - _EPOCH).total_seconds()
+
+
+def parse_epochs(dates: Sequence) -> np.ndarray:
+    """
+    to_epoch() for a column of dates, NaN where unparseable
+
+    Stored dates share one ISO format, so after trimming the offset (which is
+    ignored anyway) numpy parses the whole column at once; anything it rejects
+    falls back to parsing row by row.
+    """
+    try:
+        wall_clock = np.array([_strip_offset(date) for date in dates], dtype='datetime64[us]')
+        if not np.isnat(wall_clock).any():
+            return wall_clock.astype(np.int64) / 1e6
+    except (TypeError, ValueError):
+        pass
+    epochs = [to_epoch(date) for date in dates]
+    return np.array([np.nan if epoch is None else epoch for epoch in epochs], dtype=np.float64)
+
+
+def _strip_offset(date):
+    if not isinstance(date, str):
+        raise TypeError(date)
+    if date.endswith('Z'):
+        return date[:-1]
+    if len(date) > 19 and date[-6] in '+-' and date[-3] == ':':
+        return date[:-6]
+    return date
+
+
+def _prefix(values: np.ndarray) -> np.ndarray:
+    """Prefix sums with a leading zero: sum(values[lo:hi]) == out[hi] - out[lo]"""
+    out = np.zeros(len(values) + 1, dtype=values.dtype)
+    np.cumsum(values, out=out[1:])
+    return out
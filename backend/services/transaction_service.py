@@ -1,22 +1,46 @@
 """
-Transaction service for managing cryptocurrency transactions using Supabase
+Transaction service for managing cryptocurrency transactions
+
+Storage goes through a TransactionRepository: Supabase (PostgREST) by default,
+or a direct Postgres/SQLite backend from services/repositories.py
 """
-from typing import List, Dict, Optional
+from typing import Iterable, Iterator, List, Dict, Optional
 from datetime import datetime, timedelta
-from collections import defaultdict
+import base64
+import json
 import logging
 import requests
 import time
 from supabase import Client
+from services.rate_limiter import get_rate_limiter, RateLimitTimeout
+from services.metrics import span
+from services.repositories import (
+    TRANSACTION_COLUMNS, SupabaseTransactionRepository, TransactionRepository, fold_holdings
+)
+from services.lot_engine import LOT_FIELDS, LotBooks
 
 logger = logging.getLogger(__name__)
 
+# Columns needed to summarize holdings
+PORTFOLIO_FIELDS = ['symbol', 'type', 'value_usd', 'coins']
+
 class TransactionService:
-    """Service for transaction operations using Supabase"""
+    """Service for transaction operations"""
     
-    def __init__(self, supabase_client: Client):
+    def __init__(self, supabase_client: Optional[Client], result_cache=None, price_cache_seconds: int = 60,
+                 price_url: Optional[str] = None, repository: Optional[TransactionRepository] = None):
         self.db = supabase_client
-        self.price_url = "https://api.coingecko.com/api/v3/simple/price?vs_currencies=usd"
+        # Storage backend; PostgREST through the Supabase client unless another is given
+        self.repository = repository or SupabaseTransactionRepository(supabase_client)
+        # Optional ResultCache; writes bump the user's data version
+        self.result_cache = result_cache
+        # Callables notified with the user_id after their transactions change
+        self._change_listeners = []
+        # Callables notified with ({symbol: usd}, fetched_at) after each price fetch
+        self._price_listeners = []
+        # Tax-lot engines per user, updated incrementally by single-transaction writes
+        self.lot_books = LotBooks()
+        self.price_url = price_url or "https://api.coingecko.com/api/v3/simple/price?vs_currencies=usd"
         self.symbol_coin_mapping = {
             "BTC": "bitcoin",
             "ETH": "ethereum",
@@ -34,48 +58,17 @@ class TransactionService:
         # Simple in-memory cache for prices (expires after 60 seconds)
         self._price_cache = {}
         self._price_cache_time = {}
-        self._cache_duration = 60  # Cache for 60 seconds
+        self._cache_duration = price_cache_seconds  # Cache for 60 seconds by default
+        # Shared CoinGecko limiter; refreshes queue for a token instead of failing
+        self._price_limiter = get_rate_limiter('coingecko')
+        self._price_max_wait = 15
     
     def add_transaction(self, data: Dict) -> tuple:
         """Add a new transaction"""
         try:
-            # Prepare transaction data
-            transaction_data = {
-                'name': data.get('name', ''),
-                'symbol': data.get('symbol', '').upper(),
-                'type': data.get('type', '').lower(),
-                'value_usd': float(data.get('value_usd', 0)),
-                'purchased_price': float(data.get('purchased_price', 0)),
-                'coins': float(data.get('coins', 0)),
-                'status': data.get('status', 'active'),
-                'created_by': data.get('createdBy', data.get('created_by', 'system')),
-                'user_id': data.get('userId', data.get('user_id', 'default')),
-                'source': data.get('source', 'manual'),
-                'external_id': data.get('external_id')
-            }
-            
-            # Handle date - Supabase expects ISO format string or None
-            if data.get('date'):
-                if isinstance(data['date'], str):
-                    # Already a string, use it directly (Supabase will parse it)
-                    transaction_data['date'] = data['date']
-                elif isinstance(data['date'], datetime):
-                    # Convert datetime to ISO string
-                    transaction_data['date'] = data['date'].isoformat()
-                else:
-                    # Try to convert to string
-                    transaction_data['date'] = str(data['date'])
-            # If no date, database will use DEFAULT NOW()
-            
-            # Validation
-            required_fields = ['value_usd', 'purchased_price', 'coins', 'symbol', 'type']
-            for field in required_fields:
-                if transaction_data.get(field) is None or transaction_data[field] == '':
-                    return {'error': f'Field {field} is required'}, 400
-            
-            # Validate transaction type
-            if transaction_data['type'] not in ['buy', 'sell']:
-                return {'error': 'Transaction type must be "buy" or "sell"'}, 400
+            transaction_data, error = self._prepare_transaction(data)
+            if error:
+                return {'error': error}, 400
             
             # For sell transactions, validate sufficient holdings
             if transaction_data['type'] == 'sell':
@@ -84,128 +77,230 @@ class TransactionService:
                     return {'error': f'Insufficient holdings. You have {holdings["coins"]} {transaction_data["symbol"]}'}, 400
             
             # Insert transaction
-            result = self.db.table('transactions').insert(transaction_data).execute()
+            stored = self.repository.insert(transaction_data)
             
-            if result.data and len(result.data) > 0:
-                transaction_id = result.data[0]['id']
+            if stored:
+                transaction_id = stored['id']
+                self.lot_books.apply(transaction_data['user_id'], {**transaction_data, **stored})
+                self._data_changed(transaction_data['user_id'])
                 return {'message': 'Transaction added successfully', 'id': transaction_id}, 201
             else:
                 return {'error': 'Failed to insert transaction'}, 500
             
         except Exception as e:
-            logger.error(f"Error adding transaction: {e}")
+            logger.error("Error adding transaction: %s", e)
             return {'error': str(e)}, 500
     
-    def get_transactions(self, user_id: Optional[str] = None, limit: int = 50) -> tuple:
-        """Get all transactions"""
-        try:
-            query = self.db.table('transactions')\
-                .select('*')\
-                .in_('status', ['active', 'pending'])
+    def add_transactions_bulk(self, transactions: Iterable[Dict], chunk_size: int = 500, job=None) -> Dict:
+        """
+        Insert many transactions with one insert per chunk
+        
+        Transactions must arrive in chronological order: each sell is validated
+        against the stored holdings plus the earlier transactions of the same
+        batch, so a buy and a later sell imported together are both accepted.
+        
+        Args:
+            transactions: Transactions in chronological order (any iterable)
+            chunk_size: Rows per insert request
+            job: Optional background Job for cancellation checks between chunks
+        
+        Returns:
+            Dictionary with the imported count and per-transaction errors
+        """
+        holdings = {}  # (user_id, symbol) -> running coin balance
+        pending = []
+        imported = 0
+        errors = []
+        
+        for data in transactions:
+            try:
+                transaction_data, error = self._prepare_transaction(data)
+            except (TypeError, ValueError) as e:
+                transaction_data, error = None, str(e)
+            if error:
+                errors.append(_bulk_error(data, error))
+                continue
+            
+            key = (transaction_data['user_id'], transaction_data['symbol'])
+            if key not in holdings:
+                holdings[key] = self._get_holdings(key[1], key[0])['coins']
             
-            if user_id:
-                query = query.eq('user_id', user_id)
-            
-            # Order by date descending and limit
-            result = query.order('date', desc=True).limit(limit).execute()
-            
-            transactions_list = []
-            for transaction in result.data:
-                # Convert datetime to ISO format string
-                if 'date' in transaction and transaction['date']:
-                    if isinstance(transaction['date'], str):
-                        transactions_list.append(transaction)
-                    else:
-                        # Convert datetime object to ISO string
-                        transaction['date'] = transaction['date'].isoformat()
-                        transactions_list.append(transaction)
-                else:
-                    transactions_list.append(transaction)
+            if transaction_data['type'] == 'sell':
+                if holdings[key] < transaction_data['coins']:
+                    errors.append(_bulk_error(data, f'Insufficient holdings. You have {holdings[key]} {key[1]}'))
+                    continue
+                holdings[key] -= transaction_data['coins']
+            else:
+                holdings[key] += transaction_data['coins']
+            
+            pending.append(transaction_data)
+            if len(pending) >= chunk_size:
+                imported += self._insert_chunk(pending, errors)
+                pending = []
+                if job:
+                    job.update_progress(imported=imported)
+                    job.check_cancelled()
+        
+        if pending:
+            imported += self._insert_chunk(pending, errors)
+        
+        return {'imported': imported, 'errors': errors}
+    
+    def _insert_chunk(self, rows: List[Dict], errors: List[Dict]) -> int:
+        """Insert prepared rows in one request, recording an error per row on failure"""
+        try:
+            return self.repository.insert_many(rows)
+        except Exception as e:
+            logger.error("Error bulk inserting %d transactions: %s", len(rows), e)
+            errors.extend(_bulk_error(row, str(e)) for row in rows)
+            return 0
+        finally:
+            # A failed request may still have written rows, so always invalidate
+            for user_id in {row['user_id'] for row in rows}:
+                self.lot_books.invalidate(user_id)
+                self._data_changed(user_id)
+    
+    def _prepare_transaction(self, data: Dict) -> tuple:
+        """Build and validate a transaction row; returns (row, None) or (None, error)"""
+        transaction_data = {
+            'name': data.get('name', ''),
+            'symbol': data.get('symbol', '').upper(),
+            'type': data.get('type', '').lower(),
+            'value_usd': float(data.get('value_usd', 0)),
+            'purchased_price': float(data.get('purchased_price', 0)),
+            'coins': float(data.get('coins', 0)),
+            'status': data.get('status', 'active'),
+            'created_by': data.get('createdBy', data.get('created_by', 'system')),
+            'user_id': data.get('userId', data.get('user_id', 'default')),
+            'source': data.get('source', 'manual'),
+            'external_id': data.get('external_id')
+        }
+        
+        # Handle date - Supabase expects ISO format string or None
+        if data.get('date'):
+            if isinstance(data['date'], str):
+                # Already a string, use it directly (Supabase will parse it)
+                transaction_data['date'] = data['date']
+            elif isinstance(data['date'], datetime):
+                # Convert datetime to ISO string
+                transaction_data['date'] = data['date'].isoformat()
+            else:
+                # Try to convert to string
+                transaction_data['date'] = str(data['date'])
+        # If no date, database will use DEFAULT NOW()
+        
+        # Validation
+        required_fields = ['value_usd', 'purchased_price', 'coins', 'symbol', 'type']
+        for field in required_fields:
+            if transaction_data.get(field) is None or transaction_data[field] == '':
+                return None, f'Field {field} is required'
+        
+        # Validate transaction type
+        if transaction_data['type'] not in ['buy', 'sell']:
+            return None, 'Transaction type must be "buy" or "sell"'
+        
+        return transaction_data, None
+    
+    def get_transactions(self, user_id: Optional[str] = None, limit: Optional[int] = 50, fields: Optional[List[str]] = None) -> tuple:
+        """Get all transactions (limit=None pages through every active/pending row)"""
+        try:
+            if limit is None:
+                return list(self.iter_transactions(user_id, fields=fields)), 200
             
-            return transactions_list, 200
+            body, status_code = self.get_transactions_page(user_id, limit=limit, fields=fields)
+            if status_code != 200:
+                return [], 200
+            return body['transactions'], 200
         except Exception as e:
-            logger.error(f"Error fetching transactions: {e}")
-            import traceback
-            logger.error(traceback.format_exc())
+            logger.error(f"Error fetching transactions: {e}", exc_info=True)
             # Return empty list on error instead of error dict to maintain consistent return type
             return [], 200
     
+    def get_transactions_page(
+        self,
+        user_id: Optional[str] = None,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        fields: Optional[List[str]] = None
+    ) -> tuple:
+        """
+        Get one page of transactions, newest first, with keyset pagination
+        
+        Rows are ordered by (date, id) descending and the cursor encodes the
+        last row's (date, id), so each page is an index range scan on
+        idx_transactions_user_status_date rather than an OFFSET that re-reads
+        every earlier page.
+        
+        Args:
+            user_id: User ID
+            limit: Page size
+            cursor: next_cursor from the previous page
+            fields: Columns to return (default: all)
+        
+        Returns:
+            ({'transactions', 'next_cursor'}, status_code)
+        """
+        if fields:
+            unknown = [field for field in fields if field not in TRANSACTION_COLUMNS]
+            if unknown:
+                return {'error': f"Unknown fields: {', '.join(unknown)}"}, 400
+            # The cursor is built from date and id
+            columns = list(dict.fromkeys([*fields, 'date', 'id']))
+        else:
+            columns = None
+        
+        after = None
+        if cursor:
+            after = _decode_cursor(cursor)
+            if not after:
+                return {'error': 'Invalid cursor'}, 400
+        
+        # Fetch one extra row to know whether another page exists; the extra
+        # row must fit under the backend's row cap or it is silently dropped
+        if self.repository.max_rows:
+            limit = min(limit, self.repository.max_rows - 1)
+        rows = [_normalize_row(row) for row in self.repository.page(user_id, columns, after, limit + 1)]
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(rows[-1])
+        
+        # Drop the cursor columns if they were not requested
+        if fields and not {'date', 'id'} <= set(fields):
+            rows = [{field: row.get(field) for field in fields} for row in rows]
+        
+        return {'transactions': rows, 'next_cursor': next_cursor}, 200
+    
+    def iter_transactions(
+        self,
+        user_id: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+        page_size: int = 999
+    ) -> Iterator[Dict]:
+        """Stream every active/pending transaction, newest first, one page in memory at a time"""
+        cursor = None
+        while True:
+            body, status_code = self.get_transactions_page(user_id, limit=page_size, cursor=cursor, fields=fields)
+            if status_code != 200:
+                raise ValueError(body.get('error'))
+            yield from body['transactions']
+            cursor = body['next_cursor']
+            if not cursor:
+                return
+    
+    def get_external_ids(self, user_id: str, source: str) -> set:
+        """Get external IDs already imported for a user from a given source"""
+        try:
+            return self.repository.external_ids(user_id, source)
+        except Exception as e:
+            logger.error(f"Error fetching external IDs: {e}")
+            return set()
+    
     def get_coin_wise_details(self, user_id: Optional[str] = None) -> Dict:
         """Get portfolio details grouped by coin"""
         try:
-            query = self.db.table('transactions')\
-                .select('*')\
-                .in_('status', ['active', 'pending'])
-            
-            if user_id:
-                query = query.eq('user_id', user_id)
-            
-            result = query.execute()
-            
-            collection = defaultdict(lambda: {"coins": 0, "total_value": 0})
-            
-            for transaction in result.data:
-                coin = transaction.get('symbol', '')
-                transaction_type = transaction.get('type', '').lower()
-                transaction_value = float(transaction.get('value_usd', 0))
-                transaction_coins = float(transaction.get('coins', 0))
-                
-                if transaction_type == "buy":
-                    collection[coin]["coins"] += transaction_coins
-                    collection[coin]["total_value"] += transaction_value
-                elif transaction_type == "sell":
-                    collection[coin]["coins"] -= transaction_coins
-                    collection[coin]["total_value"] -= transaction_value
-            
-            # Fetch current prices for all coins
-            symbols = list(collection.keys())
-            if symbols:
-                prices = self._fetch_prices(symbols)
-                
-                portfolio_summary = {
-                    "total_cost": 0,
-                    "total_value": 0,
-                    "gain": 0,
-                    "gain_percent": 0,
-                    "coins": {}
-                }
-                
-                for symbol, details in collection.items():
-                    if details["coins"] > 0:
-                        coin_id = self.symbol_coin_mapping.get(symbol, symbol.lower())
-                        current_price = prices.get(coin_id, 0)
-                        current_value = details["coins"] * current_price
-                        
-                        portfolio_summary["total_cost"] += details["total_value"]
-                        portfolio_summary["total_value"] += current_value
-                        
-                        coin_gain = current_value - details["total_value"]
-                        coin_gain_percent = (coin_gain / details["total_value"] * 100) if details["total_value"] > 0 else 0
-                        
-                        portfolio_summary["coins"][symbol] = {
-                            "coins": details["coins"],
-                            "cost": details["total_value"],
-                            "value": current_value,
-                            "gain": coin_gain,
-                            "gain_percent": coin_gain_percent,
-                            "price": current_price
-                        }
-                
-                portfolio_summary["gain"] = portfolio_summary["total_value"] - portfolio_summary["total_cost"]
-                portfolio_summary["gain_percent"] = (
-                    (portfolio_summary["gain"] / portfolio_summary["total_cost"] * 100)
-                    if portfolio_summary["total_cost"] > 0 else 0
-                )
-                
-                return portfolio_summary
-            
-            return {
-                "total_cost": 0,
-                "total_value": 0,
-                "gain": 0,
-                "gain_percent": 0,
-                "coins": {}
-            }
+            return self.value_holdings(self.get_holdings(user_id))
             
         except Exception as e:
             logger.error(f"Error fetching coin-wise details: {e}")
@@ -217,6 +312,97 @@ class TransactionService:
                 "coins": {}
             }
     
+    def summarize_portfolio(self, transactions: Iterable[Dict], prices: Optional[Dict[str, float]] = None) -> Dict:
+        """
+        Portfolio summary grouped by coin from loaded or streamed transactions
+        
+        Args:
+            transactions: Active/pending transactions for one user (any iterable)
+            prices: Optional {coin_id: usd} prices; fetched when not given
+        """
+        return self.value_holdings(self.aggregate_holdings(transactions), prices)
+    
+    def get_holdings(self, user_id: Optional[str]) -> Dict[str, Dict]:
+        """
+        Net coins and cost basis per symbol for a user
+        
+        Aggregated by the database when the repository supports it; otherwise
+        the rows are streamed with only the columns the sums need.
+        """
+        holdings = self.repository.aggregate_holdings(user_id)
+        if holdings is not None:
+            return holdings
+        return self.aggregate_holdings(self.iter_transactions(user_id, fields=PORTFOLIO_FIELDS))
+    
+    def aggregate_holdings(self, transactions: Iterable[Dict]) -> Dict[str, Dict]:
+        """Net coins and cost basis per symbol: {symbol: {'coins', 'total_value'}}"""
+        # Includes paging time when transactions is a streamed iterator
+        with span('aggregate_holdings'):
+            return fold_holdings(transactions)
+    
+    def get_lot_engine(self, user_id: str, method: str = 'fifo'):
+        """The user's tax-lot engine, built on first use and then kept current by writes"""
+        return self.lot_books.get(user_id, method, lambda: self.iter_transactions(user_id, fields=LOT_FIELDS))
+    
+    def get_pnl(self, user_id: str, method: str = 'fifo') -> Dict:
+        """Realized and unrealized P&L per coin from tax lots matched by method"""
+        engine = self.get_lot_engine(user_id, method)
+        with engine.lock:
+            symbols = [symbol for symbol, book in engine.books.items() if book.fills]
+        prices = self.get_symbol_prices(symbols)
+        with engine.lock:
+            return engine.report(prices)
+    
+    def get_symbol_prices(self, symbols: List[str]) -> Dict[str, float]:
+        """Current {symbol: usd} prices (0 where unknown)"""
+        prices = self._fetch_prices(symbols) if symbols else {}
+        return {symbol: prices.get(self.symbol_coin_mapping.get(symbol, symbol.lower()), 0) for symbol in symbols}
+    
+    def value_holdings(self, holdings: Dict[str, Dict], prices: Optional[Dict[str, float]] = None) -> Dict:
+        """Price aggregated holdings, fetching current prices when not given"""
+        if prices is None and holdings:
+            prices = self._fetch_prices(list(holdings.keys()))
+        return self.price_holdings(holdings, prices or {})
+    
+    def price_holdings(self, holdings: Dict[str, Dict], prices: Dict[str, float]) -> Dict:
+        """Value aggregated holdings at the given {coin_id: usd} prices"""
+        portfolio_summary = {
+            "total_cost": 0,
+            "total_value": 0,
+            "gain": 0,
+            "gain_percent": 0,
+            "coins": {}
+        }
+        
+        for symbol, details in holdings.items():
+            if details["coins"] > 0:
+                coin_id = self.symbol_coin_mapping.get(symbol, symbol.lower())
+                current_price = prices.get(coin_id, 0)
+                current_value = details["coins"] * current_price
+                
+                portfolio_summary["total_cost"] += details["total_value"]
+                portfolio_summary["total_value"] += current_value
+                
+                coin_gain = current_value - details["total_value"]
+                coin_gain_percent = (coin_gain / details["total_value"] * 100) if details["total_value"] > 0 else 0
+                
+                portfolio_summary["coins"][symbol] = {
+                    "coins": details["coins"],
+                    "cost": details["total_value"],
+                    "value": current_value,
+                    "gain": coin_gain,
+                    "gain_percent": coin_gain_percent,
+                    "price": current_price
+                }
+        
+        portfolio_summary["gain"] = portfolio_summary["total_value"] - portfolio_summary["total_cost"]
+        portfolio_summary["gain_percent"] = (
+            (portfolio_summary["gain"] / portfolio_summary["total_cost"] * 100)
+            if portfolio_summary["total_cost"] > 0 else 0
+        )
+        
+        return portfolio_summary
+    
     def _fetch_prices(self, symbols: List[str]) -> Dict[str, float]:
         """Fetch current prices for multiple cryptocurrencies with caching"""
         cache_key = None
@@ -236,17 +422,27 @@ class TransactionService:
             if cache_key in self._price_cache:
                 cache_time = self._price_cache_time.get(cache_key, 0)
                 if current_time - cache_time < self._cache_duration:
-                    logger.info("Using cached prices for: %s", cache_key)
+                    logger.debug("Using cached prices for: %s", cache_key)
                     return self._price_cache[cache_key]
             
             # Fetch prices in batch
             ids_param = ','.join(coin_ids)
             url = f"{self.price_url}&ids={ids_param}"
             
-            logger.info("Fetching prices from CoinGecko for: %s", ids_param)
-            response = requests.get(url, timeout=10)
+            logger.debug("Fetching prices from CoinGecko for: %s", ids_param)
+            try:
+                response = self._price_limiter.request(
+                    lambda: requests.get(url, timeout=10),
+                    max_wait=self._price_max_wait
+                )
+            except RateLimitTimeout:
+                # Queue is too long to serve this request; stale prices beat none
+                logger.warning("CoinGecko queue wait exceeded %ss, using cached prices if available", self._price_max_wait)
+                if cache_key in self._price_cache:
+                    return self._price_cache[cache_key]
+                return {}
             
-            # Check for rate limiting
+            # Still rate limited after the limiter's retries
             if response.status_code == 429:
                 logger.error("CoinGecko rate limit exceeded. Using cached prices if available.")
                 # Try to use cached prices even if expired
@@ -272,18 +468,23 @@ class TransactionService:
             if prices and cache_key:
                 self._price_cache[cache_key] = prices
                 self._price_cache_time[cache_key] = current_time
-                logger.info("Cached prices for %d coins", len(prices))
+                logger.debug("Cached prices for %d coins", len(prices))
+            if prices:
+                self._prices_fetched(
+                    {symbol: prices.get(self.symbol_coin_mapping.get(symbol, symbol.lower()), 0) for symbol in symbols},
+                    current_time
+                )
             
             return prices
         except requests.exceptions.RequestException as e:
-            logger.error(f"Network error fetching prices: {e}")
+            logger.error("Network error fetching prices: %s", e)
             # Try to use cached prices even if expired
             if cache_key and cache_key in self._price_cache:
                 logger.warning("Network error - using expired cache")
                 return self._price_cache[cache_key]
             return {}
         except Exception as e:
-            logger.error(f"Error fetching prices: {e}", exc_info=True)
+            logger.error("Error fetching prices: %s", e, exc_info=True)
             # Try to use cached prices even if expired
             if cache_key and cache_key in self._price_cache:
                 logger.warning("Error - using expired cache")
@@ -294,13 +495,11 @@ class TransactionService:
         """Update an existing transaction"""
         try:
             # Get existing transaction
-            result = self.db.table('transactions').select('*').eq('id', transaction_id).execute()
+            transaction_data = self.repository.get(transaction_id)
             
-            if not result.data or len(result.data) == 0:
+            if not transaction_data:
                 return {'error': 'Transaction not found'}, 404
             
-            transaction_data = result.data[0]
-            
             # Optional: Verify user owns the transaction
             if user_id and transaction_data.get('user_id') != user_id:
                 return {'error': 'Unauthorized'}, 403
@@ -341,7 +540,9 @@ class TransactionService:
                     return {'error': f'Insufficient holdings. You have {holdings["coins"]} {symbol}'}, 400
             
             # Update transaction
-            self.db.table('transactions').update(update_data).eq('id', transaction_id).execute()
+            self.repository.update(transaction_id, update_data)
+            self.lot_books.apply(transaction_data.get('user_id'), {**transaction_data, **update_data})
+            self._data_changed(transaction_data.get('user_id'))
             
             return {'message': 'Transaction updated successfully'}, 200
             
@@ -353,50 +554,56 @@ class TransactionService:
         """Soft delete a transaction"""
         try:
             # Get existing transaction
-            result = self.db.table('transactions').select('*').eq('id', transaction_id).execute()
+            transaction_data = self.repository.get(transaction_id)
             
-            if not result.data or len(result.data) == 0:
+            if not transaction_data:
                 return {'error': 'Transaction not found'}, 404
             
-            transaction_data = result.data[0]
-            
             # Optional: Verify user owns the transaction
             if user_id and transaction_data.get('user_id') != user_id:
                 return {'error': 'Unauthorized'}, 403
             
             # Soft delete by updating status
-            self.db.table('transactions').update({'status': 'delete'}).eq('id', transaction_id).execute()
+            self.repository.update(transaction_id, {'status': 'delete'})
+            self.lot_books.remove(transaction_data.get('user_id'), transaction_id)
+            self._data_changed(transaction_data.get('user_id'))
             
             return {'message': 'Transaction deleted successfully'}, 200
         except Exception as e:
             logger.error(f"Error deleting transaction: {e}")
             return {'error': str(e)}, 500
     
+    def add_change_listener(self, listener) -> None:
+        """Call listener(user_id) after each write to that user's transactions"""
+        self._change_listeners.append(listener)
+    
+    def add_price_listener(self, listener) -> None:
+        """Call listener(prices, fetched_at) with the {symbol: usd} prices of each upstream fetch"""
+        self._price_listeners.append(listener)
+    
+    def _prices_fetched(self, prices: Dict[str, float], fetched_at: float) -> None:
+        for listener in self._price_listeners:
+            try:
+                listener(prices, fetched_at)
+            except Exception as e:
+                logger.error(f"Error notifying price listener: {e}")
+    
+    def _data_changed(self, user_id: Optional[str]) -> None:
+        """Invalidate cached results computed from this user's transactions"""
+        if not user_id:
+            return
+        if self.result_cache is not None:
+            self.result_cache.bump(user_id)
+        for listener in self._change_listeners:
+            try:
+                listener(user_id)
+            except Exception as e:
+                logger.error(f"Error notifying transaction change listener: {e}")
+    
     def _get_holdings(self, symbol: str, user_id: str) -> Dict:
         """Get current holdings for a symbol"""
         try:
-            result = self.db.table('transactions')\
-                .select('*')\
-                .in_('status', ['active', 'pending'])\
-                .eq('symbol', symbol)\
-                .eq('user_id', user_id)\
-                .execute()
-            
-            holdings = {"coins": 0, "total_value": 0}
-            
-            for transaction in result.data:
-                transaction_type = transaction.get('type', '').lower()
-                transaction_value = float(transaction.get('value_usd', 0))
-                transaction_coins = float(transaction.get('coins', 0))
-                
-                if transaction_type == "buy":
-                    holdings["coins"] += transaction_coins
-                    holdings["total_value"] += transaction_value
-                elif transaction_type == "sell":
-                    holdings["coins"] -= transaction_coins
-                    holdings["total_value"] -= transaction_value
-            
-            return holdings
+            return self.repository.holdings(user_id, symbol)
         except Exception as e:
             logger.error(f"Error getting holdings: {e}")
             return {"coins": 0, "total_value": 0}
@@ -404,29 +611,45 @@ class TransactionService:
     def _get_holdings_excluding(self, symbol: str, user_id: str, exclude_id: str) -> Dict:
         """Get current holdings for a symbol, excluding a specific transaction"""
         try:
-            result = self.db.table('transactions')\
-                .select('*')\
-                .in_('status', ['active', 'pending'])\
-                .eq('symbol', symbol)\
-                .eq('user_id', user_id)\
-                .neq('id', exclude_id)\
-                .execute()
-            
-            holdings = {"coins": 0, "total_value": 0}
-            
-            for transaction in result.data:
-                transaction_type = transaction.get('type', '').lower()
-                transaction_value = float(transaction.get('value_usd', 0))
-                transaction_coins = float(transaction.get('coins', 0))
-                
-                if transaction_type == "buy":
-                    holdings["coins"] += transaction_coins
-                    holdings["total_value"] += transaction_value
-                elif transaction_type == "sell":
-                    holdings["coins"] -= transaction_coins
-                    holdings["total_value"] -= transaction_value
-            
-            return holdings
+            return self.repository.holdings(user_id, symbol, exclude_id=exclude_id)
         except Exception as e:
             logger.error(f"Error getting holdings excluding: {e}")
             return {"coins": 0, "total_value": 0}
+
+
+def _bulk_error(transaction: Dict, error: str) -> Dict:
+    """Error entry for a transaction rejected by a bulk insert"""
+    return {
+        "transaction": transaction.get('external_id') or transaction.get('symbol', 'unknown'),
+        "source": transaction.get('source'),
+        "error": error
+    }
+
+
+def _normalize_row(transaction: Dict) -> Dict:
+    """Convert a datetime date to an ISO string"""
+    if transaction.get('date') and not isinstance(transaction['date'], str):
+        transaction['date'] = transaction['date'].isoformat()
+    return transaction
+
+
+def _encode_cursor(transaction: Dict) -> str:
+    """Opaque keyset cursor for the (date, id) of the last row of a page"""
+    payload = json.dumps([transaction['date'], str(transaction['id'])]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def _decode_cursor(cursor: str) -> Optional[tuple]:
+    """Decode a cursor into (date, id), or None if it is malformed"""
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        date, transaction_id = json.loads(payload)
+        datetime.fromisoformat(str(date).replace('Z', '+00:00'))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(date, str):
+        return None
+    # Quoted in the filter, so reject anything that could break out of it
+    if '"' in date or not all(c.isalnum() or c == '-' for c in str(transaction_id)):
+        return None
+    return date, transaction_id
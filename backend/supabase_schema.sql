@@ -72,3 +72,53 @@ CREATE TRIGGER update_transactions_updated_at
     FOR EACH ROW
     EXECUTE FUNCTION update_updated_at_column();
 
+
+-- Broker sync state: per-(user, broker, account) cursor and watermark for incremental imports
+CREATE TABLE IF NOT EXISTS broker_sync_state (
+    user_id VARCHAR(255) NOT NULL,
+    broker VARCHAR(50) NOT NULL,
+    account VARCHAR(64) NOT NULL DEFAULT '',  -- hash of the API key, one row per connected account
+    cursor TEXT,                         -- next page of an interrupted sync (NULL when idle)
+    last_trade_time TIMESTAMPTZ,         -- newest trade_time fully imported (watermark)
+    pending_trade_time TIMESTAMPTZ,      -- newest trade_time seen by the interrupted sync
+    last_synced_at TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (user_id, broker, account)
+);
+
+ALTER TABLE broker_sync_state ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can manage their own sync state"
+    ON broker_sync_state FOR ALL
+    USING (auth.uid()::text = user_id OR user_id = 'default');
+
+
+-- Net holdings per symbol for a user, summed in the database so callers get one
+-- row per symbol instead of every transaction. Buys add, sells subtract; only
+-- active/pending rows count. p_symbol narrows to one coin and p_exclude_id leaves
+-- out one transaction (used to validate edits of an existing sell).
+-- Runs as the caller (SECURITY INVOKER), so the transactions RLS policies apply.
+CREATE OR REPLACE FUNCTION get_user_holdings(
+    p_user_id TEXT,
+    p_symbol TEXT DEFAULT NULL,
+    p_exclude_id UUID DEFAULT NULL
+)
+RETURNS TABLE (symbol VARCHAR, coins NUMERIC, total_value NUMERIC)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT
+        t.symbol,
+        COALESCE(SUM(CASE WHEN lower(t.type) = 'buy' THEN t.coins
+                          WHEN lower(t.type) = 'sell' THEN -t.coins ELSE 0 END), 0) AS coins,
+        COALESCE(SUM(CASE WHEN lower(t.type) = 'buy' THEN t.value_usd
+                          WHEN lower(t.type) = 'sell' THEN -t.value_usd ELSE 0 END), 0) AS total_value
+    FROM transactions t
+    WHERE t.status IN ('active', 'pending')
+      AND (p_user_id IS NULL OR t.user_id = p_user_id)
+      AND (p_symbol IS NULL OR t.symbol = p_symbol)
+      AND (p_exclude_id IS NULL OR t.id <> p_exclude_id)
+    GROUP BY t.symbol;
+$$;
+
+GRANT EXECUTE ON FUNCTION get_user_holdings(TEXT, TEXT, UUID) TO authenticated, service_role;
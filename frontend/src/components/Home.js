@@ -290,6 +290,23 @@ export default function Home() {
     };
   }, [location.pathname]);
 
+  // Live value/gain updates pushed by the server as prices tick
+  useEffect(() => {
+    if (location.pathname !== '/') {
+      return undefined;
+    }
+    const closeStream = api.streamPortfolio(null, (update) => {
+      setPortfolioSummary((current) => ({
+        ...(current || {}),
+        total_cost: update.total_cost,
+        total_equity: update.total_value,
+        absolute_gain: update.gain,
+        gain_percent: update.gain_percent,
+      }));
+    });
+    return closeStream;
+  }, [location.pathname]);
+
   const handleTransactionAdded = () => {
     fetchData();
     onClose();
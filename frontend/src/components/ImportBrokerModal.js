@@ -33,6 +33,7 @@ export default function ImportBrokerModal({ isOpen, onClose, onSuccess }) {
     api_secret: '',
   });
   const [loading, setLoading] = useState(false);
+  const [progress, setProgress] = useState(null);
   const toast = useToast();
   const bg = useColorModeValue('white', 'gray.800');
 
@@ -62,7 +63,7 @@ export default function ImportBrokerModal({ isOpen, onClose, onSuccess }) {
 
       // Don't pass useMockData - backend will auto-use mock if auth succeeds but no transactions found
       // userId will be automatically retrieved from localStorage by the API service
-      const result = await api.importBrokerTransactions(
+      const job = await api.importBrokerTransactions(
         broker,
         brokerCredentials,
         null,  // null = use logged-in user's ID from localStorage
@@ -71,6 +72,9 @@ export default function ImportBrokerModal({ isOpen, onClose, onSuccess }) {
         false  // Backend handles mock data automatically
       );
 
+      // Import runs as a background job; poll until it finishes
+      const result = await api.waitForImportJob(job.id, (update) => setProgress(update.progress));
+
       if (result.total === 0) {
         // This shouldn't happen now - backend auto-adds mock data on successful auth
         toast({
@@ -106,6 +110,7 @@ export default function ImportBrokerModal({ isOpen, onClose, onSuccess }) {
       });
     } finally {
       setLoading(false);
+      setProgress(null);
     }
   };
 
@@ -242,6 +247,7 @@ export default function ImportBrokerModal({ isOpen, onClose, onSuccess }) {
             colorScheme="brand"
             onClick={handleImport}
             isLoading={loading}
+            loadingText={progress && progress.fetched ? `Imported ${progress.imported || 0} of ${progress.fetched}` : 'Importing'}
             isDisabled={!broker}
             size="md"
             px={8}
@@ -69,14 +69,15 @@ export default function PerformanceAnalytics() {
   const fetchAnalytics = async () => {
     try {
       setLoading(true);
-      const [perfData, historyData, performersData] = await Promise.all([
-        api.getPerformance(null, selectedPeriod),
-        api.getPortfolioHistory(null, selectedPeriod === 'all' ? 365 : parseInt(selectedPeriod) || 30),
-        api.getPerformers(null, 5),
-      ]);
-      setPerformance(perfData);
-      setHistory(historyData);
-      setPerformers(performersData);
+      const dashboard = await api.getDashboard(null, {
+        period: selectedPeriod,
+        days: selectedPeriod === 'all' ? 365 : parseInt(selectedPeriod) || 30,
+        limit: 5,
+        fields: ['performance', 'history', 'performers'],
+      });
+      setPerformance(dashboard.performance);
+      setHistory(dashboard.history);
+      setPerformers(dashboard.performers);
       setLoading(false);
     } catch (error) {
       toast({
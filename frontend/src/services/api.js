@@ -52,6 +52,21 @@ class ApiService {
     return this.request(`/transactions?userId=${uid}&limit=${limit}`);
   }
 
+  // One page of transactions plus the cursor for the next page (null on the last page)
+  async getTransactionsPage(userId = null, { limit = 50, cursor = null, fields = null } = {}) {
+    const uid = userId || getUserId();
+    let endpoint = `/transactions?userId=${uid}&limit=${limit}`;
+    if (cursor) endpoint += `&cursor=${encodeURIComponent(cursor)}`;
+    if (fields) endpoint += `&fields=${fields.join(',')}`;
+
+    const response = await fetch(`${API_BASE_URL}${endpoint}`);
+    const data = await response.json();
+    if (!response.ok) {
+      throw new Error(data.error || `HTTP error! status: ${response.status}`);
+    }
+    return { transactions: data, nextCursor: response.headers.get('X-Next-Cursor') };
+  }
+
   async addTransaction(transaction) {
     // Ensure userId is included in transaction data
     if (!transaction.userId) {
@@ -84,6 +99,16 @@ class ApiService {
     return this.request(`/portfolio?userId=${uid}`);
   }
 
+  // Live portfolio totals over Server-Sent Events; returns a function that closes the stream
+  streamPortfolio(userId = null, onUpdate) {
+    const uid = userId || getUserId();
+    const source = new EventSource(`${API_BASE_URL}/portfolio/stream?userId=${uid}`);
+    const handleEvent = (event) => onUpdate(JSON.parse(event.data));
+    source.addEventListener('snapshot', handleEvent);
+    source.addEventListener('update', handleEvent);
+    return () => source.close();
+  }
+
   // Broker import endpoints
   async importBrokerTransactions(broker, credentials, userId = null, startDate = null, endDate = null, useMockData = false) {
     const uid = userId || getUserId();
@@ -100,6 +125,41 @@ class ApiService {
     });
   }
 
+  async getImportJob(jobId, userId = null) {
+    const uid = userId || getUserId();
+    return this.request(`/broker/jobs/${jobId}?userId=${uid}`);
+  }
+
+  async cancelImportJob(jobId, userId = null) {
+    const uid = userId || getUserId();
+    return this.request(`/broker/jobs/${jobId}/cancel?userId=${uid}`, {
+      method: 'POST',
+    });
+  }
+
+  /**
+   * Poll an import job until it finishes
+   * Calls onProgress with the job on every poll; resolves with the job's result
+   */
+  async waitForImportJob(jobId, onProgress = null, intervalMs = 1000) {
+    for (;;) {
+      const job = await this.getImportJob(jobId);
+      if (onProgress) {
+        onProgress(job);
+      }
+      if (job.status === 'succeeded') {
+        return job.result;
+      }
+      if (job.status === 'failed') {
+        throw new Error(job.error || 'Import failed');
+      }
+      if (job.status === 'cancelled') {
+        throw new Error('Import cancelled');
+      }
+      await new Promise((resolve) => setTimeout(resolve, intervalMs));
+    }
+  }
+
   // Prediction endpoint
   async getPrediction() {
     return this.request('/prediction');
@@ -120,6 +180,15 @@ class ApiService {
     const uid = userId || getUserId();
     return this.request(`/analytics/history?userId=${uid}&days=${days}`);
   }
+
+  // Performance, history and performers from one snapshot; fields limits what is computed
+  async getDashboard(userId = null, { period = 'all', days = 30, limit = 5, fields = null } = {}) {
+    const uid = userId || getUserId();
+    const fieldsParam = fields ? `&fields=${fields.join(',')}` : '';
+    return this.request(
+      `/analytics/dashboard?userId=${uid}&period=${period}&days=${days}&limit=${limit}${fieldsParam}`
+    );
+  }
 }
 
 const apiService = new ApiService();